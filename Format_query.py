@@ -1,28 +1,118 @@
+from functools import lru_cache
+from sql_lexer import scan
+
+"""
+Formats generated SQL for display in one pass over the shared token stream.
+Clauses start on their own line, subqueries are indented, string literals, quoted identifiers and comments
+are kept as written, and only keywords are uppercased, so column and table names keep their case.
+"""
+
+INDENT = "    "
+
+# Words starting a clause on a new line
+CLAUSES = {
+    "select", "from", "where", "group", "order", "having", "limit", "offset", "union", "intersect", "except",
+    "with", "values", "set", "returning", "window", "insert", "update", "delete", "fetch",
+}
+
+# Words starting a join on a new line (a following JOIN stays on the same line)
+JOINS = {"join", "left", "right", "inner", "full", "cross", "natural", "straight_join"}
+
+# Reserved words written in uppercase
+KEYWORDS = CLAUSES | JOINS | {
+    "by", "all", "distinct", "as", "on", "using", "outer", "and", "or", "not", "in", "is", "null", "like", "ilike",
+    "between", "exists", "case", "when", "then", "else", "end", "into", "asc", "desc", "true", "false", "for",
+}
+
+# Clauses whose top-level AND/OR conditions go on separate lines
+CONDITIONS = {"where", "having", "on"}
+
+
+@lru_cache(maxsize=256)
 def format_query(query: str) -> str:
     """
     Formats the SQL query into multiple lines for better readability while preserving the case of column and table names.
     """
-    segments = []
-    if "SELECT" in query.upper():
-        segments.append("SELECT")
-        select_clause = query.split("SELECT")[1].split("FROM")[0].strip()
-        segments.append(select_clause)
-    if "FROM" in query.upper():
-        segments.append("FROM")
-        from_clause = query.split("FROM")[1].split("WHERE")[0].strip()
-        segments.append(from_clause)
-    if "WHERE" in query.upper():
-        segments.append("WHERE")
-        where_clause = query.split("WHERE")[1].strip()
-        segments.append(where_clause)
-    if "GROUP BY" in query.upper():
-        segments.append("GROUP BY")
-        group_by_clause = query.split("GROUP BY")[1].strip()
-        segments.append(group_by_clause)
-    if "ORDER BY" in query.upper():
-        segments.append("ORDER BY")
-        order_by_clause = query.split("ORDER BY")[1].strip()
-        segments.append(order_by_clause)
-
-    formatted_query = "\n".join(segments)
-    return formatted_query
\ No newline at end of file
+    tokens = scan(query.strip())
+    output = []
+    # One entry per open parenthesis: whether it holds a subquery
+    parens = []
+    # Current clause per subquery level
+    clauses = [None]
+    depth = 0
+    space = False
+    between = False
+    line_start = True
+
+    def newline(extra=""):
+        nonlocal line_start
+        if line_start and output:
+            # Two breaks in a row (e.g. after a line comment) make one
+            output[-1] = "\n" + INDENT * depth + extra
+        elif output:
+            output.append("\n" + INDENT * depth + extra)
+        line_start = True
+
+    def next_word(index):
+        for kind, text in tokens[index + 1:]:
+            if kind not in ("space", "comment"):
+                return text.lower()
+        return ""
+
+    previous = ""
+    for index, (kind, text) in enumerate(tokens):
+        if kind == "space":
+            space = True
+            continue
+        lower = text.lower() if kind == "word" else text
+        # Breaking lines only at the level of a statement, not inside function calls or IN lists
+        top_level = not parens or parens[-1]
+        if kind == "word" and top_level:
+            following = next_word(index)
+            starts_clause = lower in CLAUSES and not (
+                (lower in ("group", "order") and following != "by")
+                or (lower == "update" and previous in ("key", "for"))
+                or (lower == "from" and previous in ("delete", "distinct"))
+                or (lower == "set" and previous == "character")
+                or (lower == "with" and following in ("rollup", "time", "local"))
+            )
+            starts_join = lower in JOINS and following != "(" and previous not in JOINS | {"outer"}
+            if starts_clause or starts_join:
+                newline()
+                if starts_clause:
+                    clauses[-1] = lower
+                    between = False
+            elif lower == "on":
+                clauses[-1] = "on"
+            elif lower == "between":
+                between = True
+            elif lower in ("and", "or") and clauses[-1] in CONDITIONS:
+                if lower == "and" and between:
+                    between = False
+                else:
+                    newline(INDENT)
+        if text == ")" and kind == "other" and parens:
+            if parens.pop():
+                depth -= 1
+                clauses.pop()
+                newline()
+        if not line_start and space and not (kind == "other" and text in ",)") and previous != "(":
+            output.append(" ")
+        elif not line_start and previous == "," and not space and top_level:
+            output.append(" ")
+        output.append(text.upper() if kind == "word" and lower in KEYWORDS else text)
+        line_start = False
+        if kind == "comment" and not text.startswith("/*"):
+            # A line comment ends the line
+            newline()
+        if text == "(" and kind == "other":
+            subquery = next_word(index) in ("select", "with")
+            parens.append(subquery)
+            if subquery:
+                depth += 1
+                clauses.append(None)
+        elif text == "," and kind == "other" and top_level and clauses[-1] == "select":
+            newline(INDENT)
+        space = False
+        previous = lower
+    return "".join(output).rstrip()
@@ -1,16 +1,50 @@
 
+import time
+# Taken before the imports, so the first run of the process can report how long the app took to come up
+started_at = time.perf_counter()
 import streamlit as st
 from db_connector import init_database
-from chat_history import init_chat_history, add_message, display_chat_history
-from query_generate import get_response
+from chat_history import init_chat_history, add_message, display_chat_history, new_chat, message_table
 from Format_query import format_query   
-import time
+from schema_cache import get_schema_cache
+from query_cache import get_query_cache
+from result_cache import get_result_cache
+from example_store import get_example_store
+from query_guard import QueryBlocked
+from telemetry import get_metrics, start_metrics_server, startup_began, record_startup
+from config import PAGE_SIZE, EXPORT_DOWNLOAD_MAX_MB, PRELOAD_PIPELINE, PINNED_REFRESH_INTERVAL
+import os
+import importlib
+from stage_runner import submit
 from nl_format import format_nl_response
+from pinned_questions import (
+    PinError, INTERVAL_CHOICES, get_pin_store, database_pins, pin_answer, pinned_answer, snapshot_events, staleness,
+    refresh_pin, start_pin_scheduler,
+)
+# The query pipeline, export, paging and MongoDB modules (LangChain, SQLAlchemy, pandas, pyarrow, pymongo) are imported where
+# they are first used, so the page renders before they are loaded
+startup_began(started_at, imports_seconds=time.perf_counter() - started_at)
+
+# Pipeline modules per backend, loaded in the background once a database is connected
+PIPELINE_MODULES = {
+    "sql": ("query_generate", "sql_executor"),
+    "mongodb": ("query_generate", "mongo_query"),
+}
+
+def preload_modules(modules):
+    for module in modules:
+        importlib.import_module(module)
 
 # Set page configuration
 st.set_page_config(page_title="QueryBuddy", page_icon=":speech_balloon:")
 init_chat_history()
 
+# Prometheus endpoint for the stage metrics, started once per process when QUERYBUDDY_METRICS_PORT is set
+start_metrics_server()
+
+# Background refresh of the pinned questions, started once per process
+start_pin_scheduler()
+
 # Custom CSS to hide the sidebar navigation
 
 st.markdown(
@@ -105,7 +139,7 @@ with st.sidebar:
     # Connecting button
     if st.button("Connect"):
         with st.spinner("Connecting to Database..."):
-            db = init_database(
+            connection_spec = (
                 st.session_state["User"],
                 st.session_state['Password'],
                 st.session_state['Host'],
@@ -113,25 +147,154 @@ with st.sidebar:
                 st.session_state['Database'],
                 db_type
             )
+            db = init_database(*connection_spec)
             if db is not None:
                 st.session_state.db = db
                 st.session_state.db_type = db_type  # Storing the database type
+                st.session_state.connection_spec = connection_spec
                 st.success("Connected to database!")
             else:
                 st.error("Failed to connect to the database. Please check your credentials.")
+    elif "connection_spec" in st.session_state:
+        # Re-resolving the shared connection on every rerun, so idle-evicted or unhealthy pools are replaced
+        db = init_database(*st.session_state.connection_spec)
+        if db is not None:
+            st.session_state.db = db
+
+    # Schema cache counters for SQL connections
+    if "db" in st.session_state and st.session_state.db_type.lower() in ['mysql', 'postgresql']:
+        cache_stats = get_schema_cache(st.session_state.db).stats()
+        st.caption(f"Schema cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses")
+
+    # MongoDB schemas are inferred from samples and cached, allow refreshing them on demand
+    if "db" in st.session_state and st.session_state.db_type.lower() == 'mongodb':
+        if st.button("Refresh schema"):
+            with st.spinner("Sampling collections..."):
+                from mongo_schema import refresh_mongo_schema
+                refresh_mongo_schema(st.session_state.db)
+            st.success("Schema refreshed!")
+
+    # Generated-query cache hit rate
+    query_cache = get_query_cache()
+    if query_cache is not None:
+        cache_stats = query_cache.stats()
+        st.caption(
+            f"Query cache: {cache_stats['hit_rate']:.0%} hit rate "
+            f"({cache_stats['hits']} hits / {cache_stats['misses']} misses, {cache_stats['entries']} stored)"
+        )
+
+    # Shared result cache hit rate
+    result_cache = get_result_cache()
+    if result_cache is not None:
+        cache_stats = result_cache.stats()
+        st.caption(
+            f"Result cache: {cache_stats['hit_rate']:.0%} hit rate "
+            f"({cache_stats['entries']} results, {cache_stats['bytes'] / 1024 / 1024:.1f} MB)"
+        )
+
+    # Starting over in a new session; the current one stays in the chat store
+    st.button("New conversation", on_click=new_chat)
+
+    # Past successful questions used as few-shot examples
+    example_store = get_example_store()
+    if example_store is not None:
+        st.caption(f"Few-shot examples: {example_store.stats()['examples']} stored")
 
 # Applying theme changes
 if ms.themes["refreshed"] == False:
     ms.themes["refreshed"] = True
     st.rerun()
 
+def export_controls(index, message):
+    """Export of the full result of an answer's query, streamed to a file and offered as a download."""
+    metadata = message.additional_kwargs
+    if metadata.get("error") or "db" not in st.session_state or metadata.get("db_type") != st.session_state.db_type:
+        return
+    from export import FORMATS, ExportError, export_query
+    exports = st.session_state.setdefault("exports", {})
+    with st.popover("Export"):
+        fmt = st.radio("Format", FORMATS, horizontal=True, key=f"export_format_{index}")
+        if st.button("Export all rows", key=f"export_{index}"):
+            with st.spinner("Exporting..."):
+                try:
+                    exports[index] = export_query(metadata["db_type"], st.session_state.db, metadata["query"], fmt)
+                except (ExportError, QueryBlocked) as e:
+                    st.error(str(e))
+                except Exception as e:
+                    st.error(f"Export failed: {e}")
+        if index in exports and os.path.exists(exports[index][0]):
+            path, rows = exports[index]
+            st.caption(f"{rows:,} rows written to {path}")
+            # The browser download goes through the Streamlit server in one piece, so very large files stay on disk
+            if os.path.getsize(path) <= EXPORT_DOWNLOAD_MAX_MB * 1024 * 1024:
+                with open(path, "rb") as file:
+                    st.download_button("Download", file, file_name=os.path.basename(path), key=f"download_{index}")
+
+def pin_controls(index, message):
+    """Pinning an answered question: its query is re-run in the background and later askers get the latest snapshot."""
+    metadata = message.additional_kwargs
+    if get_pin_store() is None or metadata.get("error") or not metadata.get("question") \
+            or "db" not in st.session_state or metadata.get("db_type") != st.session_state.db_type:
+        return
+    with st.popover("📌 Pin"):
+        minutes = st.selectbox(
+            "Refresh every", INTERVAL_CHOICES, index=INTERVAL_CHOICES.index(PINNED_REFRESH_INTERVAL / 60),
+            format_func=lambda m: f"{m:g} min" if m < 60 else f"{m / 60:g} h", key=f"pin_interval_{index}",
+        )
+        if st.button("Pin question", key=f"pin_{index}"):
+            try:
+                pin_answer(
+                    metadata["db_type"], st.session_state.db, metadata["question"], metadata["query"],
+                    metadata["summary"], message_table(message) or "", metadata.get("rows"), minutes * 60,
+                )
+                st.success("Pinned: refreshed in the background when its tables change.")
+            except PinError as e:
+                st.error(str(e))
+
+def answer_actions(index, message):
+    """Controls under an answer: export of the full result and pinning the question."""
+    export_column, pin_column, _ = st.columns([1, 1, 4])
+    with export_column:
+        export_controls(index, message)
+    with pin_column:
+        pin_controls(index, message)
+
+def pinned_panel():
+    """The pinned questions of the connected database with their latest snapshot and its age."""
+    if "db" not in st.session_state:
+        return
+    pins = database_pins(st.session_state.db)
+    if not pins:
+        return
+    with st.expander(f"📌 Pinned questions ({len(pins)})"):
+        for pin in pins:
+            st.markdown(f"**{pin['question']}**")
+            rows = f"{pin['rows']:,} rows. " if pin["rows"] is not None else ""
+            st.caption(rows + staleness(pin))
+            st.markdown(pin["summary"])
+            if st.checkbox("Show result table", key=f"pin_table_{pin['id']}"):
+                st.markdown(pin["markdown"])
+            refresh_column, unpin_column, _ = st.columns([1, 1, 4])
+            if refresh_column.button("Refresh now", key=f"pin_refresh_{pin['id']}"):
+                with st.spinner("Refreshing..."):
+                    try:
+                        refresh_pin(pin, st.session_state.db, force=True)
+                    except Exception:
+                        # Kept on the pin and shown with its age
+                        pass
+                st.rerun()
+            unpin_column.button("Unpin", key=f"unpin_{pin['id']}", on_click=get_pin_store().unpin, args=(pin["id"],))
+
+pinned_panel()
+
 # Display chat history
-display_chat_history()
+display_chat_history(answer_actions)
 
 # Chat input for user query
 user_query = st.chat_input("Type a message...")
 
 if user_query:
+    from query_generate import stream_response
     # Adding user query to chat history
     add_message("Human", user_query)
     with st.chat_message("Human"):
@@ -139,49 +302,134 @@ if user_query:
 
     with st.chat_message("AI"):
         if "db" in st.session_state:
+            is_sql_db = st.session_state.db_type.lower() in ['mysql', 'postgresql']
+            query, tabular_response, error, rows = "", "", None, None
+            query_placeholder = st.empty()
+            response_placeholder = st.empty()
+            table_placeholder = st.empty()
+            timing_placeholder = st.empty()
+
+            full_response = ""
+            started = time.perf_counter()
+            first_token_at = None
+            last_render = 0.0
             with st.spinner("Generating response..."):
-                # Passing the chat history to get_response
-                query,nl_response,tabular_response = get_response(
+                # Pinned questions are answered from their latest snapshot, refreshed in the background
+                pinned = pinned_answer(st.session_state.db, user_query, st.session_state.chat_history)
+                events = snapshot_events(pinned) if pinned is not None else stream_response(
                     st.session_state.db_type,
                     user_query,
                     st.session_state.db,
                     st.session_state.chat_history  # Pass chat history for context
                 )
+                # Rendering each piece as soon as the pipeline yields it
+                for event, value in events:
+                    if event == "query":
+                        query = value
+                        with query_placeholder.container():
+                            st.markdown("**Generated Query:**")
+                            if is_sql_db:
+                                st.code(format_query(query), language='sql')
+                            else:
+                                st.code(query, language='javascript')
+                    elif event == "pinned":
+                        rows = value["rows"]
+                        st.session_state.result_browser = None
+                    elif event == "result":
+                        rows = value.total_rows if value.total_rows is not None else len(value.rows)
+                        # Remembering truncated SQL results so further rows can be paged in later;
+                        # not when the cost guard limited the query, paging it would be rejected
+                        st.session_state.result_browser = (
+                            {"query": query, "total_rows": value.total_rows}
+                            if is_sql_db and value.truncated and not value.notice else None
+                        )
+                    elif event == "table":
+                        tabular_response = value
+                        table_placeholder.markdown(tabular_response)
+                    elif event == "token":
+                        if first_token_at is None:
+                            first_token_at = time.perf_counter()
+                        full_response += value
+                        # Re-rendering at most every 50 ms instead of once per chunk
+                        if time.perf_counter() - last_render >= 0.05:
+                            response_placeholder.markdown("**Response:**\n\n" + full_response + "▌")
+                            last_render = time.perf_counter()
+                    elif event == "error":
+                        error = value
+                    elif event == "trace":
+                        st.session_state.last_trace = value
 
-            if db_type in ['mysql','postgresql']:
-                formatted_query = format_query(query)
-                st.markdown("**Generated Query:**")
-                st.code(formatted_query, language='sql')
-                st.markdown("**Response:**")
-                formatted_nl = format_nl_response(nl_response)
-                response_placeholder = st.empty()
-                full_response = ""
-                for char in nl_response:
-                    full_response += char
-                    response_placeholder.markdown(full_response+ "▌")
-                    time.sleep(0.01)
-                response_placeholder.markdown(full_response)
-                time.sleep(0.01)
-                #st.write(nl_response)
-                st.write(tabular_response)
-            else:
-                st.markdown("**Generated Query:**")
-                st.code(query, language='javascript')
-                st.markdown("**Response:**")
-                formatted_nl = format_nl_response(nl_response)
-                response_placeholder = st.empty()
-                full_response = ""
-                for char in nl_response:
-                    full_response += char
-                    response_placeholder.markdown(full_response+ "▌")
-                    time.sleep(0.01)
-                response_placeholder.markdown(full_response)
-                time.sleep(0.01)
-                #st.write(nl_response)
-                st.write(tabular_response)
+            if error is not None:
+                full_response = error
+            response_placeholder.markdown("**Response:**\n\n" + full_response)
+            if pinned is not None:
+                timing_placeholder.caption("📌 Pinned question. " + staleness(pinned))
+            elif first_token_at is not None:
+                timing_placeholder.caption(
+                    f"First token after {first_token_at - started:.2f}s, done in {time.perf_counter() - started:.2f}s"
+                )
+
+            # Add AI response to chat history as a structured record; the text is what later prompts see
+            formatted_nl = format_nl_response(full_response)
+            add_message(
+                "AI", f"Query:\n```sql\n{query}\n```\n\nResponse:\n{formatted_nl}",
+                table=tabular_response, question=user_query, query=query, summary=formatted_nl,
+                db_type=st.session_state.db_type, error=error is not None, rows=rows,
+            )
+            if query and error is None:
+                answer_actions(len(st.session_state.chat_history) - 1, st.session_state.chat_history[-1])
 
         else:
             st.error("Please connect to a database first.")
 
-    # Add AI response to chat history
-    add_message("AI", f"Query:\n```sql\n{query}\n```\n\nResponse:\n{formatted_nl} \n \n{tabular_response}")
+# Paging through the rest of the latest SQL result, fetched only when asked for
+browser = st.session_state.get("result_browser")
+if browser is not None and "db" in st.session_state:
+    total_rows = browser["total_rows"]
+    label = f"Browse all {total_rows:,} rows" if total_rows is not None else "Browse all rows"
+    if st.checkbox(label, key=f"browse_{hash(browser['query'])}"):
+        last_page = max(1, -(-total_rows // PAGE_SIZE)) if total_rows is not None else None
+        page = st.number_input(
+            "Page", min_value=1, max_value=last_page, value=1, step=1,
+            key=f"page_{hash(browser['query'])}",
+        )
+        from sql_executor import fetch_page
+        try:
+            page_result = fetch_page(st.session_state.db, browser["query"], (page - 1) * PAGE_SIZE, PAGE_SIZE)
+            st.dataframe(page_result.records())
+        except QueryBlocked as e:
+            st.error(str(e))
+        except Exception as e:
+            st.error(f"Database Error: {e}")
+
+# Optional stage timings of the last question and of the whole process
+metrics = get_metrics()
+if metrics is not None:
+    with st.sidebar:
+        if st.checkbox("Show stage timings"):
+            trace = st.session_state.get("last_trace")
+            if trace is not None:
+                st.caption("Last question")
+                st.table([
+                    {"stage": span.name, "ms": round(span.duration * 1000, 1),
+                     **{key: value for key, value in span.attributes.items()}}
+                    for span in trace.spans
+                ])
+            summary = metrics.summary()
+            if summary:
+                st.caption("All sessions")
+                st.table([
+                    {"stage": stage, "count": stats["count"], "errors": stats["errors"],
+                     "p50 ms": round(stats["p50"] * 1000, 1), "p95 ms": round(stats["p95"] * 1000, 1)}
+                    for stage, stats in summary.items()
+                ])
+
+# Time to the first rendered page of this process, recorded once
+record_startup()
+
+# Once connected, the pipeline modules of that backend are loaded in the background (once per session and backend),
+# so the first question does not wait for them and MongoDB sessions never load SQLAlchemy
+if PRELOAD_PIPELINE and "db" in st.session_state and st.session_state.get("preloaded") != st.session_state.db_type:
+    st.session_state.preloaded = st.session_state.db_type
+    backend = "sql" if st.session_state.db_type.lower() in ['mysql', 'postgresql'] else "mongodb"
+    submit(preload_modules, PIPELINE_MODULES[backend])
@@ -0,0 +1,159 @@
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from bson import json_util
+from config import BATCH_WORKERS, BATCH_QUESTION_TIMEOUT, MAX_DISPLAY_ROWS, LLM_REQUESTS_PER_SECOND
+from connection_registry import get_registry
+from db_connector import database_uri
+from llm_provider import set_rate_limit
+from query_generate import stream_response
+
+"""
+Headless entry point: runs a file of questions against one database with a bounded worker pool
+and writes one JSON line per question (query, rows, answer, error and stage timings).
+
+    python batch.py questions.txt --db-type postgresql --uri postgresql+psycopg2://... --output results.jsonl
+
+Questions are read one per line, or from JSONL objects with a "question" and an optional "id".
+Batch runs neither use the app's query cache nor read or record examples unless asked to (--query-cache, --examples):
+cached queries are keyed by question and schema only, so they would hide changes to the prompt or the model.
+"""
+
+
+def load_questions(path):
+    """[(id, question)] from a text file (one question per line, # comments) or a JSONL file."""
+    questions = []
+    with open(path, encoding="utf-8") as file:
+        for number, line in enumerate(file, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if path.endswith(".jsonl"):
+                record = json.loads(line)
+                questions.append((record.get("id", number), record["question"]))
+            else:
+                questions.append((number, line))
+    return questions
+
+
+def answer_question(db_type, db, question, timeout=BATCH_QUESTION_TIMEOUT, max_rows=MAX_DISPLAY_ROWS,
+                    use_query_cache=False, use_examples=False):
+    """
+    Run one question through the pipeline and return its record.
+    The time limit is checked between pipeline events; each stage is bounded by its own timeout as well.
+    """
+    started = time.perf_counter()
+    record = {"question": question, "query": None, "columns": [], "rows": [], "total_rows": None,
+              "answer": "", "error": None, "timings": {}}
+    tokens = []
+    events = stream_response(db_type, question, db, [], use_query_cache=use_query_cache, use_examples=use_examples)
+    try:
+        for event, value in events:
+            if event == "query":
+                record["query"] = value
+            elif event == "result":
+                record["columns"] = value.columns
+                record["rows"] = [list(row) for row in value.rows[:max_rows]]
+                record["total_rows"] = value.total_rows
+            elif event == "token":
+                tokens.append(value)
+            elif event == "error":
+                record["error"] = value
+            elif event == "trace":
+                record["timings"] = value.durations()
+            if time.perf_counter() - started > timeout:
+                record["error"] = f"Timed out after {timeout:g}s"
+                break
+    finally:
+        events.close()
+    record["answer"] = "".join(tokens)
+    record["seconds"] = time.perf_counter() - started
+    return record
+
+
+def run_batch(questions, db_type, db, workers=BATCH_WORKERS, timeout=BATCH_QUESTION_TIMEOUT, max_rows=MAX_DISPLAY_ROWS,
+              use_query_cache=False, use_examples=False):
+    """Answer [(id, question)] with at most workers questions in flight, yields records as they finish."""
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="querybuddy-batch") as executor:
+        futures = {
+            executor.submit(
+                answer_question, db_type, db, question, timeout, max_rows, use_query_cache, use_examples,
+            ): (index, question_id)
+            for index, (question_id, question) in enumerate(questions)
+        }
+        for future in as_completed(futures):
+            index, question_id = futures[future]
+            try:
+                record = future.result()
+            except Exception as e:
+                record = {"question": questions[index][1], "error": f"{type(e).__name__}: {e}"}
+            yield {"index": index, "id": question_id, **record}
+
+
+def _json_default(value):
+    try:
+        return json_util.default(value)
+    except TypeError:
+        return str(value)
+
+
+def connect(args):
+    """The database handle for the connection arguments."""
+    db_type = args.db_type.lower()
+    uri = args.uri or database_uri(args.user, args.password, args.host, args.port, args.database, db_type)
+    if uri is None:
+        raise SystemExit(f"Unsupported database type: {args.db_type}")
+    if db_type == "mongodb":
+        if not args.database:
+            raise SystemExit("--database is required for MongoDB")
+        return get_registry().acquire(db_type, uri, args.database)
+    return get_registry().acquire(db_type, uri)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Answer a file of questions without the Streamlit app.")
+    parser.add_argument("questions", help="Text file with one question per line, or JSONL with a \"question\" field")
+    parser.add_argument("--db-type", required=True, choices=["mysql", "postgresql", "mongodb"])
+    parser.add_argument("--uri", help="Connection URI (SQLAlchemy URI for SQL databases)")
+    parser.add_argument("--user", default="")
+    parser.add_argument("--password", default="")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", default="")
+    parser.add_argument("--database", default="")
+    parser.add_argument("--output", help="JSONL file for the results (default: stdout)")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS, help="Questions answered concurrently")
+    parser.add_argument("--timeout", type=float, default=BATCH_QUESTION_TIMEOUT, help="Seconds allowed per question")
+    parser.add_argument("--llm-rps", type=float, default=LLM_REQUESTS_PER_SECOND,
+                        help="Maximum LLM requests per second (0 = no limit)")
+    parser.add_argument("--max-rows", type=int, default=MAX_DISPLAY_ROWS, help="Rows written per result")
+    parser.add_argument("--query-cache", action=argparse.BooleanOptionalAction, default=False,
+                        help="Reuse and fill the query cache (default: --no-query-cache)")
+    parser.add_argument("--examples", action=argparse.BooleanOptionalAction, default=False,
+                        help="Use and record examples in the example store (default: --no-examples)")
+    args = parser.parse_args(argv)
+
+    questions = load_questions(args.questions)
+    db = connect(args)
+    set_rate_limit(args.llm_rps)
+
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    started = time.perf_counter()
+    failed = 0
+    try:
+        for record in run_batch(questions, args.db_type, db, args.workers, args.timeout, args.max_rows,
+                                args.query_cache, args.examples):
+            failed += record.get("error") is not None
+            output.write(json.dumps(record, default=_json_default) + "\n")
+            output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        get_registry().close_all()
+    print(f"{len(questions)} questions, {failed} failed, {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,361 @@
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+"""
+End-to-end benchmark of the question -> query -> results -> summary pipeline.
+Runs a fixed question set against a generated SQLite fixture (or any SQL/Mongo URI given) and a mongomock
+database, with the LLM replaced by the offline stand-in at a fixed latency, and writes per-stage p50/p95
+latencies, prompt token counts and peak memory per fixture size as JSON. With --startup, the time from a fresh
+process to the first rendered page of the app is measured as well.
+
+    python benchmark.py --rows 1000,10000,50000 --repeat 5 --startup 3 --output bench.json
+"""
+
+# The benchmark measures the uncached pipeline unless --warm is given, and never touches the user's stores
+os.environ.setdefault("QUERYBUDDY_DATA_DIR", tempfile.mkdtemp(prefix="querybuddy-bench-"))
+if "--warm" not in sys.argv:
+    os.environ["QUERYBUDDY_QUERY_CACHE_ENABLED"] = "0"
+    os.environ["QUERYBUDDY_RESULT_CACHE_ENABLED"] = "0"
+
+import query_generate
+from connection_registry import get_registry
+from langchain_core.messages import AIMessage, HumanMessage
+from mongo_schema import refresh_mongo_schema
+from llm_provider import FakeChatModel, prompt_text, rule_based_response, set_llm
+from tokens import count_tokens
+
+
+# (question, SQL query, MongoDB query), asked in this order as one conversation
+QUESTIONS = [
+    (
+        "How many customers are there?",
+        "SELECT COUNT(*) AS customers FROM customers",
+        'db.customers.countDocuments({})',
+    ),
+    (
+        "List all orders",
+        "SELECT * FROM orders",
+        'db.orders.find({})',
+    ),
+    (
+        "Which orders are above 900, largest first?",
+        "SELECT id, customer_id, amount, status FROM orders WHERE amount > 900 ORDER BY amount DESC",
+        'db.orders.find({"amount": {"$gt": 900}}, {"customer_id": 1, "amount": 1, "status": 1}).sort({"amount": -1})',
+    ),
+    (
+        "Who are the 10 customers with the highest total spend?",
+        "SELECT c.name, SUM(o.amount) AS total FROM customers c JOIN orders o ON o.customer_id = c.id "
+        "GROUP BY c.id, c.name ORDER BY total DESC LIMIT 10",
+        'db.orders.aggregate([{"$group": {"_id": "$customer_id", "total": {"$sum": "$amount"}}}, '
+        '{"$sort": {"total": -1}}, {"$limit": 10}])',
+    ),
+    (
+        "How many products are in each category?",
+        "SELECT category, COUNT(*) AS products FROM products GROUP BY category ORDER BY category",
+        'db.products.aggregate([{"$group": {"_id": "$category", "products": {"$sum": 1}}}, {"$sort": {"_id": 1}}])',
+    ),
+]
+
+CATEGORIES = ["books", "games", "garden", "kitchen", "music", "sports", "tools", "toys"]
+STATUSES = ["new", "paid", "shipped", "returned"]
+
+STAGES = ["schema_fetch", "query_generation", "query_validation", "query_execution", "table_rendering",
+          "summary_first_token", "summary_generation", "total"]
+
+
+class BenchmarkLLM(FakeChatModel):
+    """Answers the fixed questions with their known queries and records every prompt's size."""
+
+    answers: dict = {}
+    prompt_tokens: dict = {}
+
+    def _respond(self, messages):
+        prompt = prompt_text(messages)
+        kind = "query" if re.search(r"(SQL|MongoDB) Query:\s*$", prompt) else "summary"
+        self.prompt_tokens.setdefault(kind, []).append(count_tokens(prompt))
+        if kind == "query":
+            question = re.findall(r"Question: (.*)", prompt)[-1].strip()
+            dialect = "sql" if prompt.rstrip().endswith("SQL Query:") else "mongodb"
+            if (dialect, question) in self.answers:
+                return self.answers[(dialect, question)]
+        return rule_based_response(prompt)
+
+
+def fixture_rows(rows, seed=7):
+    """Deterministic customers/products/orders rows, orders being the table that grows with rows."""
+    rng = random.Random(seed)
+    customer_count = max(rows // 10, 1)
+    product_count = max(rows // 100, len(CATEGORIES))
+    customers = [(i, f"Customer {i}", rng.choice(["DE", "FR", "IN", "US"])) for i in range(1, customer_count + 1)]
+    products = [(i, f"Product {i}", CATEGORIES[i % len(CATEGORIES)], round(rng.uniform(1, 200), 2))
+                for i in range(1, product_count + 1)]
+    orders = [(i, rng.randint(1, customer_count), rng.randint(1, product_count),
+               round(rng.uniform(1, 1000), 2), rng.choice(STATUSES))
+              for i in range(1, rows + 1)]
+    return customers, products, orders
+
+
+def build_sql_fixture(uri, rows):
+    """Create and fill the fixture tables (portable DDL, so a Postgres URI works as well)."""
+    from sqlalchemy import create_engine, text
+    customers, products, orders = fixture_rows(rows)
+    engine = create_engine(uri)
+    with engine.begin() as connection:
+        for table in ("orders", "products", "customers"):
+            connection.execute(text(f"DROP TABLE IF EXISTS {table}"))
+        connection.execute(text(
+            "CREATE TABLE customers (id INTEGER PRIMARY KEY, name VARCHAR(100), country VARCHAR(2))"))
+        connection.execute(text(
+            "CREATE TABLE products (id INTEGER PRIMARY KEY, name VARCHAR(100), category VARCHAR(50), price NUMERIC(10, 2))"))
+        connection.execute(text(
+            "CREATE TABLE orders (id INTEGER PRIMARY KEY, customer_id INTEGER REFERENCES customers(id), "
+            "product_id INTEGER REFERENCES products(id), amount NUMERIC(10, 2), status VARCHAR(20))"))
+        connection.execute(text("INSERT INTO customers VALUES (:id, :name, :country)"),
+                           [dict(zip(("id", "name", "country"), row)) for row in customers])
+        connection.execute(text("INSERT INTO products VALUES (:id, :name, :category, :price)"),
+                           [dict(zip(("id", "name", "category", "price"), row)) for row in products])
+        connection.execute(text("INSERT INTO orders VALUES (:id, :customer_id, :product_id, :amount, :status)"),
+                           [dict(zip(("id", "customer_id", "product_id", "amount", "status"), row)) for row in orders])
+    engine.dispose()
+
+
+def build_mongo_fixture(db, rows):
+    customers, products, orders = fixture_rows(rows)
+    for name in ("customers", "products", "orders"):
+        db.drop_collection(name)
+    db.customers.insert_many([{"_id": i, "name": name, "country": country} for i, name, country in customers])
+    db.products.insert_many([{"_id": i, "name": name, "category": category, "price": price}
+                             for i, name, category, price in products])
+    db.orders.insert_many([{"_id": i, "customer_id": customer, "product_id": product, "amount": amount, "status": status}
+                           for i, customer, product, amount, status in orders])
+
+
+def open_mongo(mongo_uri, rows):
+    if mongo_uri:
+        database = get_registry().acquire("mongodb", mongo_uri, "querybuddy_bench")
+    else:
+        try:
+            import mongomock
+        except ImportError:
+            raise SystemExit("The Mongo benchmark needs mongomock (pip install mongomock) or --mongo-uri")
+        database = mongomock.MongoClient()["querybuddy_bench"]
+    build_mongo_fixture(database, rows)
+    refresh_mongo_schema(database)
+    return database
+
+
+def run_question(db_type, question, db, history):
+    """Run one question through stream_response, returns ({stage: seconds}, error or None, answer)."""
+    start = time.perf_counter()
+    trace = None
+    error = None
+    tokens = []
+    query = ""
+    for event, value in query_generate.stream_response(db_type, question, db, history):
+        if event == "query":
+            query = value
+        elif event == "token":
+            tokens.append(value)
+        elif event == "error":
+            error = value
+        elif event == "trace":
+            trace = value
+    timings = trace.durations()
+    timings["total"] = time.perf_counter() - start
+    for span in trace.spans:
+        if "first_token_seconds" in span.attributes:
+            timings["summary_first_token"] = span.attributes["first_token_seconds"]
+    answer = f"```\n{query}\n```\n\n" + "".join(tokens)
+    return timings, error, answer
+
+
+# Modules the first page should render without; they are loaded with the first question (or preloaded after it)
+DEFERRED_MODULES = ["query_generate", "sqlalchemy", "pymongo", "bson", "pandas", "pyarrow", "langchain_community"]
+
+# Run in a fresh interpreter: renders the app once and prints the timings as JSON
+STARTUP_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+AppTest.from_file("app.py", default_timeout=120).run()
+first_page = time.perf_counter() - started
+with open(sys.argv[1], encoding="utf-8") as file:
+    span = next(record for record in map(json.loads, file) if record["stage"] == "app_startup")
+print(json.dumps({
+    "first_page_seconds": first_page,
+    "app_startup_seconds": span["duration"],
+    "imports_seconds": span["imports_seconds"],
+    "deferred_loaded": [name for name in json.loads(sys.argv[2]) if name in sys.modules],
+}))
+"""
+
+
+def measure_startup(runs):
+    """Cold start timings over runs fresh processes, with the pipeline preload off so it does not blur them."""
+    samples = []
+    for _ in range(runs):
+        spans = os.path.join(tempfile.mkdtemp(prefix="querybuddy-bench-"), "spans.jsonl")
+        env = dict(os.environ, QUERYBUDDY_PRELOAD_PIPELINE="0", QUERYBUDDY_METRICS_ENABLED="1",
+                   QUERYBUDDY_METRICS_JSONL_PATH=spans)
+        output = subprocess.run(
+            [sys.executable, "-c", STARTUP_SCRIPT, spans, json.dumps(DEFERRED_MODULES)],
+            cwd=os.path.dirname(os.path.abspath(__file__)), env=env, capture_output=True, text=True, check=True,
+        ).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    return {
+        **{key: summarize([sample[key] for sample in samples])
+           for key in ("first_page_seconds", "app_startup_seconds", "imports_seconds")},
+        "deferred_loaded": sorted({name for sample in samples for name in sample["deferred_loaded"]}),
+    }
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+def summarize(values):
+    if not values:
+        return None
+    return {
+        "p50": percentile(values, 0.5),
+        "p95": percentile(values, 0.95),
+        "mean": sum(values) / len(values),
+        "n": len(values),
+    }
+
+
+def benchmark(db_type, db, rows, repeat, llm):
+    """Ask the question set repeat times (one conversation per repetition), one result dict."""
+    dialect = "sql" if query_generate.is_sql(db_type) else "mongodb"
+    stages = {stage: [] for stage in STAGES}
+    llm.prompt_tokens.clear()
+    errors = []
+    for _ in range(repeat):
+        history = []
+        for question, *_ in QUESTIONS:
+            history = history + [HumanMessage(question)]
+            timings, error, answer = run_question(db_type, question, db, history)
+            if error:
+                errors.append(f"{question}: {error}")
+            for stage, seconds in timings.items():
+                stages.setdefault(stage, []).append(seconds)
+            history = history + [AIMessage(answer)]
+    # Prompts of the timed iterations only, the memory pass below asks without history
+    prompt_tokens = {kind: summarize(values) for kind, values in llm.prompt_tokens.items()}
+
+    # Peak memory in a separate untimed pass, tracemalloc slows everything down
+    tracemalloc.start()
+    peak = {}
+    for question, *_ in QUESTIONS:
+        tracemalloc.reset_peak()
+        run_question(db_type, question, db, [HumanMessage(question)])
+        peak[question] = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        "backend": dialect,
+        "rows": rows,
+        "repeat": repeat,
+        "stages_seconds": {stage: summarize(values) for stage, values in stages.items()},
+        "prompt_tokens": prompt_tokens,
+        "peak_memory_bytes": {"max": max(peak.values()), "per_question": peak},
+        "errors": errors,
+    }
+
+
+def format_report(results):
+    """Short human readable view of the results, one line per stage."""
+    lines = []
+    for result in results:
+        lines.append(f"{result['backend']} with {result['rows']:,} rows "
+                     f"(peak memory {result['peak_memory_bytes']['max'] / 1e6:.1f} MB, prompt tokens p50 "
+                     + ", ".join(f"{kind} {stats['p50']}" for kind, stats in result["prompt_tokens"].items()) + ")")
+        for stage in STAGES:
+            stats = result["stages_seconds"][stage]
+            if stats is not None:
+                lines.append(f"  {stage:22} p50 {stats['p50'] * 1000:9.1f} ms   p95 {stats['p95'] * 1000:9.1f} ms")
+        for error in result["errors"]:
+            lines.append(f"  error: {error}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the QueryBuddy pipeline end to end.")
+    parser.add_argument("--rows", default="1000,10000,50000", help="Comma separated fixture sizes (orders rows)")
+    parser.add_argument("--repeat", type=int, default=5, help="Times the question set is asked per size")
+    parser.add_argument("--backend", choices=["sql", "mongodb", "both"], default="both")
+    parser.add_argument("--sql-uri", help="SQL database to fill with the fixture (default: a temporary SQLite file)")
+    parser.add_argument("--mongo-uri", help="MongoDB to fill with the fixture (default: mongomock)")
+    parser.add_argument("--llm-first-token-latency", type=float, default=0.3, help="Stub LLM latency before the first token")
+    parser.add_argument("--llm-token-latency", type=float, default=0.0, help="Stub LLM latency per streamed word")
+    parser.add_argument("--warm", action="store_true", help="Keep the query and result caches enabled")
+    parser.add_argument("--startup", type=int, default=0, help="Fresh processes in which the app's cold start is timed")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.rows.split(",") if size.strip()]
+    answers = {}
+    for question, sql, mongo in QUESTIONS:
+        answers[("sql", question)] = sql
+        answers[("mongodb", question)] = mongo
+    llm = BenchmarkLLM(
+        answers=answers,
+        prompt_tokens={},
+        first_token_latency=args.llm_first_token_latency,
+        token_latency=args.llm_token_latency,
+    )
+    set_llm(llm)
+
+    results = []
+    for rows in sizes:
+        if args.backend in ("sql", "both"):
+            uri = args.sql_uri or f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='querybuddy-bench-'), 'bench.db')}"
+            build_sql_fixture(uri, rows)
+            db_type = "postgresql" if uri.startswith("postgres") else "mysql"
+            db = get_registry().acquire(db_type, uri)
+            results.append(benchmark(db_type, db, rows, args.repeat, llm))
+            # The next size refills the tables, so the handle and its reflected schema are dropped
+            get_registry().close_all()
+        if args.backend in ("mongodb", "both"):
+            db = open_mongo(args.mongo_uri, rows)
+            results.append(benchmark("mongodb", db, rows, args.repeat, llm))
+        print(format_report(results[-2 if args.backend == "both" else -1:]), file=sys.stderr)
+
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {
+            "repeat": args.repeat,
+            "warm": args.warm,
+            "llm_first_token_latency": args.llm_first_token_latency,
+            "llm_token_latency": args.llm_token_latency,
+        },
+        "results": results,
+    }
+    if args.startup:
+        report["startup"] = measure_startup(args.startup)
+        stats = report["startup"]["first_page_seconds"]
+        print(f"cold start to first page p50 {stats['p50'] * 1000:.1f} ms   p95 {stats['p95'] * 1000:.1f} ms", file=sys.stderr)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,103 @@
+import uuid
 import streamlit as st
 from langchain_core.messages import AIMessage, HumanMessage
+from chat_store import get_chat_store
+from Format_query import format_query
+from config import CHAT_RENDER_RECENT, CHAT_RENDER_PAGE, CHAT_TABLES_RECENT
+
+GREETING = "Hello! Ask me anything about your database."
+
+def _session_id():
+    """The chat session of this browser tab, kept in the URL (?chat=...) so a reload resumes it."""
+    session = st.query_params.get("chat")
+    if not session:
+        session = uuid.uuid4().hex
+        st.query_params["chat"] = session
+    return session
+
+def _message(role, content, metadata=None):
+    if role == "AI":
+        return AIMessage(content=content, additional_kwargs=metadata or {})
+    return HumanMessage(content=content)
 
 def init_chat_history():
     if "chat_history" not in st.session_state:
-        st.session_state.chat_history = [
-            AIMessage(content="Hello! Ask me anything about your database."),
-        ]
-
-def add_message(role, content):
-    """Add a message to chat history."""
-    message = AIMessage(content=content) if role == "AI" else HumanMessage(content=content)
-    st.session_state.chat_history.append(message)
-
-def display_chat_history():
-    """Display the chat history in Streamlit."""
-    for message in st.session_state.chat_history:
+        st.session_state.chat_session = _session_id()
+        st.session_state.chat_history = [_message("AI", GREETING)]
+        st.session_state.chat_visible = CHAT_RENDER_RECENT
+        # Resuming a stored session: messages only, result tables are loaded when shown
+        store = get_chat_store()
+        if store is not None:
+            for message_id, role, content, metadata in store.load(st.session_state.chat_session):
+                st.session_state.chat_history.append(_message(role, content, {**metadata, "message_id": message_id}))
+
+def new_chat():
+    """Start an empty conversation in a new session."""
+    st.query_params["chat"] = uuid.uuid4().hex
+    del st.session_state["chat_history"]
+    init_chat_history()
+
+def add_message(role, content, table=None, **metadata):
+    """
+    Add a message to chat history and the chat store.
+    AI answers are structured: metadata holds the question, query, summary and so on, the result table is kept apart.
+    """
+    metadata["has_table"] = bool(table)
+    store = get_chat_store()
+    if store is not None:
+        metadata["message_id"] = store.append(st.session_state.chat_session, role, content, metadata, table)
+    metadata["table"] = table
+    st.session_state.chat_history.append(_message(role, content, metadata))
+
+def message_table(message):
+    """The result table of an answer, loaded from the chat store on first use."""
+    metadata = message.additional_kwargs
+    if "table" not in metadata and "message_id" in metadata:
+        store = get_chat_store()
+        metadata["table"] = store.table(metadata["message_id"]) if store is not None else None
+    return metadata.get("table")
+
+@st.fragment
+def _display_answer(index, actions, show_table):
+    # A fragment, so showing a table or exporting reruns this answer only, not the whole page
+    message = st.session_state.chat_history[index]
+    metadata = message.additional_kwargs
+    if "summary" not in metadata:
+        st.markdown(message.content)
+        return
+    if metadata.get("query"):
+        st.markdown("**Query:**")
+        is_sql_db = metadata.get("db_type", "").lower() in ["mysql", "postgresql"]
+        if is_sql_db:
+            st.code(format_query(metadata["query"]), language="sql")
+        else:
+            st.code(metadata["query"], language="javascript")
+    st.markdown("**Response:**\n\n" + metadata["summary"])
+    if metadata.get("has_table"):
+        if show_table or st.checkbox("Show result table", key=f"show_table_{index}"):
+            st.markdown(message_table(message) or "_The result table is no longer available._")
+    if actions is not None and metadata.get("query"):
+        actions(index, message)
+
+def _show_earlier():
+    st.session_state.chat_visible += CHAT_RENDER_PAGE
+
+def display_chat_history(actions=None):
+    """
+    Display the chat history in Streamlit, actions(index, message) renders controls under AI answers.
+    Only the latest messages are rendered, older ones are revealed on demand; only the latest answers show their table.
+    """
+    messages = st.session_state.chat_history
+    start = max(len(messages) - st.session_state.chat_visible, 0)
+    if start:
+        st.button(f"Show {min(start, CHAT_RENDER_PAGE)} earlier messages", on_click=_show_earlier)
+    answers = [index for index in range(start, len(messages)) if isinstance(messages[index], AIMessage)]
+    tables = set(answers[-CHAT_TABLES_RECENT:]) if CHAT_TABLES_RECENT else set()
+    for index in range(start, len(messages)):
+        message = messages[index]
         if isinstance(message, AIMessage):
             with st.chat_message("AI"):
-                st.markdown(message.content)
+                _display_answer(index, actions, index in tables)
         elif isinstance(message, HumanMessage):
             with st.chat_message("Human"):
                 st.markdown(message.content)
@@ -0,0 +1,128 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from config import DATA_DIR, CHAT_STORE_ENABLED, CHAT_STORE_MAX_SESSIONS
+
+"""
+Local store of chat sessions, so a conversation can be resumed after a reload or restart.
+Messages are kept as structured records (role, text, query, summary, ...) in a SQLite file; result tables
+are stored apart and referenced by message id, so resuming a session does not load every table.
+"""
+
+
+class ChatStore:
+    """
+    SQLite-backed chat sessions, bounded by evicting the least recently active sessions.
+    """
+
+    def __init__(self, path, max_sessions=CHAT_STORE_MAX_SESSIONS):
+        self.path = path
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS messages (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    session TEXT NOT NULL,
+                    role TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    metadata TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            connection.execute("CREATE INDEX IF NOT EXISTS messages_session ON messages (session, id)")
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS result_tables (
+                    message_id INTEGER PRIMARY KEY,
+                    markdown TEXT NOT NULL
+                )
+            """)
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=10)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def append(self, session, role, content, metadata=None, table=None):
+        """Store one message (and its result table) at the end of session, returns the message id."""
+        with self._lock, self._connect() as connection:
+            message_id = connection.execute(
+                "INSERT INTO messages (session, role, content, metadata, created_at) VALUES (?, ?, ?, ?, ?)",
+                (session, role, content, json.dumps(metadata or {}, default=str), time.time()),
+            ).lastrowid
+            if table:
+                connection.execute(
+                    "INSERT INTO result_tables (message_id, markdown) VALUES (?, ?)", (message_id, table)
+                )
+            self._evict(connection)
+            return message_id
+
+    def _evict(self, connection):
+        stale = [row[0] for row in connection.execute(
+            "SELECT session FROM messages GROUP BY session ORDER BY MAX(id) DESC LIMIT -1 OFFSET ?",
+            (self.max_sessions,),
+        )]
+        for session in stale:
+            self._delete(connection, session)
+
+    def _delete(self, connection, session):
+        connection.execute(
+            "DELETE FROM result_tables WHERE message_id IN (SELECT id FROM messages WHERE session = ?)", (session,)
+        )
+        connection.execute("DELETE FROM messages WHERE session = ?", (session,))
+
+    def load(self, session):
+        """[(message id, role, content, metadata)] of session in order, without the result tables."""
+        with self._lock, self._connect() as connection:
+            rows = connection.execute(
+                "SELECT id, role, content, metadata FROM messages WHERE session = ? ORDER BY id", (session,)
+            ).fetchall()
+        return [(message_id, role, content, json.loads(metadata)) for message_id, role, content, metadata in rows]
+
+    def table(self, message_id):
+        """The result table stored with a message, or None."""
+        with self._lock, self._connect() as connection:
+            row = connection.execute(
+                "SELECT markdown FROM result_tables WHERE message_id = ?", (message_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def clear(self, session=None):
+        """Forget one session, or all of them."""
+        with self._lock, self._connect() as connection:
+            if session is None:
+                connection.execute("DELETE FROM result_tables")
+                connection.execute("DELETE FROM messages")
+            else:
+                self._delete(connection, session)
+
+    def stats(self):
+        with self._lock, self._connect() as connection:
+            sessions, messages = connection.execute(
+                "SELECT COUNT(DISTINCT session), COUNT(*) FROM messages"
+            ).fetchone()
+        return {"sessions": sessions, "messages": messages}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_chat_store():
+    """The process-wide chat store, or None when disabled."""
+    global _store
+    if not CHAT_STORE_ENABLED:
+        return None
+    with _store_lock:
+        if _store is None:
+            _store = ChatStore(os.path.join(DATA_DIR, "chats.sqlite3"))
+        return _store
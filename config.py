@@ -0,0 +1,163 @@
+import os
+from dotenv import load_dotenv
+
+# Loading environment variables
+load_dotenv()
+
+"""
+Tunable settings for QueryBuddy, read from the environment (or .env file)
+"""
+
+def _get_float(name, default):
+    value = os.getenv(name)
+    return float(value) if value not in (None, "") else default
+
+def _get_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+def _get_bool(name, default):
+    value = os.getenv(name)
+    return value.strip().lower() in ("1", "true", "yes", "on") if value not in (None, "") else default
+
+
+# Directory for the local SQLite stores (caches, history, ...)
+DATA_DIR = os.getenv("QUERYBUDDY_DATA_DIR", ".querybuddy")
+
+
+# Schema cache: minimum number of seconds between two fingerprint checks
+SCHEMA_CHECK_INTERVAL = _get_float("QUERYBUDDY_SCHEMA_CHECK_INTERVAL", 5.0)
+
+# Schema pruning: number of best-matching tables/collections and token budget for the schema prompt
+SCHEMA_TOP_K = _get_int("QUERYBUDDY_SCHEMA_TOP_K", 8)
+SCHEMA_TOKEN_BUDGET = _get_int("QUERYBUDDY_SCHEMA_TOKEN_BUDGET", 4000)
+
+# Pipeline concurrency: worker threads shared by all sessions and per-stage timeouts in seconds
+PIPELINE_WORKERS = _get_int("QUERYBUDDY_PIPELINE_WORKERS", 16)
+SCHEMA_TIMEOUT = _get_float("QUERYBUDDY_SCHEMA_TIMEOUT", 30.0)
+QUERY_GENERATION_TIMEOUT = _get_float("QUERYBUDDY_QUERY_GENERATION_TIMEOUT", 60.0)
+EXECUTION_TIMEOUT = _get_float("QUERYBUDDY_EXECUTION_TIMEOUT", 120.0)
+SUMMARY_TIMEOUT = _get_float("QUERYBUDDY_SUMMARY_TIMEOUT", 120.0)
+
+# HTTP timeout for a single LLM request
+LLM_REQUEST_TIMEOUT = _get_float("QUERYBUDDY_LLM_REQUEST_TIMEOUT", 60.0)
+
+# LLM backend ("groq" or the offline "fake"), model names and sampling temperature
+LLM_BACKEND = os.getenv("QUERYBUDDY_LLM_BACKEND", "groq").lower()
+LLM_MODEL = os.getenv("QUERYBUDDY_LLM_MODEL", "llama-3.3-70b-versatile")
+SUMMARY_MODEL = os.getenv("QUERYBUDDY_SUMMARY_MODEL", "")
+LLM_TEMPERATURE = _get_float("QUERYBUDDY_LLM_TEMPERATURE", 0.0)
+
+# Recording real LLM responses to a JSONL file, and replaying them with the fake backend at a simulated latency
+LLM_RECORD_PATH = os.getenv("QUERYBUDDY_LLM_RECORD_PATH", "")
+FAKE_LLM_RECORDINGS = os.getenv("QUERYBUDDY_FAKE_LLM_RECORDINGS", "")
+FAKE_LLM_FIRST_TOKEN_LATENCY = _get_float("QUERYBUDDY_FAKE_LLM_FIRST_TOKEN_LATENCY", 0.3)
+FAKE_LLM_TOKEN_LATENCY = _get_float("QUERYBUDDY_FAKE_LLM_TOKEN_LATENCY", 0.01)
+
+# Requests per second allowed to the LLM provider across the process (0 = no limit)
+LLM_REQUESTS_PER_SECOND = _get_float("QUERYBUDDY_LLM_REQUESTS_PER_SECOND", 0.0)
+
+# Generated-query cache: on/off, maximum number of entries and time to live in seconds
+QUERY_CACHE_ENABLED = _get_bool("QUERYBUDDY_QUERY_CACHE_ENABLED", True)
+QUERY_CACHE_MAX_ENTRIES = _get_int("QUERYBUDDY_QUERY_CACHE_MAX_ENTRIES", 5000)
+QUERY_CACHE_TTL = _get_float("QUERYBUDDY_QUERY_CACHE_TTL", 7 * 24 * 3600.0)
+
+# Few-shot examples from past successful questions: enabled, stored pairs per database, examples per prompt
+EXAMPLE_STORE_ENABLED = _get_bool("QUERYBUDDY_EXAMPLE_STORE_ENABLED", True)
+EXAMPLE_STORE_MAX_PER_DB = _get_int("QUERYBUDDY_EXAMPLE_STORE_MAX_PER_DB", 500)
+EXAMPLE_TOP_K = _get_int("QUERYBUDDY_EXAMPLE_TOP_K", 3)
+
+# Shared result cache: on/off, maximum number of results, memory budget in bytes and time to live in seconds
+RESULT_CACHE_ENABLED = _get_bool("QUERYBUDDY_RESULT_CACHE_ENABLED", True)
+RESULT_CACHE_MAX_ENTRIES = _get_int("QUERYBUDDY_RESULT_CACHE_MAX_ENTRIES", 256)
+RESULT_CACHE_MAX_BYTES = _get_int("QUERYBUDDY_RESULT_CACHE_MAX_BYTES", 64 * 1024 * 1024)
+RESULT_CACHE_TTL = _get_float("QUERYBUDDY_RESULT_CACHE_TTL", 300.0)
+
+# Result size limits: rows fetched per round trip, rows kept for display, rows sent to the summary prompt, rows per page
+SQL_FETCH_SIZE = _get_int("QUERYBUDDY_SQL_FETCH_SIZE", 1000)
+MAX_DISPLAY_ROWS = _get_int("QUERYBUDDY_MAX_DISPLAY_ROWS", 200)
+MAX_PROMPT_ROWS = _get_int("QUERYBUDDY_MAX_PROMPT_ROWS", 50)
+PAGE_SIZE = _get_int("QUERYBUDDY_PAGE_SIZE", 100)
+
+# Local validation of generated queries and how many times the LLM may repair an invalid one
+QUERY_VALIDATION_ENABLED = _get_bool("QUERYBUDDY_QUERY_VALIDATION_ENABLED", True)
+QUERY_REPAIR_ATTEMPTS = _get_int("QUERYBUDDY_QUERY_REPAIR_ATTEMPTS", 2)
+
+# SQL cost guard: planner estimate thresholds (0 = no limit) and what happens above them ("reject" or "limit")
+SQL_GUARD_ENABLED = _get_bool("QUERYBUDDY_SQL_GUARD_ENABLED", True)
+SQL_GUARD_MAX_ROWS = _get_int("QUERYBUDDY_SQL_GUARD_MAX_ROWS", 10_000_000)
+SQL_GUARD_MAX_COST = _get_float("QUERYBUDDY_SQL_GUARD_MAX_COST", 5_000_000.0)
+SQL_GUARD_ACTION = os.getenv("QUERYBUDDY_SQL_GUARD_ACTION", "limit").lower()
+
+# Server-side limit for every SQL statement, in seconds. A timed-out execution stage is abandoned, not cancelled,
+# so this limit is what ends its statement and frees its connection: never above EXECUTION_TIMEOUT (0 = EXECUTION_TIMEOUT)
+SQL_STATEMENT_TIMEOUT = min(_get_float("QUERYBUDDY_SQL_STATEMENT_TIMEOUT", 60.0) or EXECUTION_TIMEOUT, EXECUTION_TIMEOUT)
+
+# MongoDB cursors: documents per batch, server-side time limit in milliseconds and whether aggregations may spill to disk
+MONGO_BATCH_SIZE = _get_int("QUERYBUDDY_MONGO_BATCH_SIZE", 500)
+# The time limit is capped at EXECUTION_TIMEOUT like SQL_STATEMENT_TIMEOUT (0 = EXECUTION_TIMEOUT)
+MONGO_MAX_TIME_MS = min(_get_int("QUERYBUDDY_MONGO_MAX_TIME_MS", 30000) or int(EXECUTION_TIMEOUT * 1000),
+                        int(EXECUTION_TIMEOUT * 1000))
+MONGO_ALLOW_DISK_USE = _get_bool("QUERYBUDDY_MONGO_ALLOW_DISK_USE", True)
+
+# MongoDB schema inference: documents sampled per collection, cache lifetime in seconds and concurrent samplers
+MONGO_SCHEMA_SAMPLE_SIZE = _get_int("QUERYBUDDY_MONGO_SCHEMA_SAMPLE_SIZE", 100)
+MONGO_SCHEMA_TTL = _get_float("QUERYBUDDY_MONGO_SCHEMA_TTL", 600.0)
+MONGO_SCHEMA_WORKERS = _get_int("QUERYBUDDY_MONGO_SCHEMA_WORKERS", 8)
+
+# Shared connection pools: SQLAlchemy pool size/overflow/recycle/checkout timeout, MongoDB pool limits,
+# seconds before an unused connection is closed and seconds between health checks
+SQL_POOL_SIZE = _get_int("QUERYBUDDY_SQL_POOL_SIZE", 5)
+SQL_MAX_OVERFLOW = _get_int("QUERYBUDDY_SQL_MAX_OVERFLOW", 10)
+SQL_POOL_RECYCLE = _get_int("QUERYBUDDY_SQL_POOL_RECYCLE", 1800)
+SQL_POOL_TIMEOUT = _get_float("QUERYBUDDY_SQL_POOL_TIMEOUT", 30.0)
+MONGO_MAX_POOL_SIZE = _get_int("QUERYBUDDY_MONGO_MAX_POOL_SIZE", 50)
+MONGO_MIN_POOL_SIZE = _get_int("QUERYBUDDY_MONGO_MIN_POOL_SIZE", 0)
+MONGO_MAX_IDLE_TIME_MS = _get_int("QUERYBUDDY_MONGO_MAX_IDLE_TIME_MS", 300000)
+CONNECTION_IDLE_TIMEOUT = _get_float("QUERYBUDDY_CONNECTION_IDLE_TIMEOUT", 1800.0)
+CONNECTION_HEALTH_CHECK_INTERVAL = _get_float("QUERYBUDDY_CONNECTION_HEALTH_CHECK_INTERVAL", 30.0)
+
+# Chat history in prompts: token budget and number of most recent messages kept verbatim
+HISTORY_TOKEN_BUDGET = _get_int("QUERYBUDDY_HISTORY_TOKEN_BUDGET", 1000)
+HISTORY_RECENT_MESSAGES = _get_int("QUERYBUDDY_HISTORY_RECENT_MESSAGES", 4)
+
+# Stage metrics: enabled, optional JSONL file receiving every span, and port of the Prometheus endpoint (0 = off)
+METRICS_ENABLED = _get_bool("QUERYBUDDY_METRICS_ENABLED", True)
+METRICS_JSONL_PATH = os.getenv("QUERYBUDDY_METRICS_JSONL_PATH", "")
+METRICS_PORT = _get_int("QUERYBUDDY_METRICS_PORT", 0)
+
+# Headless batch runs: concurrent questions and the time limit for one question, in seconds
+BATCH_WORKERS = _get_int("QUERYBUDDY_BATCH_WORKERS", 4)
+BATCH_QUESTION_TIMEOUT = _get_float("QUERYBUDDY_BATCH_QUESTION_TIMEOUT", 300.0)
+
+# Exports of full results: output directory, server-side time limit per export in seconds (0 = none)
+# and the largest file offered as a browser download, in MB
+EXPORT_DIR = os.getenv("QUERYBUDDY_EXPORT_DIR", os.path.join(DATA_DIR, "exports"))
+EXPORT_STATEMENT_TIMEOUT = _get_float("QUERYBUDDY_EXPORT_STATEMENT_TIMEOUT", 600.0)
+EXPORT_DOWNLOAD_MAX_MB = _get_float("QUERYBUDDY_EXPORT_DOWNLOAD_MAX_MB", 200.0)
+
+# Result profiles for the summary prompt: rows read for the statistics (beyond the displayed ones),
+# most frequent values listed per column and sample rows sent along with the profile
+PROFILE_MAX_ROWS = _get_int("QUERYBUDDY_PROFILE_MAX_ROWS", 10000)
+PROFILE_TOP_K = _get_int("QUERYBUDDY_PROFILE_TOP_K", 5)
+PROFILE_SAMPLE_ROWS = _get_int("QUERYBUDDY_PROFILE_SAMPLE_ROWS", 10)
+
+# Chat sessions: kept in a local store so they can be resumed (at most this many sessions), messages rendered
+# before older ones are collapsed, older messages revealed per click and answers shown with their result table
+CHAT_STORE_ENABLED = _get_bool("QUERYBUDDY_CHAT_STORE_ENABLED", True)
+CHAT_STORE_MAX_SESSIONS = _get_int("QUERYBUDDY_CHAT_STORE_MAX_SESSIONS", 200)
+CHAT_RENDER_RECENT = _get_int("QUERYBUDDY_CHAT_RENDER_RECENT", 10)
+CHAT_RENDER_PAGE = _get_int("QUERYBUDDY_CHAT_RENDER_PAGE", 20)
+CHAT_TABLES_RECENT = _get_int("QUERYBUDDY_CHAT_TABLES_RECENT", 2)
+
+# Startup: load the query pipeline of the connected backend (LangChain, plus SQLAlchemy for SQL databases) in the
+# background once a database is connected, instead of when the first question is asked
+PRELOAD_PIPELINE = _get_bool("QUERYBUDDY_PRELOAD_PIPELINE", True)
+
+# Pinned questions: enabled, default refresh interval and scheduler pass interval in seconds (0 = no background
+# refresh), age after which a snapshot is refreshed even if no change was seen, and pins per database
+PINNED_ENABLED = _get_bool("QUERYBUDDY_PINNED_ENABLED", True)
+PINNED_REFRESH_INTERVAL = _get_float("QUERYBUDDY_PINNED_REFRESH_INTERVAL", 900.0)
+PINNED_SCHEDULER_INTERVAL = _get_float("QUERYBUDDY_PINNED_SCHEDULER_INTERVAL", 30.0)
+PINNED_MAX_AGE = _get_float("QUERYBUDDY_PINNED_MAX_AGE", 86400.0)
+PINNED_MAX_PER_DB = _get_int("QUERYBUDDY_PINNED_MAX_PER_DB", 50)
@@ -0,0 +1,226 @@
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+from result_cache import register_connection_identity
+from config import (
+    SQL_POOL_SIZE, SQL_MAX_OVERFLOW, SQL_POOL_RECYCLE, SQL_POOL_TIMEOUT,
+    MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, MONGO_MAX_IDLE_TIME_MS,
+    CONNECTION_IDLE_TIMEOUT, CONNECTION_HEALTH_CHECK_INTERVAL,
+)
+
+"""
+Process-wide registry of database connections shared by all Streamlit sessions and reruns.
+Connections are keyed by a hash of the credentials, built with bounded pools, health-checked on reuse
+and closed after being idle for a while. Each driver stack (SQLAlchemy or PyMongo) is imported when the first
+connection of its kind is made, so the app starts without loading drivers it may never use.
+"""
+
+
+def connection_key(db_type, uri):
+    return hashlib.sha256(f"{db_type.lower()}|{uri}".encode("utf-8")).hexdigest()
+
+
+def create_sql_database(uri):
+    """SQLDatabase on an engine with a bounded, pre-pinged and recycled pool."""
+    from sqlalchemy import create_engine, make_url
+    from langchain_community.utilities.sql_database import SQLDatabase
+    engine_args = {"pool_pre_ping": True, "pool_recycle": SQL_POOL_RECYCLE}
+    if make_url(uri).get_backend_name() != "sqlite":
+        engine_args.update(pool_size=SQL_POOL_SIZE, max_overflow=SQL_MAX_OVERFLOW, pool_timeout=SQL_POOL_TIMEOUT)
+    return SQLDatabase(create_engine(uri, **engine_args))
+
+
+def create_mongo_database(uri, database):
+    from pymongo import MongoClient
+    client = MongoClient(
+        uri,
+        connectTimeoutMS=10000,
+        serverSelectionTimeoutMS=5000,
+        tlsAllowInvalidCertificates=False,
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+    )
+    return client[database]
+
+
+class _Entry:
+    def __init__(self, db_type, uri, database):
+        self.db_type = db_type
+        self.uri = uri
+        self.database = database
+        self.db = None
+        self.error = None
+        # Set once the handle is built (or failed), sessions asking for it meanwhile wait here
+        self.ready = threading.Event()
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.last_checked = self.created_at
+        self.checking = False
+        # Blocks currently using the handle; a retired entry is closed when the last one ends
+        self.leases = 0
+        self.retired = False
+
+
+class ConnectionRegistry:
+    """
+    Shares one database handle (and so one pool) per set of credentials across the process.
+    Handles are built and health-checked outside the registry lock, so a slow or unreachable server only holds up
+    the sessions using it. A handle is closed only once no lease on it is left.
+    """
+
+    def __init__(self, idle_timeout=CONNECTION_IDLE_TIMEOUT, health_check_interval=CONNECTION_HEALTH_CHECK_INTERVAL):
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self._entries = {}
+        self._lock = threading.RLock()
+
+    def acquire(self, db_type, uri, database=None):
+        """Return the shared handle for these credentials, creating or replacing it when needed."""
+        db_type = db_type.lower()
+        key = connection_key(db_type, uri)
+        self.evict_idle()
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                build = entry is None
+                if build:
+                    entry = self._entries[key] = _Entry(db_type, uri, database)
+                check = (
+                    not build and entry.ready.is_set() and not entry.checking
+                    and time.monotonic() - entry.last_checked >= self.health_check_interval
+                )
+                if check:
+                    # One session checks, the others keep using the handle meanwhile
+                    entry.checking = True
+            if build:
+                self._build(key, entry)
+            else:
+                # A handle being built by another session is waited for rather than built twice
+                entry.ready.wait()
+                if entry.error is not None:
+                    raise entry.error
+            if check:
+                healthy = self._is_healthy(entry)
+                with self._lock:
+                    entry.checking = False
+                    entry.last_checked = time.monotonic()
+                    unused = [] if healthy else self._retire(key, entry)
+                if not healthy:
+                    # Broken connection, replaced on the next pass
+                    self._close_all(unused)
+                    continue
+            with self._lock:
+                entry.last_used = time.monotonic()
+            return entry.db
+
+    def _build(self, key, entry):
+        try:
+            entry.db = self._create(entry.db_type, entry.uri, entry.database)
+            register_connection_identity(entry.db, entry.uri)
+        except Exception as e:
+            entry.error = e
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+            raise
+        finally:
+            entry.ready.set()
+
+    def _create(self, db_type, uri, database):
+        if db_type == "mongodb":
+            return create_mongo_database(uri, database)
+        return create_sql_database(uri)
+
+    def _is_healthy(self, entry):
+        try:
+            if entry.db_type == "mongodb":
+                entry.db.client.admin.command("ping")
+            else:
+                with entry.db._engine.connect() as connection:
+                    connection.exec_driver_sql("SELECT 1")
+            return True
+        except Exception:
+            return False
+
+    def _retire(self, key, entry):
+        """
+        Drop an entry from the registry (under the lock). Returns it in a list when unused, for the caller to close
+        outside the lock; otherwise it is closed when its last lease ends.
+        """
+        if self._entries.get(key) is entry:
+            del self._entries[key]
+        entry.retired = True
+        return [entry] if entry.leases == 0 else []
+
+    def _close_all(self, entries):
+        for entry in entries:
+            self._close(entry)
+
+    def _close(self, entry):
+        try:
+            if entry.db_type == "mongodb":
+                entry.db.client.close()
+            else:
+                entry.db._engine.dispose()
+        except Exception:
+            pass
+
+    @contextmanager
+    def lease(self, db):
+        """
+        Keep db open for the duration of the block even if it is evicted or replaced meanwhile.
+        Yields False when db is not (or no longer) held by the registry. A lease does not count as a use.
+        """
+        with self._lock:
+            entry = next((entry for entry in self._entries.values() if entry.db is db), None)
+            if entry is not None:
+                entry.leases += 1
+        try:
+            yield entry is not None
+        finally:
+            if entry is not None:
+                with self._lock:
+                    entry.leases -= 1
+                    unused = entry.retired and entry.leases == 0
+                if unused:
+                    self._close(entry)
+
+    def evict_idle(self):
+        """Close connections nobody used for idle_timeout seconds."""
+        now = time.monotonic()
+        unused = []
+        with self._lock:
+            idle = [
+                (key, entry) for key, entry in self._entries.items()
+                if entry.ready.is_set() and now - entry.last_used > self.idle_timeout
+            ]
+            for key, entry in idle:
+                unused += self._retire(key, entry)
+        self._close_all(unused)
+        return len(idle)
+
+    def connections(self):
+        """The open handles, without counting as a use (so background work does not keep them from going idle)."""
+        with self._lock:
+            return [entry.db for entry in self._entries.values() if entry.ready.is_set() and entry.db is not None]
+
+    def close_all(self):
+        unused = []
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if entry.ready.is_set():
+                    unused += self._retire(key, entry)
+        self._close_all(unused)
+
+    def stats(self):
+        with self._lock:
+            return {"connections": len(self._entries)}
+
+
+_registry = ConnectionRegistry()
+
+def get_registry():
+    """The process-wide connection registry."""
+    return _registry
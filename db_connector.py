@@ -1,38 +1,34 @@
-from langchain_community.utilities.sql_database import SQLDatabase
-from pymongo import MongoClient
 from urllib.parse import quote_plus
 import streamlit as st
+from connection_registry import get_registry
 
-def init_database(user, password, host, port, database, db_type):
+def database_uri(user, password, host, port, database, db_type):
+    """Connection URI for the credentials, or None for an unsupported database type."""
     password = quote_plus(password)  # URL-encode the password
     db_type = db_type.lower()
+    if db_type == "mysql":
+        return f"mysql+pymysql://{user}:{password}@{host}:{port}/{database}"
+    if db_type == "postgresql":
+        return f"postgresql+psycopg2://{user}:{password}@{host}:{port}/{database}"
+    if db_type == "mongodb":
+        return f"mongodb+srv://{user}:{password}@{host}/{database}"
+        # client = MongoClient(f"mongodb://{user}:{password}@{host}:{port}")
+    return None
 
-    try:
-        if db_type == "mysql":
-            db_uri = f"mysql+pymysql://{user}:{password}@{host}:{port}/{database}"
-            return SQLDatabase.from_uri(db_uri)
-
-        elif db_type == "postgresql":
-            db_uri = f"postgresql+psycopg2://{user}:{password}@{host}:{port}/{database}"
-            return SQLDatabase.from_uri(db_uri)
 
-        elif db_type == "mongodb":
-            uri = f"mongodb+srv://{user}:{password}@{host}/{database}"
-            client = MongoClient(
-                uri,
-                connectTimeoutMS=10000,
-                serverSelectionTimeoutMS=5000,
-                tlsAllowInvalidCertificates=False
-            )
-            return client[database]
-            # client = MongoClient(f"mongodb://{user}:{password}@{host}:{port}")
-            # db = client[database]
-            # return db  # MongoDB client object
+def init_database(user, password, host, port, database, db_type):
+    """Returns the shared connection for these credentials from the process-wide registry."""
+    db_type = db_type.lower()
 
-        else:
+    try:
+        uri = database_uri(user, password, host, port, database, db_type)
+        if uri is None:
             st.error("Unsupported database type")
             return None
+        if db_type == "mongodb":
+            return get_registry().acquire(db_type, uri, database)
+        return get_registry().acquire(db_type, uri)
 
     except Exception as e:
         st.error(f"Error connecting to {db_type}: {e}")
-        return None
+        return None
\ No newline at end of file
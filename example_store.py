@@ -0,0 +1,124 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from query_cache import normalize_question
+from result_cache import connection_identity
+from schema_index import SchemaIndex
+from config import DATA_DIR, EXAMPLE_STORE_ENABLED, EXAMPLE_STORE_MAX_PER_DB, EXAMPLE_TOP_K
+
+"""
+Local store of question -> query pairs that executed successfully, used as few-shot examples in the prompts.
+Examples are kept per database in a SQLite file, looked up with the same BM25 index used for schema retrieval,
+and bounded per database by evicting the least recently used ones (oldest first on ties).
+"""
+
+
+def example_scope(db):
+    """Examples only apply to the database they were generated for."""
+    return hashlib.sha256(f"{connection_identity(db)}|{getattr(db, 'name', '')}".encode("utf-8")).hexdigest()[:32]
+
+
+class ExampleStore:
+    """
+    SQLite-backed few-shot examples with an in-memory BM25 index per database.
+    """
+
+    def __init__(self, path, max_per_scope=EXAMPLE_STORE_MAX_PER_DB):
+        self.path = path
+        self.max_per_scope = max_per_scope
+        self._lock = threading.Lock()
+        # scope -> (SchemaIndex over the questions, {id: (question, query)})
+        self._indexes = {}
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS examples (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    scope TEXT NOT NULL,
+                    question TEXT NOT NULL,
+                    normalized TEXT NOT NULL,
+                    query TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL,
+                    UNIQUE (scope, normalized)
+                )
+            """)
+            connection.execute("CREATE INDEX IF NOT EXISTS examples_scope_last_used ON examples (scope, last_used)")
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=10)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def record(self, scope, question, query):
+        """Store a successful pair (replacing the query of the same question), then evict beyond the limit."""
+        now = time.time()
+        with self._lock, self._connect() as connection:
+            connection.execute(
+                "INSERT INTO examples (scope, question, normalized, query, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (scope, normalized) DO UPDATE SET question = excluded.question, "
+                "query = excluded.query, last_used = excluded.last_used",
+                (scope, question, normalize_question(question), query, now, now),
+            )
+            connection.execute(
+                "DELETE FROM examples WHERE id IN ("
+                "SELECT id FROM examples WHERE scope = ? ORDER BY last_used DESC, id DESC LIMIT -1 OFFSET ?)",
+                (scope, self.max_per_scope),
+            )
+            self._indexes.pop(scope, None)
+
+    def _index(self, connection, scope):
+        if scope not in self._indexes:
+            rows = connection.execute(
+                "SELECT id, question, query FROM examples WHERE scope = ?", (scope,)
+            ).fetchall()
+            examples = {str(row_id): (question, query) for row_id, question, query in rows}
+            index = SchemaIndex({row_id: question for row_id, (question, _) in examples.items()})
+            self._indexes[scope] = (index, examples)
+        return self._indexes[scope]
+
+    def similar(self, scope, question, top_k=EXAMPLE_TOP_K):
+        """Up to top_k (question, query) pairs most similar to question, best first."""
+        with self._lock, self._connect() as connection:
+            index, examples = self._index(connection, scope)
+            matches = index.search(question, top_k) if examples else []
+            if matches:
+                # Examples in use count as recently used for eviction
+                connection.executemany(
+                    "UPDATE examples SET last_used = ? WHERE id = ?",
+                    [(time.time(), int(row_id)) for row_id, _ in matches],
+                )
+            return [examples[row_id] for row_id, _ in matches]
+
+    def clear(self):
+        with self._lock, self._connect() as connection:
+            connection.execute("DELETE FROM examples")
+            self._indexes.clear()
+
+    def stats(self):
+        with self._lock, self._connect() as connection:
+            return {"examples": connection.execute("SELECT COUNT(*) FROM examples").fetchone()[0]}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_example_store():
+    """The process-wide example store, or None when disabled."""
+    global _store
+    if not EXAMPLE_STORE_ENABLED:
+        return None
+    with _store_lock:
+        if _store is None:
+            _store = ExampleStore(os.path.join(DATA_DIR, "examples.sqlite3"))
+        return _store
@@ -0,0 +1,277 @@
+import csv
+import datetime
+import hashlib
+import itertools
+import json
+import os
+from query_guard import guard_query
+from result_cache import is_read_only, is_read_only_mongo
+from result_table import flatten_document
+from connection_registry import get_registry
+from config import EXPORT_DIR, EXPORT_STATEMENT_TIMEOUT, SQL_FETCH_SIZE, MONGO_BATCH_SIZE, MONGO_MAX_TIME_MS
+
+"""
+Exports the full result of a query to CSV or Parquet.
+The query runs again on a server-side cursor (SQL) or a batched cursor (MongoDB) and every chunk is written
+to the file as soon as it arrives, so memory stays bounded by the chunk size whatever the result size.
+"""
+
+FORMATS = ("csv", "parquet")
+
+# Column holding fields of MongoDB documents that did not appear in the first batch
+OTHER_FIELDS = "_other_fields"
+
+
+class ExportError(Exception):
+    """The result cannot be exported."""
+
+
+class CsvSink:
+    """Appends chunks of rows to a CSV file, header first."""
+
+    def __init__(self, path):
+        self.file = open(path, "w", newline="", encoding="utf-8")
+        self.writer = csv.writer(self.file)
+        self.header = False
+        self.rows = 0
+
+    def write(self, columns, rows, decimals=None):
+        if not self.header:
+            self.writer.writerow(columns)
+            self.header = True
+        self.writer.writerows(rows)
+        self.rows += len(rows)
+
+    def close(self):
+        self.file.close()
+
+
+def _arrow_type(pa, values, decimal=None, dynamic=False):
+    """
+    Column type inferred from the first chunk, wide enough for the rows that follow: all-null columns become
+    strings, decimals take the precision and scale of the column (float64 when the column has none, e.g.
+    an unconstrained NUMERIC or an AVG), and numbers of dynamically typed sources (MongoDB) are float64.
+    """
+    try:
+        inferred = pa.array(values).type
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Mixed types, e.g. numbers and strings in one MongoDB field
+        return pa.string()
+    if pa.types.is_null(inferred):
+        return pa.string()
+    if dynamic and (pa.types.is_integer(inferred) or pa.types.is_floating(inferred) or pa.types.is_decimal(inferred)):
+        # A field holding ints in the first batch may hold floats later
+        return pa.float64()
+    if pa.types.is_decimal(inferred):
+        if decimal is None:
+            return pa.float64()
+        precision, scale = decimal
+        return pa.decimal128(precision, scale) if precision <= 38 else pa.decimal256(precision, scale)
+    return inferred
+
+
+def _decimal_types(description):
+    """(precision, scale) per column of a DB-API cursor description where the driver reports them, else None."""
+    types = []
+    for column in description or ():
+        precision, scale = column[4], column[5]
+        valid = isinstance(precision, int) and isinstance(scale, int) and 0 <= scale <= precision <= 76
+        types.append((precision, scale) if valid and precision > 0 else None)
+    return types
+
+
+class ParquetSink:
+    """
+    Writes each chunk as a row group of a Parquet file; the schema is fixed by the first chunk.
+    Later chunks are only converted to it without loss, anything else fails the export.
+    """
+
+    def __init__(self, path, dynamic=False):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ExportError("Parquet export requires pyarrow (pip install pyarrow).")
+        self.pa = pyarrow
+        self.parquet = pyarrow.parquet
+        self.path = path
+        self.dynamic = dynamic
+        self.writer = None
+        self.schema = None
+        self.columns = []
+        self.rows = 0
+
+    def write(self, columns, rows, decimals=None):
+        """Append a chunk; decimals holds the (precision, scale) of each column when the source knows them."""
+        pa = self.pa
+        self.columns = columns
+        if not rows:
+            return
+        values = [list(column) for column in zip(*rows)]
+        if self.schema is None:
+            decimals = decimals or [None] * len(columns)
+            self.schema = pa.schema([
+                (str(name), _arrow_type(pa, column, decimal, self.dynamic))
+                for name, column, decimal in zip(columns, values, decimals)
+            ])
+            self.writer = self.parquet.ParquetWriter(self.path, self.schema)
+        arrays = []
+        for field, column in zip(self.schema, values):
+            if pa.types.is_string(field.type):
+                column = [None if value is None else str(value) for value in column]
+            try:
+                array = pa.array(column)
+                if array.type != field.type:
+                    # A safe cast: widening is fine, truncating or rescaling raises
+                    array = array.cast(field.type)
+                arrays.append(array)
+            except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError, OverflowError) as e:
+                raise ExportError(f"Column '{field.name}' changes type after row {self.rows:,}: {e}")
+        self.writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+        self.rows += len(rows)
+
+    def close(self):
+        if self.writer is None:
+            # An empty result still produces a readable file with the column names
+            schema = self.pa.schema([(str(name), self.pa.string()) for name in self.columns])
+            self.parquet.write_table(schema.empty_table(), self.path)
+        else:
+            self.writer.close()
+
+
+def _open_sink(fmt, path, dynamic=False):
+    if fmt == "csv":
+        return CsvSink(path)
+    if fmt == "parquet":
+        return ParquetSink(path, dynamic)
+    raise ExportError(f"Unsupported export format '{fmt}', expected one of {', '.join(FORMATS)}.")
+
+
+def export_path(query, fmt, directory=EXPORT_DIR):
+    """A new file name in directory for the export of query."""
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    digest = hashlib.sha256(str(query).encode("utf-8")).hexdigest()[:8]
+    return os.path.join(directory, f"querybuddy-{stamp}-{digest}.{fmt}")
+
+
+def _write(fmt, path, chunks, dynamic=False):
+    """
+    Write (columns, rows, decimals) chunks to path; a partial file is removed when the export fails.
+    dynamic marks sources whose fields have no fixed type (MongoDB).
+    """
+    sink = _open_sink(fmt, path, dynamic)
+    try:
+        for columns, rows, decimals in chunks:
+            sink.write(columns, rows, decimals)
+        sink.close()
+    except BaseException:
+        try:
+            sink.close()
+        except Exception:
+            pass
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    return sink.rows
+
+
+def _sql_chunks(db, query, fetch_size):
+    # SQLAlchemy is only loaded for SQL exports
+    from sqlalchemy import text
+    from sql_executor import _prepare
+    with db._engine.connect() as connection:
+        _prepare(connection, db, EXPORT_STATEMENT_TIMEOUT)
+        # A full export cannot be limited, only rejected
+        guarded = guard_query(connection, db.dialect, query, action="reject")
+        cursor = connection.execution_options(stream_results=True, max_row_buffer=fetch_size).execute(text(guarded))
+        if not cursor.returns_rows:
+            raise ExportError("The query does not return rows.")
+        columns = list(cursor.keys())
+        decimals = None
+        empty = True
+        while True:
+            chunk = cursor.fetchmany(fetch_size)
+            if not chunk:
+                break
+            if empty:
+                # Server-side cursors (psycopg2) only describe their columns once rows were fetched
+                decimals = _decimal_types(cursor.cursor.description)
+            empty = False
+            yield columns, [tuple(row) for row in chunk], decimals
+        cursor.close()
+        if empty:
+            yield columns, [], decimals
+
+
+def export_sql(db, query, fmt, path=None, fetch_size=SQL_FETCH_SIZE):
+    """
+    Stream every row of a read-only SQL query into a CSV or Parquet file and return (path, rows written).
+    Raises QueryBlocked when the planner estimates the query as too expensive.
+    """
+    if not is_read_only(query):
+        raise ExportError("Only read-only queries can be exported.")
+    path = path or export_path(query, fmt)
+    return path, _write(fmt, path, _sql_chunks(db, query, fetch_size))
+
+
+def _mongo_value(value):
+    """Document values as CSV/Parquet friendly scalars."""
+    from bson import Decimal128, ObjectId, json_util
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, Decimal128):
+        return value.to_decimal()
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, default=json_util.default)
+    return value
+
+
+def _mongo_chunks(documents, batch_size):
+    from bson import json_util
+    columns = None
+    while True:
+        batch = list(itertools.islice(documents, batch_size))
+        if not batch:
+            if columns is None:
+                yield [], [], None
+            return
+        flat_docs = [flatten_document(document) for document in batch]
+        if columns is None:
+            # The columns of the file are those of the first batch; later fields are kept as JSON
+            columns = list(dict.fromkeys(column for flat in flat_docs for column in flat))
+            known = set(columns)
+            columns.append(OTHER_FIELDS)
+        rows = []
+        for flat in flat_docs:
+            other = {key: value for key, value in flat.items() if key not in known}
+            row = [_mongo_value(flat.get(column)) for column in columns[:-1]]
+            row.append(json.dumps(other, default=json_util.default) if other else None)
+            rows.append(tuple(row))
+        yield columns, rows, None
+
+
+def export_mongo(db, query, fmt, path=None, batch_size=MONGO_BATCH_SIZE):
+    """Stream every document of a MongoDB query into a CSV or Parquet file and return (path, rows written)."""
+    # bson and pymongo are only loaded for MongoDB databases
+    from mongo_query import MongoQueryError, iter_documents, parse_mongo_query
+    if not is_read_only_mongo(query):
+        raise ExportError("Only read-only queries can be exported.")
+    try:
+        parsed = parse_mongo_query(query)
+    except MongoQueryError as e:
+        raise ExportError(f"The query could not be parsed: {e}")
+    # The export may take much longer than an interactive query
+    max_time_ms = int(EXPORT_STATEMENT_TIMEOUT * 1000) or MONGO_MAX_TIME_MS
+    documents = iter_documents(parsed, db, max_time_ms)
+    path = path or export_path(query, fmt)
+    return path, _write(fmt, path, _mongo_chunks(documents, batch_size), dynamic=True)
+
+
+def export_query(db_type, db, query, fmt, path=None):
+    """Export the full result of query on db to a file, returns (path, rows written)."""
+    # An export may outlast the idle timeout, the connection stays open until it is done
+    with get_registry().lease(db):
+        if db_type.lower() in ("mysql", "postgresql"):
+            return export_sql(db, query, fmt, path)
+        return export_mongo(db, query, fmt, path)
@@ -0,0 +1,93 @@
+import re
+from tokens import count_tokens
+from config import HISTORY_TOKEN_BUDGET, HISTORY_RECENT_MESSAGES
+
+"""
+Prepares the chat history for the prompts within a token budget.
+The last few messages are kept verbatim (without result tables), older turns are folded
+into a short rolling summary of the questions asked and the queries used, so prompt size stays roughly flat.
+"""
+
+QUERY_BLOCK = re.compile(r"```\w*\n(.*?)```", re.DOTALL)
+
+# Longest verbatim message kept in the prompt, in characters
+MAX_MESSAGE_CHARS = 1500
+# Longest question or query kept in a summary line, in characters
+MAX_SUMMARY_CHARS = 160
+
+
+def _role(message):
+    return "Human" if getattr(message, "type", "") == "human" else "AI"
+
+
+def _content(message):
+    return str(getattr(message, "content", message))
+
+
+def strip_tables(text):
+    """Remove markdown tables and the row-count notes under them from a message."""
+    lines = [
+        line for line in text.splitlines()
+        if not line.lstrip().startswith("|") and not line.strip().startswith("_Showing the first")
+    ]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+
+
+def _truncate(text, limit):
+    return text if len(text) <= limit else text[:limit - 3].rstrip() + "..."
+
+
+def _shorten(text, limit):
+    """Single line, at most limit characters."""
+    return _truncate(re.sub(r"\s+", " ", text).strip(), limit)
+
+
+def summarize_turn(message):
+    """One short line for an older message: the question, or the query the answer used."""
+    content = _content(message)
+    if _role(message) == "Human":
+        return f"- Asked: {_shorten(content, MAX_SUMMARY_CHARS)}"
+    match = QUERY_BLOCK.search(content)
+    if match:
+        return f"  Answered with: {_shorten(match.group(1), MAX_SUMMARY_CHARS)}"
+    return f"  Answered: {_shorten(strip_tables(content), MAX_SUMMARY_CHARS)}"
+
+
+def prepare_history(chat_history, question=None, token_budget=HISTORY_TOKEN_BUDGET,
+                    recent_messages=HISTORY_RECENT_MESSAGES):
+    """Render the history as prompt text: rolling summary of older turns, then the recent messages verbatim."""
+    messages = list(chat_history or [])
+    # The current question is passed to the prompt separately
+    if question is not None and messages and _role(messages[-1]) == "Human" \
+            and _content(messages[-1]).strip() == str(question).strip():
+        messages = messages[:-1]
+
+    split = max(len(messages) - recent_messages, 0)
+    older, recent = messages[:split], messages[split:]
+    recent_lines = [
+        f"{_role(message)}: {_truncate(strip_tables(_content(message)), MAX_MESSAGE_CHARS)}"
+        for message in recent
+    ]
+    # Even the recent messages must fit, the oldest of them move to the summary first
+    while len(recent_lines) > 1 and sum(count_tokens(line) for line in recent_lines) > token_budget:
+        recent_lines.pop(0)
+        older.append(recent.pop(0))
+    used = sum(count_tokens(line) for line in recent_lines)
+
+    # Newest older turns first, until the budget is used up
+    summary_lines = []
+    for message in reversed(older):
+        line = summarize_turn(message)
+        cost = count_tokens(line)
+        if used + cost > token_budget:
+            break
+        summary_lines.append(line)
+        used += cost
+    summary_lines.reverse()
+
+    parts = []
+    if summary_lines:
+        parts.append("Summary of earlier conversation:\n" + "\n".join(summary_lines))
+    if recent_lines:
+        parts.append("\n".join(recent_lines))
+    return "\n\n".join(parts)
@@ -0,0 +1,189 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.rate_limiters import InMemoryRateLimiter
+from config import (
+    LLM_BACKEND, LLM_MODEL, SUMMARY_MODEL, LLM_TEMPERATURE, LLM_REQUEST_TIMEOUT,
+    LLM_RECORD_PATH, FAKE_LLM_RECORDINGS, FAKE_LLM_FIRST_TOKEN_LATENCY, FAKE_LLM_TOKEN_LATENCY,
+    LLM_REQUESTS_PER_SECOND,
+)
+
+"""
+Single place where LLM clients are built. Clients are created once per backend/model and reused,
+so their HTTP connections are kept alive across questions.
+The "fake" backend answers offline from recordings or simple rules with configurable latency,
+for load tests and benchmarks.
+"""
+
+
+def prompt_text(messages):
+    """The text of a prompt as sent to the model."""
+    return "\n".join(str(message.content) for message in messages)
+
+
+def prompt_key(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def load_recordings(path):
+    """Read {prompt hash: response} from a JSONL file of {"prompt_sha256": ..., "response": ...} lines."""
+    recordings = {}
+    if path and os.path.exists(path):
+        with open(path, encoding="utf-8") as file:
+            for line in file:
+                if line.strip():
+                    record = json.loads(line)
+                    recordings[record["prompt_sha256"]] = record["response"]
+    return recordings
+
+
+def rule_based_response(prompt):
+    """Deterministic stand-in answers for the three kinds of prompts QueryBuddy sends."""
+    if prompt.rstrip().endswith("SQL Query:"):
+        match = re.search(r"CREATE TABLE [`\"]?(\w+)", prompt)
+        return f"SELECT * FROM {match.group(1) if match else 'information_schema.tables'} LIMIT 10"
+    if prompt.rstrip().endswith("MongoDB Query:"):
+        match = re.search(r"Collection: (\S+)", prompt)
+        return f'db.{match.group(1) if match else "test"}.find({{}}).limit(10)'
+    if prompt.rstrip().endswith("Corrected Query:"):
+        dialect = re.search(r"The (SQL|MongoDB) query below", prompt)
+        return rule_based_response(prompt.rstrip()[:-len("Corrected Query:")] + f"{dialect.group(1) if dialect else 'SQL'} Query:")
+    rows = re.search(r"Query Results: (.*?)\n\s*User Question:", prompt, re.DOTALL)
+    size = len(rows.group(1)) if rows else 0
+    return f"The query returned {size} characters of results. This summary was produced by the offline stand-in model."
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Offline chat model: replays recorded responses by prompt hash, falls back to rule_based_response.
+    Sleeps first_token_latency before answering and token_latency per streamed word.
+    """
+
+    recordings: Dict[str, str] = {}
+    first_token_latency: float = 0.0
+    token_latency: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "querybuddy-fake"
+
+    def _respond(self, messages: List[BaseMessage]) -> str:
+        prompt = prompt_text(messages)
+        return self.recordings.get(prompt_key(prompt)) or rule_based_response(prompt)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        text = self._respond(messages)
+        time.sleep(self.first_token_latency + self.token_latency * len(text.split()))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        text = self._respond(messages)
+        time.sleep(self.first_token_latency)
+        for word in re.findall(r"\S+\s*", text):
+            if self.token_latency:
+                time.sleep(self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word))
+            if run_manager is not None:
+                run_manager.on_llm_new_token(word, chunk=chunk)
+            yield chunk
+
+
+class RecordingHandler(BaseCallbackHandler):
+    """Appends every prompt hash and final response to a JSONL file, to be replayed by FakeChatModel."""
+
+    def __init__(self, path):
+        self.path = path
+        self._prompts = {}
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._prompts[run_id] = prompt_text(messages[0])
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        prompt = self._prompts.pop(run_id, None)
+        if prompt is None:
+            return
+        text = "".join(generation.text for generation in response.generations[0])
+        with self._lock, open(self.path, "a", encoding="utf-8") as file:
+            file.write(json.dumps({"prompt_sha256": prompt_key(prompt), "response": text}) + "\n")
+
+
+def rate_limiter(requests_per_second):
+    """Token bucket shared by all clients, None for no limit."""
+    if not requests_per_second:
+        return None
+    return InMemoryRateLimiter(
+        requests_per_second=requests_per_second,
+        check_every_n_seconds=min(0.1, 1 / requests_per_second),
+        max_bucket_size=max(1, requests_per_second),
+    )
+
+
+_rate_limiter = rate_limiter(LLM_REQUESTS_PER_SECOND)
+
+
+def _build(backend, model):
+    if backend == "fake":
+        return FakeChatModel(
+            recordings=load_recordings(FAKE_LLM_RECORDINGS),
+            first_token_latency=FAKE_LLM_FIRST_TOKEN_LATENCY,
+            token_latency=FAKE_LLM_TOKEN_LATENCY,
+            rate_limiter=_rate_limiter,
+        )
+    if backend == "groq":
+        from langchain_groq import ChatGroq
+        callbacks = [RecordingHandler(LLM_RECORD_PATH)] if LLM_RECORD_PATH else None
+        return ChatGroq(
+            api_key=os.getenv("GROQ_API_KEY"),
+            model=model,
+            temperature=LLM_TEMPERATURE,
+            timeout=LLM_REQUEST_TIMEOUT,
+            callbacks=callbacks,
+            rate_limiter=_rate_limiter,
+        )
+    raise ValueError(f"Unknown LLM backend: {backend}")
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_llm(purpose="query"):
+    """The shared chat model for a purpose ("query" or "summary"), built on first use."""
+    model = SUMMARY_MODEL if purpose == "summary" and SUMMARY_MODEL else LLM_MODEL
+    key = (LLM_BACKEND, model)
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = _build(LLM_BACKEND, model)
+        return _clients[key]
+
+
+def set_llm(llm, purpose=None):
+    """Replace the shared client(s), e.g. with a FakeChatModel in benchmarks and tests."""
+    with _clients_lock:
+        if purpose is None:
+            _clients.clear()
+            _clients[(LLM_BACKEND, LLM_MODEL)] = llm
+            if SUMMARY_MODEL:
+                _clients[(LLM_BACKEND, SUMMARY_MODEL)] = llm
+        else:
+            model = SUMMARY_MODEL if purpose == "summary" and SUMMARY_MODEL else LLM_MODEL
+            _clients[(LLM_BACKEND, model)] = llm
+
+
+def set_rate_limit(requests_per_second):
+    """Limit LLM requests across all clients of the process, e.g. for batch runs (0 = no limit)."""
+    global _rate_limiter
+    with _clients_lock:
+        _rate_limiter = rate_limiter(requests_per_second)
+        for client in _clients.values():
+            client.rate_limiter = _rate_limiter
@@ -0,0 +1,280 @@
+import itertools
+import re
+from bson import json_util
+from result_table import mongo_result, table_record
+from result_profile import ResultProfiler
+from config import MAX_DISPLAY_ROWS, MONGO_BATCH_SIZE, MONGO_MAX_TIME_MS, MONGO_ALLOW_DISK_USE, PROFILE_MAX_ROWS
+
+"""
+Parses generated MongoDB shell queries such as db.<coll>.find(...).sort(...).skip(...).limit(...)
+and maps them onto pymongo cursor methods, so sorting, skipping, limiting and projection happen on the server.
+"""
+
+# pymongo.ASCENDING / pymongo.DESCENDING, without importing the driver for two constants
+ASCENDING, DESCENDING = 1, -1
+
+METHODS = {"find", "findOne", "aggregate", "countDocuments", "count", "distinct"}
+MODIFIERS = {"sort", "skip", "limit", "project", "projection"}
+
+
+class MongoQueryError(ValueError):
+    """The generated text is not a MongoDB query this parser understands."""
+
+
+class MongoQuery:
+    """A parsed query: target collection, method, its arguments and the chained cursor modifiers."""
+
+    def __init__(self, collection, method, args, modifiers):
+        self.collection = collection
+        self.method = method
+        self.args = args
+        self.modifiers = modifiers  # list of (name, args) in call order
+
+    def modifier(self, name, default=None):
+        """Arguments of the last call to a modifier, e.g. modifier("limit") -> [10]."""
+        for modifier_name, args in reversed(self.modifiers):
+            if modifier_name == name:
+                return args
+        return default
+
+
+def _closing_index(text, start):
+    """Index of the bracket closing the one at text[start], skipping string literals."""
+    pairs = {"(": ")", "[": "]", "{": "}"}
+    stack = [pairs[text[start]]]
+    quote = None
+    i = start + 1
+    while i < len(text):
+        char = text[i]
+        if quote:
+            if char == "\\":
+                i += 1
+            elif char == quote:
+                quote = None
+        elif char in "\"'":
+            quote = char
+        elif char in pairs:
+            stack.append(pairs[char])
+        elif char in ")]}":
+            if char != stack.pop():
+                raise MongoQueryError(f"Unbalanced brackets at position {i}")
+            if not stack:
+                return i
+        i += 1
+    raise MongoQueryError("Unbalanced brackets")
+
+
+def _parse_args(text):
+    """Parse the argument list of a call as (extended) JSON values."""
+    text = text.strip()
+    if not text:
+        return []
+    # Recovering from the "find({}.project({...}).limit(n))" form: the modifiers ended up inside find()
+    inner_chain = []
+    if text[0] in "{[":
+        end = _closing_index(text, 0)
+        rest = text[end + 1:].lstrip()
+        if rest.startswith("."):
+            inner_chain = _parse_chain(rest)
+            text = text[:end + 1]
+    try:
+        args = json_util.loads(f"[{text}]")
+    except ValueError as e:
+        raise MongoQueryError(f"Arguments are not valid JSON: {e}")
+    if inner_chain:
+        args.append(_Chain(inner_chain))
+    return args
+
+
+class _Chain(list):
+    """Modifiers found inside the argument list of the main method."""
+
+
+def _parse_chain(text):
+    """Parse ".name(args).name(args)..." into a list of (name, args)."""
+    calls = []
+    position = 0
+    text = text.strip()
+    while position < len(text):
+        match = re.compile(r"\s*\.\s*(\w+)\s*\(").match(text, position)
+        if not match:
+            if text[position:].strip(" ;\n\t\r"):
+                raise MongoQueryError(f"Unexpected text: {text[position:]}")
+            break
+        open_index = match.end() - 1
+        close_index = _closing_index(text, open_index)
+        calls.append((match.group(1), _parse_args(text[open_index + 1:close_index])))
+        position = close_index + 1
+    return calls
+
+
+def parse_mongo_query(text):
+    """Parse a generated query into a MongoQuery."""
+    text = str(text).strip().strip("`").strip()
+    match = re.search(r"db\s*\.\s*(?:getCollection\(\s*[\"']([^\"']+)[\"']\s*\)|(\w+))", text)
+    if not match:
+        raise MongoQueryError("No db.<collection> found in the query")
+    collection = match.group(1) or match.group(2)
+    calls = _parse_chain(text[match.end():])
+    if not calls or calls[0][0] not in METHODS:
+        raise MongoQueryError(f"Unsupported query method, expected one of {', '.join(sorted(METHODS))}")
+    method, args = calls[0]
+    modifiers = []
+    if args and isinstance(args[-1], _Chain):
+        modifiers.extend(args.pop())
+    modifiers.extend(calls[1:])
+    for name, _ in modifiers:
+        if name not in MODIFIERS:
+            raise MongoQueryError(f"Unsupported cursor method .{name}()")
+    return MongoQuery(collection, method, args, modifiers)
+
+
+def _sort_spec(args):
+    """{"a": 1, "b": -1} -> [("a", ASCENDING), ("b", DESCENDING)]."""
+    spec = args[0] if args else {}
+    return [(field, DESCENDING if direction in (-1, "-1", "desc", "descending") else ASCENDING)
+            for field, direction in spec.items()]
+
+
+def _projection(parsed):
+    args = parsed.args
+    projection = args[1] if len(args) > 1 else None
+    if parsed.modifier("project") or parsed.modifier("projection"):
+        projection = (parsed.modifier("project") or parsed.modifier("projection"))[0]
+    return projection or None
+
+
+def _find_cursor(parsed, collection, max_time_ms):
+    """find() cursor with the chained sort/skip applied (the limit is left to the caller)."""
+    query_filter = parsed.args[0] if parsed.args else {}
+    cursor = collection.find(query_filter, _projection(parsed), batch_size=MONGO_BATCH_SIZE)
+    cursor = cursor.max_time_ms(max_time_ms)
+    if parsed.modifier("sort"):
+        cursor = cursor.sort(_sort_spec(parsed.modifier("sort")))
+    skip = int(parsed.modifier("skip", [0])[0])
+    if skip:
+        cursor = cursor.skip(skip)
+    return cursor
+
+
+def _aggregate_pipeline(parsed):
+    """The pipeline of an aggregate() call, with shell-style chained modifiers as extra stages."""
+    pipeline = list(parsed.args[0]) if parsed.args else []
+    for name, modifier_args in parsed.modifiers:
+        if name == "sort":
+            pipeline.append({"$sort": dict(_sort_spec(modifier_args))})
+        elif name == "skip":
+            pipeline.append({"$skip": int(modifier_args[0])})
+        elif name == "limit":
+            pipeline.append({"$limit": int(modifier_args[0])})
+        else:
+            pipeline.append({"$project": modifier_args[0]})
+    return pipeline
+
+
+def _read_documents(cursor, max_rows, read_limit):
+    """
+    Read up to read_limit + 1 documents batch by batch, keeping the first max_rows + 1 and profiling
+    the first read_limit. Returns (kept documents, documents read, profiler).
+    """
+    profiler = ResultProfiler()
+    documents = []
+    read = 0
+    cursor = iter(cursor)
+    while True:
+        batch = list(itertools.islice(cursor, MONGO_BATCH_SIZE))
+        if not batch:
+            break
+        profiler.update_records([table_record(document) for document in batch[:max(read_limit - read, 0)]])
+        if len(documents) <= max_rows:
+            documents.extend(batch[:max_rows + 1 - len(documents)])
+        read += len(batch)
+    return documents, read, profiler
+
+
+def _profiled(result, profiler):
+    result.profile = profiler.profile(result.total_rows)
+    return result
+
+
+def execute_mongo_query(parsed, db, max_rows=MAX_DISPLAY_ROWS, profile_rows=PROFILE_MAX_ROWS):
+    """
+    Run a parsed query with the reduction pushed to the server and return a QueryResult.
+    At most max_rows documents are kept; up to profile_rows are read for the result profile. When more
+    match, the total is counted on the server (find) or reported as unknown (aggregate).
+    """
+    collection = db[parsed.collection]
+    read_limit = max(max_rows, profile_rows)
+    method = parsed.method
+    args = parsed.args
+
+    if method in ("find", "findOne"):
+        query_filter = args[0] if args else {}
+        if method == "findOne":
+            document = collection.find_one(query_filter, _projection(parsed), max_time_ms=MONGO_MAX_TIME_MS)
+            return mongo_result([document] if document else [])
+
+        cursor = _find_cursor(parsed, collection, MONGO_MAX_TIME_MS)
+        skip = int(parsed.modifier("skip", [0])[0])
+        limit = int(parsed.modifier("limit", [0])[0])
+        # Asking for one extra document tells whether the result is larger than what is read
+        fetch = min(limit, read_limit + 1) if limit else read_limit + 1
+        documents, read, profiler = _read_documents(cursor.limit(fetch), max_rows, read_limit)
+        if read <= read_limit:
+            return _profiled(mongo_result(documents[:max_rows], read), profiler)
+        total = collection.count_documents(query_filter, skip=skip, maxTimeMS=MONGO_MAX_TIME_MS)
+        if limit:
+            total = min(total, limit)
+        return _profiled(mongo_result(documents[:max_rows], total), profiler)
+
+    if method == "aggregate":
+        pipeline = _aggregate_pipeline(parsed)
+        writes = bool(pipeline) and any(stage in pipeline[-1] for stage in ("$out", "$merge"))
+        if not writes:
+            pipeline.append({"$limit": read_limit + 1})
+        cursor = collection.aggregate(
+            pipeline,
+            allowDiskUse=MONGO_ALLOW_DISK_USE,
+            maxTimeMS=MONGO_MAX_TIME_MS,
+            batchSize=MONGO_BATCH_SIZE,
+        )
+        documents, read, profiler = _read_documents(cursor, max_rows, read_limit)
+        return _profiled(mongo_result(documents[:max_rows], read if read <= read_limit else None), profiler)
+
+    if method in ("countDocuments", "count"):
+        count = collection.count_documents(args[0] if args else {}, maxTimeMS=MONGO_MAX_TIME_MS)
+        return mongo_result([{"count": count}])
+
+    # distinct(field, filter)
+    field = args[0]
+    values = collection.distinct(field, args[1] if len(args) > 1 else None, maxTimeMS=MONGO_MAX_TIME_MS)
+    return mongo_result([{field: value} for value in values[:max_rows]], len(values))
+
+
+def iter_documents(parsed, db, max_time_ms=MONGO_MAX_TIME_MS):
+    """
+    All documents of a parsed query, fetched lazily in batches of MONGO_BATCH_SIZE (no display cap).
+    Used for exports, so memory stays bounded by the batch size.
+    """
+    collection = db[parsed.collection]
+    method = parsed.method
+    args = parsed.args
+    if method == "find":
+        cursor = _find_cursor(parsed, collection, max_time_ms)
+        limit = int(parsed.modifier("limit", [0])[0])
+        return iter(cursor.limit(limit) if limit else cursor)
+    if method == "aggregate":
+        return iter(collection.aggregate(
+            _aggregate_pipeline(parsed),
+            allowDiskUse=MONGO_ALLOW_DISK_USE,
+            maxTimeMS=max_time_ms,
+            batchSize=MONGO_BATCH_SIZE,
+        ))
+    if method == "findOne":
+        document = collection.find_one(args[0] if args else {}, _projection(parsed), max_time_ms=max_time_ms)
+        return iter([document] if document else [])
+    if method in ("countDocuments", "count"):
+        return iter([{"count": collection.count_documents(args[0] if args else {}, maxTimeMS=max_time_ms)}])
+    field = args[0]
+    values = collection.distinct(field, args[1] if len(args) > 1 else None, maxTimeMS=max_time_ms)
+    return iter({field: value} for value in values)
@@ -0,0 +1,147 @@
+import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from bson import ObjectId, Decimal128
+from datetime import datetime
+from result_cache import connection_identity
+from config import MONGO_SCHEMA_SAMPLE_SIZE, MONGO_SCHEMA_TTL, MONGO_SCHEMA_WORKERS
+
+"""
+Infers a compact schema for each MongoDB collection from a random $sample of documents:
+field path -> observed types and how often the field is present, including nested paths and arrays.
+Collections are sampled concurrently and the result is cached per database.
+"""
+
+logger = logging.getLogger(__name__)
+
+# Separate pool: schema inference itself runs on a pipeline stage worker
+_executor = ThreadPoolExecutor(max_workers=MONGO_SCHEMA_WORKERS, thread_name_prefix="querybuddy-mongo-schema")
+
+
+def type_name(value):
+    """BSON-style type name of a value."""
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, int):
+        return "int"
+    if isinstance(value, float):
+        return "double"
+    if isinstance(value, str):
+        return "string"
+    if isinstance(value, dict):
+        return "object"
+    if isinstance(value, list):
+        return "array"
+    if isinstance(value, ObjectId):
+        return "objectId"
+    if isinstance(value, datetime):
+        return "date"
+    if isinstance(value, Decimal128):
+        return "decimal"
+    return type(value).__name__
+
+
+def _collect(value, path, types, presence, seen):
+    types.setdefault(path, Counter())[type_name(value)] += 1
+    if path not in seen:
+        seen.add(path)
+        presence[path] += 1
+    if isinstance(value, dict):
+        for key, child in value.items():
+            _collect(child, f"{path}.{key}", types, presence, seen)
+    elif isinstance(value, list):
+        for item in value:
+            _collect(item, f"{path}[]", types, presence, seen)
+
+
+def infer_fields(documents):
+    """
+    Merge documents into {path: (Counter of types, number of documents containing the path)}.
+    Array elements are recorded under "path[]", fields of embedded documents under "path.field".
+    """
+    types = {}
+    presence = Counter()
+    for document in documents:
+        seen = set()
+        for key, value in document.items():
+            _collect(value, key, types, presence, seen)
+    return {path: (types[path], presence[path]) for path in types}
+
+
+def describe_fields(name, fields, sampled, estimated_count):
+    """Render the inferred fields of one collection as a few compact lines for the prompt."""
+    if not sampled:
+        return f"Collection: {name} (empty)"
+    lines = [f"Collection: {name} (~{estimated_count:,} documents, {sampled} sampled)"]
+    for path in sorted(fields):
+        type_counts, present = fields[path]
+        total = sum(type_counts.values())
+        if len(type_counts) == 1:
+            kinds = next(iter(type_counts))
+        else:
+            kinds = ", ".join(f"{kind} {count / total:.0%}" for kind, count in type_counts.most_common())
+        lines.append(f"  {path}: {kinds} ({present / sampled:.0%})")
+    return "\n".join(lines)
+
+
+def sample_collection(db, name, sample_size=MONGO_SCHEMA_SAMPLE_SIZE):
+    """Sample one collection and return its description."""
+    collection = db[name]
+    documents = list(collection.aggregate([{"$sample": {"size": sample_size}}]))
+    estimated_count = collection.estimated_document_count() if documents else 0
+    return describe_fields(name, infer_fields(documents), len(documents), estimated_count)
+
+
+def infer_mongo_schema(db, sample_size=MONGO_SCHEMA_SAMPLE_SIZE):
+    """
+    Sample all collections concurrently, returns {collection: description}.
+    A collection that cannot be sampled (e.g. no read permission, a view that fails) is described as unavailable.
+    """
+    names = sorted(db.list_collection_names())
+    futures = {name: _executor.submit(sample_collection, db, name, sample_size) for name in names}
+    descriptions = {}
+    for name, future in futures.items():
+        try:
+            descriptions[name] = future.result()
+        except Exception as e:
+            logger.warning("Could not sample collection %s: %s: %s", name, type(e).__name__, e)
+            descriptions[name] = f"Collection: {name} (unavailable)"
+    return descriptions
+
+
+# Cached schemas per database: identity -> (descriptions, built_at)
+_schemas = {}
+# One rebuild per database at a time: identity -> lock
+_rebuilds = {}
+_schemas_lock = threading.Lock()
+
+def get_mongo_schema(db, refresh=False):
+    """
+    The cached {collection: description} of db, rebuilt when older than MONGO_SCHEMA_TTL or on refresh.
+    Concurrent callers wait for a rebuild in progress and share its result instead of sampling again.
+    """
+    key = (connection_identity(db), db.name)
+    requested = time.monotonic()
+    with _schemas_lock:
+        cached = _schemas.get(key)
+        rebuild = _rebuilds.setdefault(key, threading.Lock())
+    if cached is not None and not refresh and requested - cached[1] < MONGO_SCHEMA_TTL:
+        return cached[0]
+    with rebuild:
+        with _schemas_lock:
+            cached = _schemas.get(key)
+        # Built by another caller while this one waited
+        if cached is not None and cached[1] >= requested:
+            return cached[0]
+        descriptions = infer_mongo_schema(db)
+        with _schemas_lock:
+            _schemas[key] = (descriptions, time.monotonic())
+    return descriptions
+
+def refresh_mongo_schema(db):
+    """Re-sample db right away, e.g. after collections changed."""
+    return get_mongo_schema(db, refresh=True)
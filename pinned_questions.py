@@ -0,0 +1,402 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from query_cache import normalize_question, is_follow_up, previous_question
+from result_cache import get_result_cache, connection_identity, is_read_only, is_read_only_mongo, sql_tables, mongo_collections
+from example_store import example_scope
+from connection_registry import get_registry
+from stage_runner import run_stage
+from telemetry import Trace
+from nl_format import format_nl_response
+from config import (
+    DATA_DIR, PINNED_ENABLED, PINNED_REFRESH_INTERVAL, PINNED_SCHEDULER_INTERVAL, PINNED_MAX_AGE, PINNED_MAX_PER_DB,
+    EXECUTION_TIMEOUT, SUMMARY_TIMEOUT,
+)
+
+"""
+Pinned questions: recurring questions whose generated query is stored and re-executed in the background, so every
+viewer is served the latest result snapshot and summary instead of running the pipeline.
+A scheduler thread checks each pin on its interval and refreshes it only when the statistics of the tables it reads
+have changed (or when the snapshot is older than PINNED_MAX_AGE). Pins are refreshed on the pooled connections open
+in this process; no credentials are stored.
+"""
+
+# Per-table change counters, one row per table; :tables is expanded to the referenced tables
+DATA_VERSION_QUERIES = {
+    "postgresql": """
+        SELECT relname, n_tup_ins, n_tup_upd, n_tup_del, n_live_tup FROM pg_stat_user_tables
+        WHERE schemaname = COALESCE(:schema, current_schema()) AND relname IN :tables ORDER BY relname
+    """,
+    "mysql": """
+        SELECT LOWER(TABLE_NAME), UPDATE_TIME, TABLE_ROWS, DATA_LENGTH FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = COALESCE(:schema, DATABASE()) AND LOWER(TABLE_NAME) IN :tables ORDER BY TABLE_NAME
+    """,
+}
+
+# Choices offered for the refresh interval, in minutes (the configured default included)
+INTERVAL_CHOICES = sorted({5, 15, 60, 360, 1440, PINNED_REFRESH_INTERVAL / 60})
+
+
+class PinError(Exception):
+    """A question that cannot be pinned (a write statement, or too many pins)."""
+
+
+def _sql_version(db, tables):
+    from sqlalchemy import bindparam, text
+    engine = db._engine
+    query = DATA_VERSION_QUERIES.get(engine.dialect.name)
+    if query is None:
+        return None
+    with engine.connect() as connection:
+        if engine.dialect.name == "mysql":
+            # MySQL 8 caches these statistics for a day by default
+            try:
+                connection.exec_driver_sql("SET SESSION information_schema_stats_expiry = 0")
+            except Exception:
+                pass
+        statement = text(query).bindparams(bindparam("tables", expanding=True))
+        rows = connection.execute(statement, {"schema": db._schema, "tables": sorted(tables)}).fetchall()
+    return [tuple(row) for row in rows]
+
+
+def data_version(db_type, db, tables):
+    """
+    A token that changes when the data of tables changes, from the table statistics of the database, or None when
+    it cannot be told (MongoDB, unsupported dialects, views, missing permissions): such pins are refreshed on every
+    interval. MongoDB has no per-collection write counter; document counts and sizes miss in-place updates.
+    """
+    if not tables or db_type.lower() == "mongodb":
+        return None
+    try:
+        rows = _sql_version(db, tables)
+    except Exception:
+        return None
+    # A table without statistics (e.g. a view) leaves its changes unseen
+    if rows is None or len(rows) != len(tables):
+        return None
+    return hashlib.sha256(repr(rows).encode("utf-8")).hexdigest()
+
+
+class PinStore:
+    """
+    SQLite-backed pins and their latest snapshot, shared by every session and process using the same data directory.
+    """
+
+    COLUMNS = (
+        "id", "scope", "db_type", "question", "query", "tables", "interval", "created_at", "version", "summary",
+        "markdown", "rows", "refreshed_at", "checked_at", "next_check_at", "error",
+    )
+
+    def __init__(self, path, max_per_scope=PINNED_MAX_PER_DB):
+        self.path = path
+        self.max_per_scope = max_per_scope
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS pins (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    scope TEXT NOT NULL,
+                    db_type TEXT NOT NULL,
+                    question TEXT NOT NULL,
+                    normalized TEXT NOT NULL,
+                    query TEXT NOT NULL,
+                    tables TEXT NOT NULL,
+                    interval REAL NOT NULL,
+                    created_at REAL NOT NULL,
+                    version TEXT,
+                    summary TEXT NOT NULL,
+                    markdown TEXT NOT NULL,
+                    rows INTEGER,
+                    refreshed_at REAL NOT NULL,
+                    checked_at REAL NOT NULL,
+                    next_check_at REAL NOT NULL,
+                    error TEXT,
+                    UNIQUE (scope, normalized)
+                )
+            """)
+            connection.execute("CREATE INDEX IF NOT EXISTS pins_next_check ON pins (scope, next_check_at)")
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=10)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def _select(self, connection, where, params):
+        rows = connection.execute(f"SELECT {', '.join(self.COLUMNS)} FROM pins WHERE {where} ORDER BY id", params)
+        pins = [dict(zip(self.COLUMNS, row)) for row in rows]
+        for pin in pins:
+            pin["tables"] = json.loads(pin["tables"])
+        return pins
+
+    def pin(self, scope, db_type, question, query, tables, snapshot, version=None, interval=PINNED_REFRESH_INTERVAL):
+        """
+        Pin question (replacing the pin of the same question) with its answer as the first snapshot;
+        snapshot is (summary, markdown table, row count or None). Returns the pin id.
+        """
+        now = time.time()
+        summary, markdown, rows = snapshot
+        with self._lock, self._connect() as connection:
+            count = connection.execute(
+                "SELECT COUNT(*) FROM pins WHERE scope = ? AND normalized != ?", (scope, normalize_question(question))
+            ).fetchone()[0]
+            if count >= self.max_per_scope:
+                raise PinError(f"At most {self.max_per_scope} questions can be pinned per database.")
+            return connection.execute(
+                "INSERT INTO pins (scope, db_type, question, normalized, query, tables, interval, created_at, version, "
+                "summary, markdown, rows, refreshed_at, checked_at, next_check_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (scope, normalized) DO UPDATE SET question = excluded.question, query = excluded.query, "
+                "tables = excluded.tables, interval = excluded.interval, version = excluded.version, "
+                "summary = excluded.summary, markdown = excluded.markdown, rows = excluded.rows, "
+                "refreshed_at = excluded.refreshed_at, checked_at = excluded.checked_at, "
+                "next_check_at = excluded.next_check_at, error = NULL "
+                "RETURNING id",
+                (scope, db_type.lower(), question, normalize_question(question), query, json.dumps(sorted(tables)),
+                 interval, now, version, summary, markdown, rows, now, now, now + interval),
+            ).fetchone()[0]
+
+    def unpin(self, pin_id):
+        with self._lock, self._connect() as connection:
+            connection.execute("DELETE FROM pins WHERE id = ?", (pin_id,))
+
+    def get(self, pin_id):
+        with self._lock, self._connect() as connection:
+            pins = self._select(connection, "id = ?", (pin_id,))
+        return pins[0] if pins else None
+
+    def pins(self, scope):
+        """The pins of one database, oldest first."""
+        with self._lock, self._connect() as connection:
+            return self._select(connection, "scope = ?", (scope,))
+
+    def find(self, scope, question):
+        """The pin of question on this database, or None."""
+        with self._lock, self._connect() as connection:
+            pins = self._select(connection, "scope = ? AND normalized = ?", (scope, normalize_question(question)))
+        return pins[0] if pins else None
+
+    def due(self, scope, now=None):
+        """The pins of one database whose next check is due."""
+        now = time.time() if now is None else now
+        with self._lock, self._connect() as connection:
+            return self._select(connection, "scope = ? AND next_check_at <= ?", (scope, now))
+
+    def claim(self, pin, next_check_at):
+        """
+        Move the next check of a due pin to next_check_at; False if another thread or process claimed it first.
+        """
+        with self._lock, self._connect() as connection:
+            return connection.execute(
+                "UPDATE pins SET next_check_at = ? WHERE id = ? AND next_check_at = ?",
+                (next_check_at, pin["id"], pin["next_check_at"]),
+            ).rowcount == 1
+
+    def update(self, pin_id, **fields):
+        """Store the outcome of a check or refresh (version, snapshot, timestamps, error)."""
+        with self._lock, self._connect() as connection:
+            connection.execute(
+                f"UPDATE pins SET {', '.join(f'{name} = ?' for name in fields)} WHERE id = ?",
+                (*fields.values(), pin_id),
+            )
+
+    def clear(self):
+        with self._lock, self._connect() as connection:
+            connection.execute("DELETE FROM pins")
+
+    def stats(self):
+        with self._lock, self._connect() as connection:
+            return {"pins": connection.execute("SELECT COUNT(*) FROM pins").fetchone()[0]}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_pin_store():
+    """The process-wide pin store, or None when disabled."""
+    global _store
+    if not PINNED_ENABLED:
+        return None
+    with _store_lock:
+        if _store is None:
+            _store = PinStore(os.path.join(DATA_DIR, "pins.sqlite3"))
+        return _store
+
+
+def referenced_tables(db_type, query):
+    if db_type.lower() == "mongodb":
+        return mongo_collections(query)
+    return sql_tables(query)
+
+
+def pin_answer(db_type, db, question, query, summary, markdown, rows, interval=PINNED_REFRESH_INTERVAL):
+    """Pin an answered question with its answer as the first snapshot. Returns the pin id."""
+    store = get_pin_store()
+    if store is None:
+        raise PinError("Pinned questions are disabled.")
+    read_only = is_read_only_mongo(query) if db_type.lower() == "mongodb" else is_read_only(query)
+    if not read_only:
+        raise PinError("Only read-only queries can be pinned.")
+    tables = referenced_tables(db_type, query)
+    return store.pin(
+        example_scope(db), db_type, question, query, tables, (summary, markdown, rows),
+        data_version(db_type, db, tables), interval,
+    )
+
+
+def database_pins(db):
+    """The pins of the database behind db, oldest first."""
+    store = get_pin_store()
+    return store.pins(example_scope(db)) if store is not None else []
+
+
+def pinned_answer(db, question, chat_history):
+    """
+    The pin answering question on this database, so the question is served from its snapshot;
+    None when nothing is pinned or the question depends on the earlier turns.
+    """
+    store = get_pin_store()
+    if store is None or (is_follow_up(question) and previous_question(chat_history, question)):
+        return None
+    return store.find(example_scope(db), question)
+
+
+def snapshot_events(pin):
+    """The snapshot of a pin as the (event, value) pairs of query_generate.stream_response."""
+    yield "pinned", pin
+    yield "query", pin["query"]
+    yield "table", pin["markdown"]
+    yield "token", pin["summary"]
+
+
+def _ago(seconds):
+    if seconds < 90:
+        return "just now" if seconds < 10 else f"{seconds:.0f} s ago"
+    if seconds < 5400:
+        return f"{seconds / 60:.0f} min ago"
+    if seconds < 129600:
+        return f"{seconds / 3600:.0f} h ago"
+    return f"{seconds / 86400:.0f} days ago"
+
+
+def staleness(pin, now=None):
+    """How old the snapshot of a pin is and when the data was last checked, as one line."""
+    now = time.time() if now is None else now
+    text = (f"Snapshot from {_ago(now - pin['refreshed_at'])}, data checked {_ago(now - pin['checked_at'])}, "
+            f"checked every {pin['interval'] / 60:g} min")
+    if pin["error"]:
+        text += f". Last refresh failed: {pin['error']}"
+    return text
+
+
+def refresh_pin(pin, db, force=False):
+    """
+    Check a pin and re-run its query when the tables it reads have changed (always when force is set, or when the
+    change cannot be told). The new result, its summary and the table version become the snapshot.
+    Returns True if the snapshot was refreshed.
+    """
+    # The query pipeline is imported by the first refresh, not at startup
+    from query_generate import is_sql, run_mongodb_query, fetch_schema, get_summary_chain
+    from sql_executor import execute_sql
+    from result_table import to_markdown, prompt_data
+
+    store = get_pin_store()
+    trace = Trace()
+    with trace.span("pin_refresh") as span:
+        now = time.time()
+        next_check_at = now + pin["interval"]
+        version = data_version(pin["db_type"], db, pin["tables"])
+        unchanged = version is not None and version == pin["version"] and now - pin["refreshed_at"] < PINNED_MAX_AGE
+        if unchanged and not force:
+            store.update(pin["id"], checked_at=now, next_check_at=next_check_at)
+            span.set(refreshed=0)
+            return False
+        try:
+            if is_sql(pin["db_type"]):
+                result = run_stage("Query execution", EXECUTION_TIMEOUT, execute_sql, db, pin["query"])
+            else:
+                result = run_stage("Query execution", EXECUTION_TIMEOUT, run_mongodb_query, pin["query"], db)
+            # Results of these tables cached before the change are stale as well
+            cache = get_result_cache()
+            if cache is not None:
+                identity = connection_identity(db)
+                cache.invalidate(identity, pin["tables"])
+                cache.put(identity, pin["query"], result, pin["tables"])
+            summary = run_stage("Summary generation", SUMMARY_TIMEOUT, get_summary_chain(pin["db_type"]).invoke, {
+                "schema": fetch_schema(pin["db_type"], db, pin["question"]),
+                "query": pin["query"],
+                "response": prompt_data(result),
+                "question": pin["question"],
+            })
+        except Exception as e:
+            # The previous snapshot keeps being served, marked with the error
+            store.update(pin["id"], checked_at=now, next_check_at=next_check_at, error=str(e) or type(e).__name__)
+            raise
+        markdown = to_markdown(result)
+        total_rows = result.total_rows if result.total_rows is not None else len(result.rows)
+        store.update(
+            pin["id"], version=version, summary=format_nl_response(summary), markdown=markdown, rows=total_rows,
+            refreshed_at=time.time(), checked_at=now, next_check_at=next_check_at, error=None,
+        )
+        span.set(refreshed=1, rows=len(result.rows), bytes=len(markdown))
+    return True
+
+
+def refresh_due_pins():
+    """One scheduler pass: check the due pins of every database connected in this process. Returns pins refreshed."""
+    store = get_pin_store()
+    if store is None:
+        return 0
+    refreshed = 0
+    registry = get_registry()
+    for db in registry.connections():
+        # Leased so a session evicting or replacing the handle meanwhile does not close it under the refresh
+        with registry.lease(db) as held:
+            if not held:
+                continue
+            for pin in store.due(example_scope(db)):
+                # Claiming first, so one process refreshes a pin while the others skip it
+                if not store.claim(pin, time.time() + pin["interval"]):
+                    continue
+                try:
+                    refreshed += refresh_pin(pin, db)
+                except Exception:
+                    # Recorded on the pin, retried at its next check
+                    pass
+    return refreshed
+
+
+def _run_scheduler(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            refresh_due_pins()
+        except Exception:
+            pass
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def start_pin_scheduler(interval=PINNED_SCHEDULER_INTERVAL):
+    """Check the pins every interval seconds in a daemon thread, once per process. Returns the thread or None."""
+    global _scheduler
+    if not interval or get_pin_store() is None:
+        return None
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = threading.Thread(
+                target=_run_scheduler, args=(interval,), name="querybuddy-pins", daemon=True
+            )
+            _scheduler.start()
+        return _scheduler
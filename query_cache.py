@@ -0,0 +1,152 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from config import DATA_DIR, QUERY_CACHE_ENABLED, QUERY_CACHE_MAX_ENTRIES, QUERY_CACHE_TTL
+
+"""
+Persistent cache of generated queries, stored in a local SQLite file so it survives restarts.
+Keyed by database type, normalized question, relevant chat context and a fingerprint of the schema sent to the LLM.
+"""
+
+# Words that make a question depend on the previous turn ("what about this month?")
+FOLLOW_UP_WORDS = {
+    "it", "its", "this", "that", "these", "those", "them", "they", "their", "same", "above",
+    "previous", "again", "instead", "what about", "how about",
+}
+
+
+def normalize_question(question):
+    """Lowercase, collapse whitespace and drop trailing punctuation."""
+    question = re.sub(r"\s+", " ", str(question).strip().lower())
+    return question.rstrip(" ?.!;")
+
+
+def is_follow_up(question):
+    """Heuristic: short questions or ones referring back to earlier turns depend on the chat context."""
+    normalized = normalize_question(question)
+    words = normalized.split()
+    if len(words) < 4:
+        return True
+    return any(re.search(rf"\b{re.escape(word)}\b", normalized) for word in FOLLOW_UP_WORDS)
+
+
+def previous_question(chat_history, question):
+    """The last human message before the current question."""
+    for message in reversed(chat_history or []):
+        if getattr(message, "type", "") == "human":
+            content = getattr(message, "content", "")
+            if normalize_question(content) != normalize_question(question):
+                return content
+    return ""
+
+
+def cache_key(db_type, question, chat_history, schema):
+    """Build the cache key; chat context only counts for follow-up questions."""
+    context = normalize_question(previous_question(chat_history, question)) if is_follow_up(question) else ""
+    schema_fingerprint = hashlib.sha256(str(schema).encode("utf-8")).hexdigest()
+    payload = "\x1f".join([db_type.lower(), normalize_question(question), context, schema_fingerprint])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class QueryCache:
+    """
+    SQLite-backed question -> query cache with TTL expiry and LRU eviction.
+    """
+
+    def __init__(self, path, max_entries=QUERY_CACHE_MAX_ENTRIES, ttl=QUERY_CACHE_TTL):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS query_cache (
+                    key TEXT PRIMARY KEY,
+                    db_type TEXT NOT NULL,
+                    question TEXT NOT NULL,
+                    query TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            connection.execute("CREATE INDEX IF NOT EXISTS query_cache_last_used ON query_cache (last_used)")
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=10)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def get(self, key):
+        """Return the cached query for key, or None on a miss or an expired entry."""
+        now = time.time()
+        with self._lock, self._connect() as connection:
+            row = connection.execute("SELECT query, created_at FROM query_cache WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl and now - row[1] > self.ttl:
+                connection.execute("DELETE FROM query_cache WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            connection.execute("UPDATE query_cache SET last_used = ?, hits = hits + 1 WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, db_type, question, query):
+        """Store a query, then evict expired and least recently used entries beyond max_entries."""
+        now = time.time()
+        with self._lock, self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO query_cache (key, db_type, question, query, created_at, last_used, hits) "
+                "VALUES (?, ?, ?, ?, ?, ?, 0)",
+                (key, db_type.lower(), question, query, now, now),
+            )
+            if self.ttl:
+                connection.execute("DELETE FROM query_cache WHERE created_at < ?", (now - self.ttl,))
+            connection.execute(
+                "DELETE FROM query_cache WHERE key IN ("
+                "SELECT key FROM query_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def clear(self):
+        with self._lock, self._connect() as connection:
+            connection.execute("DELETE FROM query_cache")
+
+    def stats(self):
+        with self._lock, self._connect() as connection:
+            entries = connection.execute("SELECT COUNT(*) FROM query_cache").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": entries,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_query_cache():
+    """The process-wide query cache, or None when disabled."""
+    global _cache
+    if not QUERY_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = QueryCache(os.path.join(DATA_DIR, "query_cache.sqlite3"))
+        return _cache
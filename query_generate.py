@@ -1,22 +1,64 @@
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import RunnablePassthrough
 from langchain_core.output_parsers import StrOutputParser
-from langchain_groq import ChatGroq
-from dotenv import load_dotenv
-import os
-import re
-import json
-from bson import json_util
+import logging
+from llm_provider import get_llm
+from query_guard import QueryBlocked
+from query_validator import validate_query
+from telemetry import Trace
+from connection_registry import get_registry
+from tokens import count_tokens
+from result_table import to_markdown, prompt_data
+from stage_runner import StageTimeout, submit, wait_for, run_stage, stream_stage
+from config import (
+    SCHEMA_TIMEOUT, QUERY_GENERATION_TIMEOUT, EXECUTION_TIMEOUT, SUMMARY_TIMEOUT,
+    QUERY_VALIDATION_ENABLED, QUERY_REPAIR_ATTEMPTS,
+)
+from result_cache import cached_execute, estimate_size, is_read_only, is_read_only_mongo, sql_tables, mongo_collections
+from query_cache import get_query_cache, cache_key, is_follow_up, previous_question
+from example_store import get_example_store, example_scope
+from history_manager import prepare_history
+from schema_index import get_relevant_sql_schema, get_relevant_mongo_schema, retrieval_text
 # from typing import Tuple
 
+logger = logging.getLogger(__name__)
 
-# Loading environment variables
-load_dotenv()
 
 """
-Generates query using chatgroq api
+Generates query using the configured LLM backend (see llm_provider.py)
 """
 
+# Used until the example store holds questions that worked on the connected database
+DEFAULT_SQL_EXAMPLES = [
+    ("What are the sales of July?", "SELECT SUM(sales) FROM sales WHERE month = 'July';"),
+    ("What about this month?", "SELECT SUM(sales) FROM sales WHERE month = 'August';"),
+]
+DEFAULT_MONGO_EXAMPLES = [
+    (
+        "Find the top 3 artists with the most tracks.",
+        'db.tracks.aggregate([{ "$group": { "_id": "$artistId", "track_count": { "$sum": 1 } } }, '
+        '{ "$sort": { "track_count": -1 } }, { "$limit": 3 }])',
+    ),
+    (
+        "Find the 10 most recent artists.",
+        'db.artists.find({}, { "name": 1 }).sort({ "created_at": -1 }).limit(10)',
+    ),
+]
+
+
+def format_examples(examples, label):
+    """Render (question, query) pairs as the few-shot block of a prompt."""
+    return "\n    ".join(f"Question: {question}\n    {label}: {query}" for question, query in examples)
+
+
+def find_examples(db_type, db, question, use_store=True):
+    """Few-shot block for question: the most similar past successes on this database, else the defaults."""
+    store = get_example_store() if use_store else None
+    examples = store.similar(example_scope(db), question) if store is not None else []
+    if is_sql(db_type):
+        return format_examples(examples or DEFAULT_SQL_EXAMPLES, "SQL Query")
+    return format_examples(examples or DEFAULT_MONGO_EXAMPLES, "MongoDB Query")
+
 def get_sql_chain(db):
     """
     Generates a SQL query based on the user's question and database schema.
@@ -32,10 +74,7 @@ def get_sql_chain(db):
     Write only the SQL query and nothing else. Do not wrap the SQL query in any other text, not even backticks. Do not escape any characters (e.g., do not use backslashes).
     
     For example:
-    Question: What are the sales of July?
-    SQL Query: SELECT SUM(sales) FROM sales WHERE month = 'July';
-    Question: What about this month?
-    SQL Query: SELECT SUM(sales) FROM sales WHERE month = 'August';
+    {examples}
     
     Your turn:
     
@@ -45,14 +84,20 @@ def get_sql_chain(db):
     
     prompt = ChatPromptTemplate.from_template(template)
     
-    # Using Groq api 
-    llm = ChatGroq(api_key=os.getenv("GROQ_API_KEY"), model="llama-3.3-70b-versatile", temperature=0) 
+    # Shared LLM client
+    llm = get_llm("query")
     
-    def get_schema(_):
-        return db.get_table_info()
+    def get_schema(inputs):
+        # Only the tables relevant to the question, served from the per-connection schema cache
+        if inputs.get("schema"):
+            return inputs["schema"]
+        return get_relevant_sql_schema(db, retrieval_text(inputs["question"], inputs.get("chat_history")))
+    
+    def get_examples(inputs):
+        return inputs.get("examples") or find_examples("mysql", db, inputs["question"])
     
     return (
-        RunnablePassthrough.assign(schema=get_schema)
+        RunnablePassthrough.assign(schema=get_schema, examples=get_examples)
         | prompt
         | llm
         | StrOutputParser()
@@ -73,15 +118,12 @@ def get_mongodb_query_chain(db):
     
     Write only the MongoDB query and nothing else. Do not wrap the query in any other text, not even backticks.
     For example:
-    Question: Find the top 3 artists with the most tracks.
-    MongoDB Query: db.tracks.aggregate([{{ "$group": {{ "_id": "$artistId", "track_count": {{ "$sum": 1 }} }}, {{ "$sort": {{ "track_count": -1 }} }}, {{ "$limit": 3 }}])
-    Question: Find 10 artists.
-    MongoDB Query: db.artists.find({{}}.project({{ "name": 1 }}).limit(10))
-    For the above query donot give the query as db.artists.find({{}}, {{ "name": 1 }}).limit(10).
+    {examples}
     When asked about find queries:
     - Use the projection as the SECOND argument
     - Always use double quotes for keys
     - Never chain .project() separately
+    - Use .sort(), .skip() and .limit() after find() instead of fetching everything
     Ensure all property names are enclosed in double quotes (e.g., {{ "name": "value"}}) to comply with strict JSON syntax, even though MongoDB allows unquoted keys.Ensure that the queries comply with ATLAS Mongodb JSON Syntax.
     
     
@@ -92,29 +134,23 @@ def get_mongodb_query_chain(db):
     """
     
     prompt = ChatPromptTemplate.from_template(template)
-    # Use Groq or OpenAI LLM
-    llm = ChatGroq(api_key=os.getenv("GROQ_API_KEY"),model="llama-3.3-70b-versatile", temperature=0) 
-    
-    def get_schema(_):
-        """Generate schema information with sample documents"""
-        schema_info = []
-        for col in db.list_collection_names():
-            docs = list(db[col].find().limit(3))
-            if not docs:
-                schema_info.append(f"Collection: {col} (empty)")
-                continue
-                
-            samples = []
-            for doc in docs:
-                doc.pop('_id', None)
-                samples.append(json.dumps(doc, default=json_util.default))
-            
-            schema_info.append(
-                f"Collection: {col}\nSample Documents:\n" + "\n".join(samples)
-            )
-        return "\n\n".join(schema_info)
+    # Shared LLM client
+    llm = get_llm("query")
+    
+    def get_schema(inputs):
+        # Only the collections relevant to the question
+        if inputs.get("schema"):
+            return inputs["schema"]
+        from mongo_schema import get_mongo_schema
+        return get_relevant_mongo_schema(
+            get_mongo_schema(db),
+            retrieval_text(inputs["question"], inputs.get("chat_history")),
+        )
+    
+    def get_examples(inputs):
+        return inputs.get("examples") or find_examples("mongodb", db, inputs["question"])
     return (
-        RunnablePassthrough.assign(schema=get_schema)
+        RunnablePassthrough.assign(schema=get_schema, examples=get_examples)
         | prompt
         | llm
         | StrOutputParser()
@@ -125,234 +161,274 @@ def get_mongodb_query_chain(db):
 Executes the query and returns:
 - The generated query.
 - A natural language response summarizing the data.
+- The query results as a markdown table.
 """
 
-def get_response(db_type: str,user_query: str, db, chat_history: list):
-    if db_type.lower() in ["mysql", "postgresql"]:
-        # Generating SQL query
-        try:
-            sql_chain = get_sql_chain(db)
-            query = sql_chain.invoke({
-                "question": user_query,
-                "chat_history": chat_history,  # Passing chat history for context
-            })
-
-            # Removing unwanted backslashes
-            query = query.replace("\\", "") 
-
-            print("\nGenerated SQL Query:\n", query)  # Debugging output
-
-            # Executing SQL query and fetch raw data
-            try:
-                raw_data = db.run(query)
-                # format(raw_data=raw_data)
-                print("\n Raw Data from DB:", raw_data)  # Debugging output
-            except Exception as e:
-                print("\nDatabase Error:", str(e))
-                return query, f"Database Error: {str(e)}"
-            
-            # Template for tabular output
-            template = """
-            You are a data analyst at a company. You are interacting with a user who is asking you questions about the company's database.
-            Based on the table schema below, the SQL query, and the query results, format the data into a markdown table.
-            
-            <SCHEMA>{schema}</SCHEMA>
-            
-            SQL Query: <SQL>{query}</SQL>
-            
-            Query Results: {response}
-            
-            User Question: {question}
-
-            
-            Format the query results into a Markdown table with appropriate column names. Use the following format:
-            
-            ```
-            | Column 1 | Column 2 | Column 3 | ... |
-            |----------|----------|----------|-----|
-            | Value 1  | Value 2  | Value 3  | ... |
-            | Value 4  | Value 5  | Value 6  | ... |
-            ```
-            """
-
-            prompt = ChatPromptTemplate.from_template(template)
-            llm = ChatGroq(api_key=os.getenv("GROQ_API_KEY"), model="llama-3.3-70b-versatile", temperature=0)
-            
-            chain = (
-                RunnablePassthrough.assign(
-                    schema=lambda _: db.get_table_info(),
-                    response=lambda _: raw_data,  # Passing the raw data to the template
-                )
-                | prompt
-                | llm
-                | StrOutputParser()
-            )
+SQL_SUMMARY_TEMPLATE = """
+    You are a data analyst at a company. You are interacting with a user who is asking you questions about the company's database.
+    Based on the table schema below, the SQL query, and the query results, write a natural language response summarizing the data.
+    Generate a human-readable response with proper spacing and punctuation.
+    
+    <SCHEMA>{schema}</SCHEMA>
+    
+    SQL Query: <SQL>{query}</SQL>
+    
+    Query Results: {response}
+    
+    User Question: {question}
+    
+    Write a response that summarizes the data in a clear and concise manner. Include key insights, trends, or anomalies if applicable.
+    """
 
-            # Generating the tabular output
-            tabular_response = chain.invoke({
-                "question": user_query,
-                "query": query,
-            })
-
-            print("\nTabular Response:\n", tabular_response)  # Debugging output
-
-            template = """
-            You are a data analyst at a company. You are interacting with a user who is asking you questions about the company's database.
-            Based on the table schema below, the SQL query, and the query results, write a natural language response summarizing the data.
-            Generate a human-readable response with proper spacing and punctuation.
-            
-            <SCHEMA>{schema}</SCHEMA>
-            
-            SQL Query: <SQL>{query}</SQL>
-            
-            Query Results: {response}
-            
-            User Question: {question}
-            
-            Write a response that summarizes the data in a clear and concise manner. Include key insights, trends, or anomalies if applicable.
-            """
-            
-            prompt = ChatPromptTemplate.from_template(template)
-            llm = ChatGroq(api_key=os.getenv("GROQ_API_KEY"), model="llama-3.3-70b-versatile", temperature=0)
-            
-            chain = (
-                RunnablePassthrough.assign(
-                    schema=lambda _: db.get_table_info(),
-                    response=lambda _: raw_data,  # Passing the raw data to the template
+MONGO_SUMMARY_TEMPLATE = """
+    You are a data analyst at a company. You are interacting with a user who is asking you questions about the company's MongoDB database.
+    Based on the MongoDB query and the query results, write a natural language response summarizing the data.
+    Generate a human-readable response with proper spacing and punctuation.
+    MongoDB Query: <QUERY>{query}</QUERY>
+    
+    Query Results: {response}
+    
+    User Question: {question}
+    
+    Write a response that summarizes the data in a clear and concise manner. Include key insights, trends, or anomalies if applicable.
+    Handle nested documents appropriately in your summary.
+    """
+
+
+def is_sql(db_type: str) -> bool:
+    return db_type.lower() in ["mysql", "postgresql"]
+
+
+def generate_query(db_type: str, user_query: str, db, chat_history, schema=None, examples=None) -> str:
+    """Generates the SQL or MongoDB query for the question (chat_history as messages or prepared text)."""
+    chain = get_sql_chain(db) if is_sql(db_type) else get_mongodb_query_chain(db)
+    query = chain.invoke({
+        "question": user_query,
+        "chat_history": chat_history,  # Passing chat history for context
+        "schema": schema,
+        "examples": examples,
+    })
+    if is_sql(db_type):
+        # Removing unwanted backslashes
+        query = query.replace("\\", "")
+    return query
+
+
+REPAIR_TEMPLATE = """
+    You are a data analyst at a company. The {dialect} query below was written to answer the user's question,
+    but checking it against the database schema found problems.
+    
+    <SCHEMA>{schema}</SCHEMA>
+    
+    Question: {question}
+    {dialect} Query: {query}
+    
+    Problems:
+    {problems}
+    
+    Fix only these problems. Write only the corrected {dialect} query and nothing else. Do not wrap it in any other text, not even backticks.
+    Corrected Query:
+    """
+
+
+def repair_query(db_type: str, user_query: str, schema: str, query: str, problems: list) -> str:
+    """Asks the LLM to fix a generated query, with the validation problems attached."""
+    prompt = ChatPromptTemplate.from_template(REPAIR_TEMPLATE)
+    chain = prompt | get_llm("query") | StrOutputParser()
+    repaired = chain.invoke({
+        "dialect": "SQL" if is_sql(db_type) else "MongoDB",
+        "schema": schema,
+        "question": user_query,
+        "query": query,
+        "problems": "\n    ".join(f"- {problem}" for problem in problems),
+    })
+    if is_sql(db_type):
+        repaired = repaired.replace("\\", "")
+    return repaired
+
+
+def run_mongodb_query(query: str, db):
+    """Executes a generated MongoDB query with sort/skip/limit/projection done by the server."""
+    # bson and pymongo are only loaded for MongoDB databases
+    from mongo_query import parse_mongo_query, execute_mongo_query
+    return execute_mongo_query(parse_mongo_query(query), db)
+
+
+def get_summary_chain(db_type: str):
+    """Chain writing the natural language summary from schema, query, results and question."""
+    template = SQL_SUMMARY_TEMPLATE if is_sql(db_type) else MONGO_SUMMARY_TEMPLATE
+    prompt = ChatPromptTemplate.from_template(template)
+    llm = get_llm("summary")
+    return prompt | llm | StrOutputParser()
+
+
+def fetch_schema(db_type: str, db, text: str) -> str:
+    """Schema description of the tables/collections relevant to text."""
+    if is_sql(db_type):
+        return get_relevant_sql_schema(db, text)
+    # bson and pymongo are only loaded for MongoDB databases
+    from mongo_schema import get_mongo_schema
+    return get_relevant_mongo_schema(get_mongo_schema(db), text)
+
+
+def stream_response(db_type: str, user_query: str, db, chat_history: list, trace=None,
+                    use_query_cache=True, use_examples=True):
+    """
+    Runs the pipeline and yields (event, value) pairs as soon as each piece is ready:
+    ("query", generated query), ("result", QueryResult), ("table", markdown table), ("token", summary chunk),
+    ("error", message) and finally ("trace", Trace) with the timed spans of every stage.
+    Independent stages run concurrently and every stage has its own timeout (see config.py).
+    use_query_cache=False neither reads nor fills the query cache, use_examples=False neither reads nor records
+    examples in the example store (the fixed examples are used).
+    """
+    trace = trace if trace is not None else Trace()
+    # The connection stays open for the run even if the registry evicts or replaces it meanwhile
+    with get_registry().lease(db):
+        yield from _run_pipeline(db_type, user_query, db, chat_history, trace, use_query_cache, use_examples)
+    yield "trace", trace
+
+
+def _run_pipeline(db_type, user_query, db, chat_history, trace, use_query_cache, use_examples):
+    query = ""
+    try:
+        # Fetching the relevant schema in the background while the history is prepared
+        with trace.span("schema_fetch") as span:
+            schema_future = submit(fetch_schema, db_type, db, retrieval_text(user_query, chat_history))
+            history = prepare_history(chat_history, user_query)
+            schema = wait_for("Schema fetch", schema_future, SCHEMA_TIMEOUT)
+            span.set(schema_tokens=count_tokens(schema), history_tokens=count_tokens(history))
+
+        # Reusing a previously generated query for the same question and schema
+        with trace.span("query_generation") as span:
+            query_cache = get_query_cache() if use_query_cache else None
+            key = cache_key(db_type, user_query, chat_history, schema)
+            query = query_cache.get(key) if query_cache is not None else None
+            from_cache = query is not None
+            examples = ""
+            if not from_cache:
+                # Past questions that worked on this database guide the model better than fixed examples
+                examples = find_examples(db_type, db, user_query, use_examples)
+                query = run_stage(
+                    "Query generation", QUERY_GENERATION_TIMEOUT,
+                    generate_query, db_type, user_query, db, history, schema, examples,
                 )
-                | prompt
-                | llm
-                | StrOutputParser()
+            span.set(
+                cache_hits=int(from_cache),
+                input_tokens=0 if from_cache else
+                count_tokens(schema) + count_tokens(history) + count_tokens(examples) + count_tokens(user_query),
+                output_tokens=0 if from_cache else count_tokens(query),
             )
 
-            # Generating the natural language response
-            nl_response = chain.invoke({
-                "question": user_query,
-                "query": query,
-            })
-            print("\nNatural Language Response:\n", nl_response)  # Debugging output
-            
-            return query, nl_response,tabular_response
-        except Exception as e:
-                return query, f"Error executing query: {str(e)}", ""
-        
-    elif db_type.lower() == "mongodb":
-            # Generating MongoDB query
-            mongodb_chain = get_mongodb_query_chain(db)
-            query = mongodb_chain.invoke({
-                "question": user_query,
-                "chat_history": chat_history,  # Passing chat history for context
-            })
-            
-            print("\nGenerated MongoDB Query:\n", query)
-            try:
-                # Extracting collection name from query
-                collection_name = re.search(r'db\.(\w+)\.', query).group(1)
-                collection = db[collection_name]
-
-                # Handle find() queries
-                if '.find(' in query:
-                    match = re.search(r'find\(\s*({.*?})\s*,\s*({.*?})\s*\)', query, re.DOTALL)
-                    
-                    filter_part = match.group(1).strip()
-                    projection_part = match.group(2).strip() if match.group(2) else "{}"
-                    filter_obj = json.loads(filter_part)
-                    projection_obj = json.loads(projection_part)
-                    raw_data = list(collection.find(filter_obj, projection_obj))
-                # Handle aggregate() queries
-                elif '.aggregate(' in query:
-                    pipeline_part = re.search(r'aggregate\((\[.*?\])', query, re.DOTALL).group(1)
-                    pipeline = json.loads(pipeline_part)
-                    raw_data = list(collection.aggregate(pipeline))
-
-                # Handle limit/sort modifiers
-                if '.limit(' in query:
-                    limit = int(re.search(r'limit\((\d+)\)', query).group(1))
-                    raw_data = raw_data[:limit]
-
-                print("\nRaw Data from MongoDB:\n", raw_data)
-
-                # Converting raw data to JSON string for processing
-                raw_data_str = json.dumps(raw_data, default=json_util.default)
-
-                # Template for tabular output
-                template = """
-                You are a data analyst at a company. You are interacting with a user who is asking you questions about the company's MongoDB database.
-                Based on the query results below, format the data into a markdown table.
-                
-                MongoDB Query: <QUERY>{query}</QUERY>
-                
-                Query Results: {response}
-                
-                User Question: {question}
-
-                Format the query results into a Markdown table with appropriate column names. If the data is nested, flatten it for display.Donot include column named id.
-                Use the following format:
-                
-                ```
-                | Column 1 | Column 2 | Column 3 | ... |
-                |----------|----------|----------|-----|
-                | Value 1  | Value 2  | Value 3  | ... |
-                | Value 4  | Value 5  | Value 6  | ... |
-                ```
-                """
-
-                prompt = ChatPromptTemplate.from_template(template)
-                llm = ChatGroq(api_key=os.getenv("GROQ_API_KEY"), model="llama-3.3-70b-versatile", temperature=0)
-                
-                chain = (
-                    RunnablePassthrough.assign(
-                        response=lambda _: raw_data_str,
+        # Checking the query locally and letting the LLM fix what is wrong before anything reaches the database
+        if QUERY_VALIDATION_ENABLED:
+            with trace.span("query_validation") as span:
+                problems = validate_query(db_type, db, query)
+                repairs = 0
+                while problems and repairs < QUERY_REPAIR_ATTEMPTS:
+                    repairs += 1
+                    from_cache = False
+                    query = run_stage(
+                        "Query repair", QUERY_GENERATION_TIMEOUT,
+                        repair_query, db_type, user_query, schema, query, problems,
                     )
-                    | prompt
-                    | llm
-                    | StrOutputParser()
-                )
+                    problems = validate_query(db_type, db, query)
+                span.set(repairs=repairs, problems=len(problems))
+            if problems:
+                yield "query", query
+                yield "error", "The generated query is not valid for this database:\n" + "\n".join(
+                    f"- {problem}" for problem in problems)
+                return
+
+        logger.debug("Generated query (%d characters)", len(query))
+        yield "query", query
 
-                # Generating the tabular output
-                tabular_response = chain.invoke({
-                    "question": user_query,
-                    "query": query,
-                })
-
-                print("\nTabular Response:\n", tabular_response)
-
-                # Template for natural language response
-                template = """
-                You are a data analyst at a company. You are interacting with a user who is asking you questions about the company's MongoDB database.
-                Based on the MongoDB query and the query results, write a natural language response summarizing the data.
-                Generate a human-readable response with proper spacing and punctuation.
-                MongoDB Query: <QUERY>{query}</QUERY>
-                
-                Query Results: {response}
-                
-                User Question: {question}
-                
-                Write a response that summarizes the data in a clear and concise manner. Include key insights, trends, or anomalies if applicable.
-                Handle nested documents appropriately in your summary.
-                """
-                
-                prompt = ChatPromptTemplate.from_template(template)
-                llm = ChatGroq(api_key=os.getenv("GROQ_API_KEY"), model="llama-3.3-70b-versatile", temperature=0)
-                
-                chain = (
-                    RunnablePassthrough.assign(
-                        response=lambda _: raw_data_str,
+        # Executing the query and fetching raw data
+        with trace.span("query_execution") as span:
+            if is_sql(db_type):
+                # SQLAlchemy is only loaded for SQL databases
+                from sql_executor import execute_sql
+                try:
+                    result = run_stage(
+                        "Query execution", EXECUTION_TIMEOUT,
+                        cached_execute, db, query, sql_tables(query), is_read_only(query),
+                        lambda: execute_sql(db, query),
                     )
-                    | prompt
-                    | llm
-                    | StrOutputParser()
+                except QueryBlocked as e:
+                    span.set(blocked=1)
+                    yield "error", str(e)
+                    return
+                except StageTimeout:
+                    # Reported like a timeout of any other stage, not as a database error
+                    raise
+                except Exception as e:
+                    logger.warning("SQL execution failed: %s", type(e).__name__)
+                    span.error = type(e).__name__
+                    yield "error", f"Database Error: {str(e)}"
+                    return
+            else:
+                result = run_stage(
+                    "Query execution", EXECUTION_TIMEOUT,
+                    cached_execute, db, query, mongo_collections(query), is_read_only_mongo(query),
+                    lambda: run_mongodb_query(query, db),
                 )
+            raw_data = prompt_data(result)
+            span.set(rows=len(result.rows), bytes=estimate_size(result), prompt_data_bytes=len(raw_data))
 
-                # Generating the natural language response
-                nl_response = chain.invoke({
-                    "question": user_query,
-                    "query": query,
-                })
+        # Only queries that executed successfully are cached and become examples
+        if query_cache is not None and not from_cache:
+            query_cache.put(key, db_type, user_query, query)
+        # Follow-ups only make sense with the earlier turn, they are not recorded
+        example_store = get_example_store() if use_examples else None
+        if example_store is not None and not (is_follow_up(user_query) and previous_question(chat_history, user_query)):
+            example_store.record(example_scope(db), user_query, query)
 
-                print("\nNatural Language Response:\n", nl_response)
-                
-                return query, nl_response, tabular_response
+        with trace.span("summary_generation") as summary_span:
+            # Starting the summary request first so the table is built while the LLM works
+            summary_chain = get_summary_chain(db_type)
+            summary = stream_stage("Summary generation", SUMMARY_TIMEOUT, lambda: summary_chain.stream({
+                "schema": schema,
+                "query": query,
+                "response": raw_data,
+                "question": user_query,
+            }))
+
+            # Building the markdown table locally from the typed rows
+            yield "result", result
+            with trace.span("table_rendering") as span:
+                table = to_markdown(result)
+                span.set(rows=len(result.rows), bytes=len(table))
+            yield "table", table
+
+            # Streaming the natural language response as the model produces it
+            output = []
+            for chunk in summary:
+                if not output:
+                    summary_span.set(first_token_seconds=summary_span.elapsed())
+                output.append(chunk)
+                yield "token", chunk
+            summary_span.set(
+                input_tokens=count_tokens(schema) + count_tokens(query) + count_tokens(raw_data) + count_tokens(user_query),
+                output_tokens=count_tokens("".join(output)),
+            )
+
+    except StageTimeout as e:
+        yield "error", f"{e}. Please try again or simplify the question."
+    except Exception as e:
+        yield "error", f"Error executing query: {str(e)}"
 
-            except Exception as e:
-                return query, f"Error executing query: {str(e)}", ""
\ No newline at end of file
+
+def get_response(db_type: str,user_query: str, db, chat_history: list):
+    """Non-streaming wrapper around stream_response, returns (query, nl_response, tabular_response)."""
+    query, tabular_response = "", ""
+    tokens = []
+    for event, value in stream_response(db_type, user_query, db, chat_history):
+        if event == "query":
+            query = value
+        elif event == "table":
+            tabular_response = value
+        elif event == "token":
+            tokens.append(value)
+        elif event == "error":
+            return query, value, ""
+    nl_response = "".join(tokens)
+    return query, nl_response, tabular_response
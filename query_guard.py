@@ -0,0 +1,151 @@
+import json
+import logging
+import re
+from config import SQL_GUARD_ENABLED, SQL_GUARD_MAX_ROWS, SQL_GUARD_MAX_COST, SQL_GUARD_ACTION, MAX_DISPLAY_ROWS
+
+"""
+Pre-execution cost guard for generated SQL.
+The planner's estimate (EXPLAIN on MySQL and PostgreSQL) is checked before a statement runs; statements over
+the configured row or cost threshold are rejected, or for plain SELECTs first retried with an automatic LIMIT.
+Databases without planner estimates (e.g. SQLite) are not guarded.
+"""
+
+GUARDED = {"select", "with", "update", "delete"}
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBlocked(Exception):
+    """The planner estimates the statement as too expensive to run."""
+
+    def __init__(self, reason, estimate):
+        super().__init__(reason)
+        self.reason = reason
+        self.estimate = estimate
+
+
+class PlanEstimate:
+    """Planner estimate of a statement: rows examined/returned and, where available, total cost."""
+
+    def __init__(self, rows, cost=None):
+        self.rows = rows
+        self.cost = cost
+
+    def describe(self):
+        parts = [f"~{self.rows:,.0f} rows"]
+        if self.cost is not None:
+            parts.append(f"cost {self.cost:,.0f}")
+        return ", ".join(parts)
+
+
+def _first_keyword(query):
+    match = re.match(r"\s*\(*\s*(\w+)", query)
+    return match.group(1).lower() if match else ""
+
+
+def has_limit(query):
+    """Whether the statement ends with a LIMIT (or FETCH FIRST) clause."""
+    return bool(re.search(r"\blimit\s+\d+(\s*(,|offset)\s*\d+)?\s*$|\bfetch\s+first\b[^;]*$", query.strip().rstrip(";"), re.I))
+
+
+def _explain(connection, statement):
+    # Through text() like the statement itself, so % signs (LIKE 'A%', DATE_FORMAT) are escaped for the driver
+    from sqlalchemy import text
+    return connection.execute(text(statement))
+
+
+def _postgres_estimate(connection, query):
+    plan = _explain(connection, f"EXPLAIN (FORMAT JSON) {query}").scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    root = plan[0]["Plan"]
+    return PlanEstimate(root.get("Plan Rows", 0), root.get("Total Cost"))
+
+
+def _mysql_estimate(connection, query):
+    # Rows examined: tables of one SELECT are joined (multiplied), separate SELECTs add up
+    per_select = {}
+    for row in _explain(connection, f"EXPLAIN {query}").mappings():
+        rows = row.get("rows") or 1
+        filtered = row.get("filtered")
+        examined = rows * (float(filtered) / 100 if filtered else 1)
+        per_select[row.get("id")] = per_select.get(row.get("id"), 1) * max(examined, 1)
+    return PlanEstimate(sum(per_select.values()))
+
+
+def estimate(connection, dialect, query):
+    """The planner's estimate for query, or None when the database does not provide one."""
+    if dialect == "postgresql":
+        return _postgres_estimate(connection, query)
+    if dialect in ("mysql", "mariadb"):
+        return _mysql_estimate(connection, query)
+    return None
+
+
+def _over_limit(plan_estimate, max_rows, max_cost):
+    if max_rows and plan_estimate.rows > max_rows:
+        return f"estimated {plan_estimate.describe()} exceeds the limit of {max_rows:,} rows"
+    if max_cost and plan_estimate.cost is not None and plan_estimate.cost > max_cost:
+        return f"estimated {plan_estimate.describe()} exceeds the cost limit of {max_cost:,.0f}"
+    return None
+
+
+def guard_query(connection, dialect, query, max_rows=SQL_GUARD_MAX_ROWS, max_cost=SQL_GUARD_MAX_COST,
+                action=SQL_GUARD_ACTION, limit=MAX_DISPLAY_ROWS + 1):
+    """
+    Return the statement to run: query itself, or query with an automatic LIMIT when allowed and sufficient.
+    Raises QueryBlocked when the estimate stays over the thresholds.
+    """
+    if not SQL_GUARD_ENABLED or _first_keyword(query) not in GUARDED:
+        return query
+    from sqlalchemy.exc import ProgrammingError
+    statement = query.strip().rstrip(";")
+    # Savepoint so a failing EXPLAIN does not abort the surrounding transaction
+    try:
+        with connection.begin_nested():
+            plan_estimate = estimate(connection, dialect, statement)
+    except ProgrammingError as e:
+        # The statement itself is broken (syntax, unknown table or column): executing it reports the real error.
+        # Any other failure propagates, so the guard is never skipped silently.
+        logger.warning("Cost guard skipped, EXPLAIN rejected the statement: %s", type(e.orig).__name__)
+        return query
+    if plan_estimate is None:
+        return query
+    reason = _over_limit(plan_estimate, max_rows, max_cost)
+    if reason is None:
+        return query
+
+    # MySQL's EXPLAIN ignores LIMIT; without sorting or grouping the scan stops after the limit anyway
+    stops_early = dialect in ("mysql", "mariadb") and not re.search(
+        r"\b(order\s+by|group\s+by|distinct|union)\b", statement, re.I)
+    if stops_early and has_limit(statement):
+        return query
+    if action == "limit" and _first_keyword(statement) in ("select", "with") and not has_limit(statement):
+        limited = f"{statement} LIMIT {int(limit)}"
+        if stops_early:
+            return limited
+        try:
+            with connection.begin_nested():
+                limited_estimate = estimate(connection, dialect, limited)
+        except Exception:
+            limited_estimate = plan_estimate
+        if _over_limit(limited_estimate, max_rows, max_cost) is None:
+            return limited
+    raise QueryBlocked(f"Query blocked before execution: {reason}.", plan_estimate)
+
+
+def set_statement_timeout(connection, dialect, timeout):
+    """Limit how long every statement on this connection may run, in seconds (0 = no limit)."""
+    if not timeout:
+        return
+    milliseconds = int(timeout * 1000)
+    if dialect == "postgresql":
+        # Scoped to the current transaction
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {milliseconds}")
+    elif dialect in ("mysql", "mariadb"):
+        # The pooled connection keeps session variables, so they are set again on every use.
+        # MySQL limits SELECTs with max_execution_time, MariaDB every statement with max_statement_time.
+        try:
+            connection.exec_driver_sql(f"SET SESSION max_execution_time = {milliseconds}")
+        except Exception:
+            connection.exec_driver_sql(f"SET SESSION max_statement_time = {timeout}")
@@ -0,0 +1,194 @@
+import difflib
+from schema_cache import get_schema_cache
+from sql_lexer import CLAUSE_WORDS, is_identifier, sql_tokens, table_references, token_name
+
+"""
+Local checks of generated queries before they are sent to the database.
+SQL is tokenized and checked for balanced parentheses, closed strings, a single statement, and tables and
+qualified columns that exist in the schema (tables and views). MongoDB queries are parsed and their collections
+checked against the sampled schema. Only certain errors are reported, so valid queries are never held back.
+"""
+
+STATEMENTS = {
+    "select", "with", "insert", "update", "delete", "replace", "show", "describe", "desc", "explain",
+    "create", "alter", "drop", "truncate", "values", "table",
+}
+
+
+def _suggest(name, candidates):
+    matches = difflib.get_close_matches(name, candidates, n=1)
+    return f" Did you mean '{matches[0]}'?" if matches else ""
+
+
+# Tables every query may name without them being in the schema
+BUILTIN_TABLES = {"mysql": {"dual"}}
+
+
+def _sql_columns(db):
+    """
+    ({table: set of columns}, complete), lowercased. Columns come from the metadata SQLDatabase already reflected;
+    views and tables it left out are listed with None as columns. complete is False when the tables and views
+    of the schema could not be listed, so that unknown names are not reported.
+    """
+    # SQLAlchemy is only loaded for SQL databases
+    from sqlalchemy import inspect
+    columns = {
+        table.name.lower(): {column.name.lower() for column in table.columns}
+        for table in db._metadata.sorted_tables
+    }
+    try:
+        inspector = inspect(db._engine)
+        names = inspector.get_table_names(schema=db._schema) + inspector.get_view_names(schema=db._schema)
+    except Exception:
+        return columns, False
+    for name in names:
+        columns.setdefault(name.lower(), None)
+    return columns, True
+
+
+def _builtin_table(name, dialect):
+    return name in BUILTIN_TABLES.get(dialect, ()) or (dialect == "postgresql" and name.startswith("pg_"))
+
+
+def _derived_names(tokens):
+    """Names of common table expressions and derived tables, which can be referenced like tables."""
+    derived = set()
+    for index in range(len(tokens) - 1):
+        following = tokens[index + 2] if index + 2 < len(tokens) else ("other", "")
+        if is_identifier(tokens[index]) and tokens[index + 1][1] == "(":
+            # WITH name (a, b) AS (...): skipping the column list
+            depth, end = 0, index + 1
+            for end in range(index + 1, len(tokens)):
+                depth += {"(": 1, ")": -1}.get(tokens[end][1], 0)
+                if not depth:
+                    break
+            if end + 1 < len(tokens) and tokens[end + 1][1].lower() == "as" and _starts_cte_body(tokens, end + 2):
+                derived.add(token_name(tokens[index]))
+        if is_identifier(tokens[index]) and tokens[index + 1][1].lower() == "as" and _starts_cte_body(tokens, index + 2):
+            derived.add(token_name(tokens[index]))
+        if tokens[index][1] == ")" and is_identifier(tokens[index + 1]):
+            alias = following if tokens[index + 1][1].lower() == "as" else tokens[index + 1]
+            if is_identifier(alias) and token_name(alias) not in CLAUSE_WORDS:
+                derived.add(token_name(alias))
+    return derived
+
+
+def _starts_cte_body(tokens, index):
+    """Whether "(" or [NOT] MATERIALIZED ( starts at index."""
+    while index < len(tokens) and tokens[index][1].lower() in ("not", "materialized"):
+        index += 1
+    return index < len(tokens) and tokens[index][1] == "("
+
+
+def validate_sql(query, columns, schema=None, dialect=None, complete=True):
+    """
+    Return a list of problems found in query (empty when none).
+    columns maps each known table or view to its columns (None when they are not known); schema is the database
+    schema tables may be qualified with. Unknown tables are only reported when columns is complete.
+    """
+    tokens = sql_tokens(query)
+    if not tokens:
+        return ["The query is empty."]
+    problems = []
+
+    # Unterminated strings and quoted identifiers end up as a lone quote character
+    if any(kind == "other" and text in "'\"`" for kind, text in tokens):
+        problems.append("The query contains an unterminated string or quoted identifier.")
+        return problems
+
+    if tokens[0][0] != "word" or tokens[0][1].lower() not in STATEMENTS:
+        problems.append(f"The query must start with a SQL statement keyword, not '{tokens[0][1]}'.")
+        return problems
+
+    # A trailing semicolon is fine, a second statement is not
+    if any(token == ("other", ";") for token in tokens[:-1]):
+        problems.append("Only one SQL statement can be run at a time.")
+
+    depth = 0
+    for kind, text in tokens:
+        if kind == "other" and text == "(":
+            depth += 1
+        elif kind == "other" and text == ")":
+            depth -= 1
+            if depth < 0:
+                problems.append("The query has a closing parenthesis without a matching opening one.")
+                return problems
+    if depth:
+        problems.append("The query has unbalanced parentheses.")
+        return problems
+
+    derived = _derived_names(tokens)
+    known = set(columns)
+    aliases = {}
+    consumed = set()
+    for reference in table_references(tokens):
+        consumed.update(range(reference.start, reference.end + 1))
+        table = reference.name
+        qualified_elsewhere = len(reference.parts) > 1 and reference.parts[-2] != (schema or "").lower()
+        if complete and not qualified_elsewhere and table not in known and table not in derived \
+                and not _builtin_table(table, dialect):
+            problems.append(f"Table '{table}' does not exist.{_suggest(table, known)}")
+        # Columns are only checked for tables whose columns were reflected
+        target = table if not qualified_elsewhere and columns.get(table) is not None else None
+        aliases[table] = target
+        if reference.alias is not None:
+            aliases[reference.alias] = target
+
+    # Qualified column references: alias.column
+    for index in range(len(tokens) - 2):
+        if index in consumed or index + 2 in consumed:
+            continue
+        if not (is_identifier(tokens[index]) and tokens[index + 1][1] == "." and is_identifier(tokens[index + 2])):
+            continue
+        if index and tokens[index - 1][1] == ".":
+            continue
+        if index + 3 < len(tokens) and tokens[index + 3][1] in (".", "("):
+            continue
+        qualifier, column = token_name(tokens[index]), token_name(tokens[index + 2])
+        if qualifier in aliases:
+            table = aliases[qualifier]
+            if table is not None and column not in columns[table]:
+                problems.append(f"Column '{column}' does not exist in table '{table}'.{_suggest(column, columns[table])}")
+        elif qualifier not in derived and qualifier not in known:
+            problems.append(f"'{qualifier}.{column}' refers to '{qualifier}', which is not a table or alias in the query.")
+    return problems
+
+
+def validate_mongo(query, collections):
+    """Return a list of problems found in a MongoDB shell query (empty when none)."""
+    # bson and pymongo are only loaded for MongoDB databases
+    from mongo_query import MongoQueryError, parse_mongo_query
+    try:
+        parsed = parse_mongo_query(query)
+    except MongoQueryError as e:
+        return [f"The query could not be parsed: {e}"]
+    problems = []
+    known = set(collections)
+    if known and parsed.collection not in known:
+        problems.append(f"Collection '{parsed.collection}' does not exist.{_suggest(parsed.collection, known)}")
+    if parsed.method == "aggregate":
+        pipeline = parsed.args[0] if parsed.args else []
+        if not isinstance(pipeline, list):
+            return problems + ["aggregate() expects a list of pipeline stages."]
+        for position, stage in enumerate(pipeline, 1):
+            if not isinstance(stage, dict) or len(stage) != 1 or not next(iter(stage)).startswith("$"):
+                problems.append(f"Pipeline stage {position} must be an object with a single $operator key.")
+                continue
+            operator, spec = next(iter(stage.items()))
+            if operator in ("$lookup", "$graphLookup") and isinstance(spec, dict):
+                source = spec.get("from")
+                if known and source and source not in known:
+                    problems.append(f"{operator} reads from collection '{source}', which does not exist.{_suggest(source, known)}")
+    elif parsed.method in ("find", "findOne", "countDocuments", "count"):
+        if parsed.args and not isinstance(parsed.args[0], dict):
+            problems.append(f"{parsed.method}() expects a filter document as its first argument.")
+    return problems
+
+
+def validate_query(db_type, db, query):
+    """Problems found in a generated query against the cached schema of db."""
+    if db_type.lower() in ("mysql", "postgresql"):
+        columns, complete = get_schema_cache(db).get_or_build("columns", _sql_columns)
+        return validate_sql(query, columns, db._schema, db.dialect, complete)
+    from mongo_schema import get_mongo_schema
+    return validate_mongo(query, get_mongo_schema(db).keys())
@@ -0,0 +1,202 @@
+import hashlib
+import re
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from sql_lexer import sql_tokens, table_references
+from config import RESULT_CACHE_ENABLED, RESULT_CACHE_MAX_BYTES, RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_TTL
+
+"""
+Process-wide cache of query results shared by all sessions.
+Keyed by connection identity and normalized query text, bounded by entry count and estimated size,
+with TTL expiry and invalidation by referenced table/collection.
+"""
+
+# Statements whose results can be cached; anything else is treated as a write
+READ_ONLY_KEYWORDS = {"select", "with", "show", "describe", "desc", "explain", "values", "table"}
+
+# Words that make a statement starting with one of the above write or lock rows: data-modifying CTEs
+# (WITH d AS (DELETE ... RETURNING *) ...), SELECT ... INTO, SELECT ... FOR UPDATE / FOR SHARE, EXPLAIN ANALYZE DELETE
+WRITE_WORDS = {"insert", "update", "delete", "merge", "into", "truncate", "drop", "alter", "create", "lock"}
+
+# Table names follow these keywords in SQL (TABLE for DDL such as TRUNCATE TABLE t)
+TABLE_KEYWORDS = {"from", "join", "update", "into", "table"}
+
+# Other collections read by an aggregation pipeline
+MONGO_COLLECTION_PATTERN = re.compile(r'"(?:from|coll|\$out|into)"\s*:\s*"([^"$][^"]*)"')
+
+
+def normalize_query(query):
+    """Collapse whitespace and drop a trailing semicolon; literals keep their case."""
+    return re.sub(r"\s+", " ", str(query)).strip().rstrip(";").strip()
+
+
+def is_read_only(query):
+    """Whether a SQL statement only reads: a read-only first keyword and no writing or locking clause anywhere."""
+    words = [text.lower() for kind, text in sql_tokens(str(query)) if kind == "word"]
+    if not words or words[0] not in READ_ONLY_KEYWORDS:
+        return False
+    for previous, word in zip([""] + words, words):
+        if word in WRITE_WORDS or (previous == "for" and word in ("share", "no", "key")):
+            return False
+    return True
+
+
+def is_read_only_mongo(query):
+    """Aggregations ending in $out/$merge write to a collection."""
+    return not re.search(r'"\$(?:out|merge)"', str(query))
+
+
+def sql_tables(query):
+    """Lowercase names of the tables referenced by a SQL statement (schema prefix removed)."""
+    return {reference.name for reference in table_references(sql_tokens(str(query)), TABLE_KEYWORDS)}
+
+
+def mongo_collections(query):
+    """Lowercase names of the collections referenced by a MongoDB query ($lookup, $unionWith, ... included)."""
+    collections = set()
+    match = re.search(r"db\.(\w+)\.", str(query))
+    if match:
+        collections.add(match.group(1).lower())
+    collections.update(name.lower() for name in MONGO_COLLECTION_PATTERN.findall(str(query)))
+    return collections
+
+
+# Identity registered by db_connector for each connection object (hash of the connection URI)
+_identities = weakref.WeakKeyDictionary()
+
+def register_connection_identity(db, uri):
+    _identities[db] = hashlib.sha256(str(uri).encode("utf-8")).hexdigest()
+
+def connection_identity(db):
+    """A stable identifier for the database behind db, shared by every session using the same credentials."""
+    try:
+        identity = _identities.get(db)
+    except TypeError:
+        identity = None
+    if identity is not None:
+        return identity
+    engine = getattr(db, "_engine", None)
+    if engine is not None:
+        uri = engine.url.render_as_string(hide_password=False)
+    else:
+        uri = f"{db.client!r}/{db.name}"
+    return hashlib.sha256(uri.encode("utf-8")).hexdigest()
+
+
+def estimate_size(value):
+    """Rough size in bytes of a list of rows/documents, extrapolated from the first 100 items."""
+    rows = getattr(value, "rows", value)
+    if not rows:
+        return sys.getsizeof(rows)
+    sample = rows[:100]
+    sample_size = 0
+    for row in sample:
+        items = row.values() if isinstance(row, dict) else row
+        sample_size += sys.getsizeof(row) + sum(sys.getsizeof(item) for item in items)
+    return sys.getsizeof(rows) + sample_size * len(rows) // len(sample)
+
+
+class ResultCache:
+    """
+    LRU cache of query results with TTL, entry-count and byte-size limits.
+    """
+
+    def __init__(self, max_entries=RESULT_CACHE_MAX_ENTRIES, max_bytes=RESULT_CACHE_MAX_BYTES, ttl=RESULT_CACHE_TTL):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.total_bytes = 0
+        self._entries = OrderedDict()  # key -> (value, tables, size, stored_at)
+        self._lock = threading.Lock()
+
+    def get(self, identity, query):
+        key = (identity, normalize_query(query))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl and time.monotonic() - entry[3] > self.ttl:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, identity, query, value, tables):
+        size = estimate_size(value)
+        # A single result may use at most a quarter of the cache
+        if size > self.max_bytes // 4:
+            return
+        key = (identity, normalize_query(query))
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, frozenset(tables), size, time.monotonic())
+            self.total_bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, identity, tables):
+        """Drop every cached result of this connection that references one of tables."""
+        tables = {table.lower() for table in tables}
+        with self._lock:
+            stale = [
+                key for key, entry in self._entries.items()
+                if key[0] == identity and entry[1] & tables
+            ]
+            for key in stale:
+                self._remove(key)
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self.total_bytes -= entry[2]
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+        }
+
+
+_cache = ResultCache() if RESULT_CACHE_ENABLED else None
+
+def get_result_cache():
+    """The process-wide result cache, or None when disabled."""
+    return _cache
+
+
+def cached_execute(db, query, tables, read_only, execute):
+    """
+    Serve a read-only query from the result cache or run execute() and cache its result.
+    Write statements always run and invalidate the cached results of the tables they touch.
+    """
+    cache = get_result_cache()
+    if cache is None:
+        return execute()
+    identity = connection_identity(db)
+    if not read_only:
+        try:
+            return execute()
+        finally:
+            cache.invalidate(identity, tables)
+    value = cache.get(identity, query)
+    if value is None:
+        value = execute()
+        cache.put(identity, query, value, tables)
+    return value
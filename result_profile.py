@@ -0,0 +1,231 @@
+import datetime
+import decimal
+from collections import Counter
+import pandas as pd
+from config import PROFILE_TOP_K
+
+"""
+Column statistics of query results for the summary prompt.
+Rows are profiled chunk by chunk as they come off the cursor: each chunk becomes a typed DataFrame and the
+per-column counts, nulls, min/max/mean, most frequent values and order are updated with vectorized operations,
+so a large result is described in a few lines instead of being pasted into the prompt.
+"""
+
+# Relative change of a fitted line below which a column counts as flat
+FLAT_TREND = 0.05
+
+# Longest text value shown in a profile
+MAX_VALUE_LENGTH = 40
+
+
+def _kind(values):
+    """"number", "date", "bool" or "text" for the non-null values of one chunk."""
+    dtype = values.dtype
+    if pd.api.types.is_bool_dtype(dtype):
+        return "bool"
+    if pd.api.types.is_numeric_dtype(dtype):
+        return "number"
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return "date"
+    if dtype == object:
+        types = set(values.map(type))
+        if types and all(issubclass(t, (int, float, decimal.Decimal)) and not issubclass(t, bool) for t in types):
+            return "number"
+        if types and all(issubclass(t, datetime.date) for t in types):
+            return "date"
+    return "text"
+
+
+class _ColumnStats:
+    def __init__(self, nulls=0):
+        self.kind = None
+        self.nulls = nulls
+        self.count = 0
+        self.min = None
+        self.max = None
+        self.total = 0.0
+        self.values = Counter()
+        # Least squares sums of value against row position, for the trend
+        self.sx = self.sy = self.sxx = self.sxy = 0.0
+        # Whether the column is sorted (so it can serve as the axis of a trend)
+        self.ascending = True
+        self.descending = True
+
+    def update(self, series, offset):
+        self.nulls += int(series.isna().sum())
+        values = series.dropna()
+        if values.empty:
+            return
+        kind = _kind(values)
+        if self.kind is None:
+            self.kind = kind
+        elif self.kind != kind:
+            # Mixed types (e.g. a MongoDB field holding numbers and strings): only counts stay meaningful
+            self.kind = "text"
+            self.min = self.max = None
+        if self.kind == "number":
+            values = values.astype(float)
+            positions = values.index.to_numpy(dtype=float) + offset
+            self.total += float(values.sum())
+            self.sx += positions.sum()
+            self.sy += float(values.sum())
+            self.sxx += float((positions * positions).sum())
+            self.sxy += float((positions * values.to_numpy()).sum())
+        if self.kind in ("number", "date"):
+            low, high = values.min(), values.max()
+            if self.max is not None:
+                self.ascending = self.ascending and values.iloc[0] >= self.max
+                self.descending = self.descending and values.iloc[0] <= self.min
+            self.ascending = self.ascending and values.is_monotonic_increasing
+            self.descending = self.descending and values.is_monotonic_decreasing
+            self.min = low if self.min is None else min(self.min, low)
+            self.max = high if self.max is None else max(self.max, high)
+        # Unhashable values (lists and sub-documents) are counted by their text
+        counted = values if self.kind in ("number", "bool", "date") else values.map(str)
+        self.values.update(counted.value_counts().to_dict())
+        self.count += len(values)
+
+    def slope(self):
+        """Slope of the least squares line of value against row position."""
+        n = self.count
+        denominator = n * self.sxx - self.sx * self.sx
+        if n < 3 or not denominator:
+            return 0.0
+        return (n * self.sxy - self.sx * self.sy) / denominator
+
+
+class ResultProfiler:
+    """Accumulates per-column statistics over the chunks of a result, one vectorized pass per chunk."""
+
+    def __init__(self, top_k=PROFILE_TOP_K):
+        self.top_k = top_k
+        self.rows = 0
+        self.columns = {}
+
+    def update(self, columns, rows):
+        """Add a chunk of rows (tuples in the order of columns)."""
+        if not rows:
+            return
+        frame = pd.DataFrame.from_records(rows, columns=range(len(columns)))
+        self._update(list(columns), frame)
+
+    def update_records(self, records):
+        """Add a chunk of flat dictionaries, e.g. flattened MongoDB documents; keys may vary between records."""
+        if not records:
+            return
+        frame = pd.DataFrame.from_records(records)
+        columns = list(frame.columns)
+        frame.columns = range(len(columns))
+        self._update(columns, frame)
+
+    def _update(self, columns, frame):
+        seen = set()
+        for position, name in enumerate(columns):
+            name = str(name)
+            # Repeated column names (e.g. two joined "id" columns) are profiled separately
+            while name in seen:
+                name += "'"
+            seen.add(name)
+            if name not in self.columns:
+                # A column first seen now was missing from every earlier row
+                self.columns[name] = _ColumnStats(nulls=self.rows)
+            self.columns[name].update(frame[position], self.rows)
+        for name, stats in self.columns.items():
+            if name not in seen:
+                stats.nulls += len(frame)
+        self.rows += len(frame)
+
+    def profile(self, total_rows=-1):
+        """The ResultProfile of the rows added so far; total_rows is the full row count (None if unknown)."""
+        axis, ascending = _axis(self.columns, self.rows)
+        columns = {}
+        for name, stats in self.columns.items():
+            column = columns[name] = _describe_column(stats, self.top_k)
+            if "change" in column and not ascending:
+                # Trends are described along the axis, not along the row order
+                column["change"] = -column["change"]
+        return ResultProfile(self.rows if total_rows == -1 else total_rows, self.rows, columns, axis)
+
+
+def _axis(columns, rows):
+    """The first sorted date or number column without nulls, along which trends are described, and its direction."""
+    for name, stats in columns.items():
+        if stats.kind in ("date", "number") and stats.count == rows and stats.min != stats.max \
+                and (stats.ascending or stats.descending):
+            return name, stats.ascending
+    return None, True
+
+
+def _describe_column(stats, top_k):
+    column = {"kind": stats.kind or "empty", "nulls": stats.nulls, "distinct": len(stats.values)}
+    if stats.min is not None:
+        column["min"] = stats.min
+        column["max"] = stats.max
+    if stats.kind == "number" and stats.count:
+        column["mean"] = stats.total / stats.count
+        column["change"] = stats.slope() * (stats.count - 1)
+    if stats.kind in ("text", "bool") or (stats.kind and len(stats.values) <= top_k):
+        column["top"] = stats.values.most_common(top_k)
+    return column
+
+
+def _format_value(value):
+    if hasattr(value, "item") and not isinstance(value, pd.Timestamp):
+        # numpy scalars
+        value = value.item()
+    if isinstance(value, float):
+        return f"{value:,.2f}".rstrip("0").rstrip(".")
+    if isinstance(value, int) and not isinstance(value, bool):
+        return f"{value:,}"
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat() if value.time() != datetime.time() else value.date().isoformat()
+    text = str(value)
+    return text if len(text) <= MAX_VALUE_LENGTH else text[:MAX_VALUE_LENGTH - 3] + "..."
+
+
+class ResultProfile:
+    """Row count and per-column statistics of a result, described as text for the summary prompt."""
+
+    def __init__(self, total_rows, profiled_rows, columns, axis=None):
+        self.total_rows = total_rows
+        self.profiled_rows = profiled_rows
+        self.columns = columns
+        self.axis = axis
+
+    def describe(self):
+        if self.total_rows == self.profiled_rows:
+            lines = [f"Rows: {self.total_rows:,} (statistics over all rows)"]
+        else:
+            total = f"{self.total_rows:,}" if self.total_rows is not None else "an unknown number of"
+            lines = [f"Rows: {total} (statistics over the first {self.profiled_rows:,} rows)"]
+        lines.append("Columns:")
+        for name, column in self.columns.items():
+            parts = [f"{column['nulls']:,} nulls", f"{column['distinct']:,} distinct"]
+            if "min" in column:
+                parts.append(f"min {_format_value(column['min'])}")
+                parts.append(f"max {_format_value(column['max'])}")
+            if "mean" in column:
+                parts.append(f"mean {_format_value(column['mean'])}")
+            if "top" in column:
+                parts.append("most frequent " + ", ".join(
+                    f"{_format_value(value)} ({count:,})" for value, count in column["top"]))
+            if self.axis and name != self.axis and "change" in column:
+                parts.append(_trend(column, self.axis))
+            lines.append(f"- {name} ({column['kind']}): " + "; ".join(parts))
+        return "\n".join(lines)
+
+
+def _trend(column, axis):
+    change = column["change"]
+    scale = abs(column["mean"]) or max(abs(column["min"]), abs(column["max"])) or 1
+    if abs(change) / scale < FLAT_TREND:
+        return f"flat along {axis}"
+    direction = "rising" if change > 0 else "falling"
+    return f"{direction} along {axis} ({change / scale:+.0%} of the mean across its range)"
+
+
+def profile_rows(columns, rows, total_rows=-1, top_k=PROFILE_TOP_K):
+    """Profile of rows already in memory."""
+    profiler = ResultProfiler(top_k)
+    profiler.update(columns, rows)
+    return profiler.profile(total_rows)
@@ -0,0 +1,132 @@
+import json
+from result_profile import profile_rows
+from config import MAX_PROMPT_ROWS, PROFILE_SAMPLE_ROWS
+
+"""
+Builds the result table locally from the rows returned by the database instead of asking the LLM to format it.
+"""
+
+# Default total_rows: rows holds the whole result
+_ALL = object()
+
+
+class QueryResult:
+    """
+    Column names plus typed rows (tuples) of a query result.
+    rows may hold only the first part of the result, total_rows is the full row count (None if unknown,
+    left out when rows is the whole result).
+    """
+
+    def __init__(self, columns, rows, total_rows=_ALL, documents=None):
+        self.columns = list(columns)
+        self.rows = rows
+        self.total_rows = len(rows) if total_rows is _ALL else total_rows
+        # The original documents of a MongoDB result, before flattening
+        self.documents = documents
+        # Shown under the table, e.g. when the cost guard limited the query
+        self.notice = None
+        # Column statistics for the summary prompt (result_profile.ResultProfile), set by the executors
+        self.profile = None
+
+    def __len__(self):
+        return len(self.rows)
+
+    @property
+    def truncated(self):
+        return self.total_rows is None or self.total_rows > len(self.rows)
+
+    def records(self):
+        """Rows as dictionaries keyed by column name."""
+        return [dict(zip(self.columns, row)) for row in self.rows]
+
+
+def flatten_document(doc, prefix=""):
+    """Flatten nested sub-documents into dotted keys, e.g. {"a": {"b": 1}} -> {"a.b": 1}."""
+    flat = {}
+    for key, value in doc.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten_document(value, f"{name}."))
+        else:
+            flat[name] = value
+    return flat
+
+
+def table_record(doc):
+    """A document as one flat table row: dotted keys, without an ObjectId `_id`."""
+    # bson and pymongo are only loaded for MongoDB databases
+    from bson import ObjectId
+    if isinstance(doc.get("_id"), ObjectId):
+        doc = {key: value for key, value in doc.items() if key != "_id"}
+    return flatten_document(doc)
+
+
+def mongo_result(docs, total_rows=_ALL):
+    """
+    Build a QueryResult from MongoDB documents (find or aggregate output).
+    total_rows is the number of matching documents when docs holds only the first ones (None if unknown).
+    Nested fields become dotted columns. Document ids (ObjectId `_id`) are left out,
+    while a non-ObjectId `_id`, i.e. the group key of an aggregation, is kept.
+    """
+    columns = []
+    seen = set()
+    flat_docs = []
+    for doc in docs:
+        flat = table_record(doc)
+        for column in flat:
+            if column not in seen:
+                seen.add(column)
+                columns.append(column)
+        flat_docs.append(flat)
+    rows = [tuple(flat.get(column) for column in columns) for flat in flat_docs]
+    return QueryResult(columns, rows, total_rows, documents=list(docs))
+
+
+def _format_cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, (list, tuple)):
+        # bson's encoder also covers ObjectId and dates inside MongoDB arrays
+        from bson import json_util
+        value = json.dumps(value, default=json_util.default)
+    # Pipes and line breaks would break the markdown table
+    return str(value).replace("|", "\\|").replace("\r", " ").replace("\n", " ")
+
+
+def to_markdown(result):
+    """Render a QueryResult as a markdown table."""
+    if not result.columns:
+        return "_The query returned no rows._"
+    header = "| " + " | ".join(_format_cell(column) for column in result.columns) + " |"
+    separator = "|" + "|".join("---" for _ in result.columns) + "|"
+    lines = [header, separator]
+    for row in result.rows:
+        lines.append("| " + " | ".join(_format_cell(value) for value in row) + " |")
+    if result.truncated:
+        total = f"{result.total_rows:,}" if result.total_rows is not None else "more"
+        lines.append(f"\n_Showing the first {len(result.rows):,} of {total} rows._")
+    if result.notice:
+        lines.append(f"\n_{result.notice}_")
+    return "\n".join(lines)
+
+
+def prompt_data(result, max_rows=MAX_PROMPT_ROWS, sample_rows=PROFILE_SAMPLE_ROWS):
+    """
+    The result as passed to the summary prompt: every row when it has at most max_rows,
+    otherwise the column profile plus the first sample_rows rows.
+    MongoDB results are passed as their original documents.
+    """
+    if result.total_rows is not None and result.total_rows <= max_rows and len(result.rows) == result.total_rows:
+        return _prompt_rows(result, max_rows)
+    profile = result.profile
+    if profile is None:
+        # Results built without an executor (e.g. pages) are profiled from the rows in memory
+        profile = profile_rows(result.columns, result.rows, result.total_rows)
+    return f"{profile.describe()}\nSample of the first {min(sample_rows, len(result.rows)):,} rows:\n{_prompt_rows(result, sample_rows)}"
+
+
+def _prompt_rows(result, count):
+    if result.documents is not None:
+        from bson import json_util
+        return json.dumps(result.documents[:count], default=json_util.default)
+    return str(result.rows[:count])
@@ -0,0 +1,153 @@
+import hashlib
+import threading
+import time
+import weakref
+from config import SCHEMA_CHECK_INTERVAL
+
+"""
+Caches the schema description of a SQL database per connection.
+The cache is keyed by a cheap fingerprint of the catalog so it is only rebuilt when the schema changes.
+"""
+
+# Fingerprint queries per dialect, each returns a single row
+FINGERPRINT_QUERIES = {
+    "mysql": """
+        SELECT
+            (SELECT COUNT(*) FROM information_schema.TABLES WHERE TABLE_SCHEMA = COALESCE(:schema, DATABASE())),
+            (SELECT MAX(CREATE_TIME) FROM information_schema.TABLES WHERE TABLE_SCHEMA = COALESCE(:schema, DATABASE())),
+            (SELECT COUNT(*) FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = COALESCE(:schema, DATABASE())),
+            (SELECT SUM(CRC32(CONCAT_WS('.', TABLE_NAME, COLUMN_NAME, COLUMN_TYPE)))
+                FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = COALESCE(:schema, DATABASE()))
+    """,
+    "postgresql": """
+        SELECT
+            (SELECT COUNT(*) FROM information_schema.tables WHERE table_schema = COALESCE(:schema, current_schema())),
+            (SELECT COUNT(*) FROM information_schema.columns WHERE table_schema = COALESCE(:schema, current_schema())),
+            (SELECT md5(string_agg(table_name || '.' || column_name || ':' || data_type, ',' ORDER BY table_name, ordinal_position))
+                FROM information_schema.columns WHERE table_schema = COALESCE(:schema, current_schema()))
+    """,
+    "sqlite": """
+        SELECT COUNT(*), group_concat(name || ':' || COALESCE(sql, ''), ';')
+        FROM (SELECT name, sql FROM sqlite_master WHERE type IN ('table', 'view') ORDER BY name)
+    """,
+}
+
+
+class SchemaCache:
+    """
+    Holds the get_table_info() output of one SQLDatabase and rebuilds it only when the fingerprint changes.
+    """
+
+    def __init__(self, db, check_interval=SCHEMA_CHECK_INTERVAL):
+        self.db = db
+        self.check_interval = check_interval
+        self.hits = 0
+        self.misses = 0
+        self._fingerprint = None
+        self._checked_at = 0.0
+        self._entries = {}
+        self._derived = {}
+        self._lock = threading.RLock()
+
+    def compute_fingerprint(self):
+        """Run the cheap catalog query for this dialect and hash its result."""
+        # SQLAlchemy is imported on first use, so MongoDB-only processes never load it
+        from sqlalchemy import inspect, text
+        engine = self.db._engine
+        query = FINGERPRINT_QUERIES.get(engine.dialect.name)
+        if query is not None:
+            with engine.connect() as connection:
+                row = connection.execute(text(query), {"schema": self.db._schema}).fetchone()
+            payload = repr(tuple(row))
+        else:
+            # Unknown dialect: fall back to the list of table names
+            payload = repr(sorted(inspect(engine).get_table_names(schema=self.db._schema)))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def fingerprint(self):
+        """Return the current fingerprint, re-checking the database at most every check_interval seconds."""
+        with self._lock:
+            now = time.monotonic()
+            if self._fingerprint is None or now - self._checked_at >= self.check_interval:
+                fingerprint = self.compute_fingerprint()
+                if self._fingerprint is not None and fingerprint != self._fingerprint:
+                    # Schema changed, drop everything and re-reflect the tables
+                    self._entries.clear()
+                    self._derived.clear()
+                    _reflect_again(self.db)
+                self._fingerprint = fingerprint
+                self._checked_at = now
+            return self._fingerprint
+
+    def get_table_info(self, table_names=None):
+        """Cached replacement for db.get_table_info()."""
+        key = tuple(sorted(table_names)) if table_names is not None else None
+        with self._lock:
+            self.fingerprint()
+            if key in self._entries:
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            info = self.db.get_table_info(list(key) if key is not None else None)
+            self._entries[key] = info
+            return info
+
+    def get_or_build(self, name, builder):
+        """Cache any structure derived from the schema (e.g. a search index) under the same fingerprint."""
+        with self._lock:
+            self.fingerprint()
+            if name not in self._derived:
+                self._derived[name] = builder(self.db)
+            return self._derived[name]
+
+    def invalidate(self):
+        """Forget the cached schema so the next call rebuilds it."""
+        with self._lock:
+            self._entries.clear()
+            self._derived.clear()
+            self._fingerprint = None
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self._entries),
+        }
+
+
+def _reflect_again(db):
+    """Refresh the table list and reflected metadata held by a SQLDatabase after a schema change."""
+    from sqlalchemy import inspect
+    inspector = inspect(db._engine)
+    all_tables = set(inspector.get_table_names(schema=db._schema))
+    if db._view_support:
+        all_tables.update(inspector.get_view_names(schema=db._schema))
+    db._all_tables = all_tables
+    db._usable_tables = set(db.get_usable_table_names()) or all_tables
+    db._metadata.clear()
+    db._metadata.reflect(
+        views=db._view_support,
+        bind=db._engine,
+        only=list(db._usable_tables),
+        schema=db._schema,
+    )
+
+
+# One cache per connection object, dropped together with the connection
+_caches = weakref.WeakKeyDictionary()
+_caches_lock = threading.Lock()
+
+def get_schema_cache(db):
+    """Return the SchemaCache attached to this database connection."""
+    with _caches_lock:
+        cache = _caches.get(db)
+        if cache is None:
+            cache = SchemaCache(db)
+            _caches[db] = cache
+        return cache
+
+def get_table_info(db, table_names=None):
+    """Return the (cached) schema description for db."""
+    return get_schema_cache(db).get_table_info(table_names)
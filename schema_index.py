@@ -0,0 +1,183 @@
+import math
+import re
+from collections import Counter
+from schema_cache import get_schema_cache, get_table_info
+from tokens import count_tokens
+from history_manager import strip_tables
+from config import SCHEMA_TOP_K, SCHEMA_TOKEN_BUDGET
+
+"""
+Local retrieval index over tables/collections so only the schema relevant to a question is sent to the LLM.
+Scores with BM25 over table names, column names, foreign keys and comments, then expands along foreign keys.
+Runs fully offline, no embedding service needed.
+"""
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "give", "how", "i", "in", "is", "it",
+    "list", "many", "me", "much", "of", "on", "or", "show", "that", "the", "their", "them", "there", "this",
+    "to", "top", "was", "what", "which", "who", "with", "all", "each", "per", "get", "find", "do", "does",
+}
+
+# Name tokens are repeated so a hit on the table name outweighs a hit on a column
+NAME_WEIGHT = 3
+
+
+def tokenize(text):
+    """Split identifiers and free text into lowercase, singularized word tokens."""
+    text = re.sub(r"([a-z0-9])([A-Z])", r"\1 \2", str(text))
+    tokens = []
+    for word in re.split(r"[^A-Za-z0-9]+", text.lower()):
+        if not word or word in STOPWORDS:
+            continue
+        if len(word) > 4 and word.endswith("ies"):
+            word = word[:-3] + "y"
+        elif len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        tokens.append(word)
+    return tokens
+
+
+class SchemaIndex:
+    """
+    BM25 index over one text document per table, plus the foreign-key graph between tables.
+    """
+
+    def __init__(self, documents, links=None, k1=1.5, b=0.75):
+        self.names = sorted(documents)
+        self.links = links or {}
+        self.k1 = k1
+        self.b = b
+        self._terms = {name: Counter(tokenize(documents[name])) for name in self.names}
+        self._lengths = {name: sum(terms.values()) for name, terms in self._terms.items()}
+        self._avg_length = (sum(self._lengths.values()) / len(self.names)) if self.names else 0.0
+        document_frequency = Counter()
+        for terms in self._terms.values():
+            document_frequency.update(terms.keys())
+        total = len(self.names)
+        self._idf = {
+            term: math.log(1 + (total - freq + 0.5) / (freq + 0.5))
+            for term, freq in document_frequency.items()
+        }
+
+    def search(self, text, top_k=SCHEMA_TOP_K):
+        """Return up to top_k (name, score) pairs with a positive score, best first."""
+        query_terms = set(tokenize(text))
+        scores = []
+        for name in self.names:
+            terms = self._terms[name]
+            length_norm = self.k1 * (1 - self.b + self.b * self._lengths[name] / (self._avg_length or 1))
+            score = 0.0
+            for term in query_terms:
+                freq = terms.get(term)
+                if freq:
+                    score += self._idf[term] * freq * (self.k1 + 1) / (freq + length_norm)
+            if score > 0:
+                scores.append((name, score))
+        scores.sort(key=lambda item: (-item[1], item[0]))
+        return scores[:top_k]
+
+    def select(self, text, sizes, top_k=SCHEMA_TOP_K, token_budget=SCHEMA_TOKEN_BUDGET):
+        """
+        Pick the tables to describe for this question.
+        Direct hits come first, then their foreign-key neighbours, all within token_budget
+        (sizes maps each name to the token count of its description).
+        """
+        hits = [name for name, _ in self.search(text, top_k)]
+        if hits:
+            candidates = list(hits)
+            for name in hits:
+                for neighbour in sorted(self.links.get(name, ())):
+                    if neighbour not in candidates and neighbour in sizes:
+                        candidates.append(neighbour)
+        else:
+            # Nothing matched (e.g. a vague follow-up), describe as much of the schema as fits
+            candidates = list(self.names)
+
+        selected = []
+        used = 0
+        for name in candidates:
+            size = sizes.get(name, 0)
+            if selected and used + size > token_budget:
+                continue
+            selected.append(name)
+            used += size
+        return selected
+
+
+def build_sql_index(db):
+    """Build the index from the metadata already reflected by SQLDatabase (no extra round trips)."""
+    usable = set(db.get_usable_table_names())
+    documents = {}
+    links = {name: set() for name in usable}
+    for table in db._metadata.sorted_tables:
+        if table.name not in usable:
+            continue
+        parts = [table.name] * NAME_WEIGHT
+        if table.comment:
+            parts.append(table.comment)
+        for column in table.columns:
+            parts.append(column.name)
+            if column.comment:
+                parts.append(column.comment)
+        for fk in table.foreign_keys:
+            target = fk.column.table.name
+            parts.append(target)
+            if target in usable and target != table.name:
+                links[table.name].add(target)
+                links[target].add(table.name)
+        documents[table.name] = " ".join(parts)
+    for name in usable - set(documents):
+        documents[name] = " ".join([name] * NAME_WEIGHT)
+    return SchemaIndex(documents, links)
+
+
+def _sql_table_sizes(db):
+    """
+    Estimated token size of each table's description, used for budgeting.
+    Estimated from reflected metadata so no sample-row queries run for tables that are never selected.
+    """
+    sample_rows = db._sample_rows_in_table_info or 0
+    sizes = {}
+    for table in db._metadata.sorted_tables:
+        ddl = " ".join(f"{column.name} {column.type!r}," for column in table.columns)
+        # CREATE TABLE header, column definitions and one header plus sample_rows rows of values
+        sizes[table.name] = count_tokens(f"CREATE TABLE {table.name} ( {ddl} )") + (sample_rows + 1) * len(table.columns) * 3
+    return sizes
+
+
+def get_relevant_sql_schema(db, text, top_k=SCHEMA_TOP_K, token_budget=SCHEMA_TOKEN_BUDGET):
+    """Return the schema description of the tables relevant to text."""
+    cache = get_schema_cache(db)
+    index = cache.get_or_build("schema_index", build_sql_index)
+    if len(index.names) <= top_k:
+        # Small schema, nothing worth pruning
+        return get_table_info(db)
+    sizes = cache.get_or_build("table_sizes", _sql_table_sizes)
+    selected = index.select(text, sizes, top_k, token_budget)
+    return get_table_info(db, selected)
+
+
+def get_relevant_mongo_schema(descriptions, text, top_k=SCHEMA_TOP_K, token_budget=SCHEMA_TOKEN_BUDGET):
+    """
+    descriptions maps each collection name to its schema text.
+    Returns the joined descriptions of the collections relevant to text.
+    """
+    if len(descriptions) > top_k:
+        documents = {
+            name: " ".join([name] * NAME_WEIGHT + [description])
+            for name, description in descriptions.items()
+        }
+        sizes = {name: count_tokens(description) for name, description in descriptions.items()}
+        selected = SchemaIndex(documents).select(text, sizes, top_k, token_budget)
+    else:
+        selected = sorted(descriptions)
+    return "\n\n".join(descriptions[name] for name in selected)
+
+
+def retrieval_text(question, chat_history=None, turns=2):
+    """The question plus the last few messages, so follow-up questions still find their tables."""
+    if isinstance(chat_history, str):
+        recent = chat_history.splitlines()[-turns:]
+    else:
+        recent = [strip_tables(getattr(message, "content", str(message))) for message in (chat_history or [])[-turns:]]
+    return "\n".join(recent + [question])
@@ -0,0 +1,91 @@
+from sqlalchemy import text
+from result_table import QueryResult
+from result_profile import ResultProfiler
+from query_guard import guard_query, set_statement_timeout, has_limit
+from config import SQL_FETCH_SIZE, MAX_DISPLAY_ROWS, SQL_STATEMENT_TIMEOUT, PROFILE_MAX_ROWS
+
+"""
+Executes generated SQL on the engine behind a SQLDatabase and keeps the column names and typed rows.
+Rows are fetched in chunks from a server-side cursor and only the first max_rows are kept in memory.
+Every statement runs under a server-side timeout, and generated statements pass the cost guard first.
+"""
+
+def _prepare(connection, db, timeout=SQL_STATEMENT_TIMEOUT):
+    if db._schema is not None and db.dialect == "postgresql":
+        connection.exec_driver_sql("SET search_path TO %s", (db._schema,))
+    set_statement_timeout(connection, db.dialect, timeout)
+
+
+def _strip(query):
+    return query.strip().rstrip(";").strip()
+
+
+def count_rows(connection, query):
+    """True row count of a SELECT, or None when the database cannot count it as a subquery."""
+    try:
+        # Savepoint so a failed count does not abort the surrounding transaction
+        with connection.begin_nested():
+            return connection.execute(
+                text(f"SELECT COUNT(*) FROM ({_strip(query)}) AS querybuddy_count")
+            ).scalar()
+    except Exception:
+        return None
+
+
+def execute_sql(db, query, max_rows=MAX_DISPLAY_ROWS, fetch_size=SQL_FETCH_SIZE, profile_rows=PROFILE_MAX_ROWS):
+    """
+    Run query in its own transaction and return a QueryResult holding at most max_rows rows.
+    The first profile_rows rows are profiled as they stream past (see result_profile).
+    When more rows exist, the total is counted with a COUNT(*) over the query instead of fetching them.
+    Raises QueryBlocked when the planner estimates the query as too expensive.
+    """
+    with db._engine.begin() as connection:
+        _prepare(connection, db)
+        guarded = guard_query(connection, db.dialect, query)
+        cursor = connection.execution_options(stream_results=True, max_row_buffer=fetch_size).execute(text(guarded))
+        if not cursor.returns_rows:
+            return QueryResult([], [])
+        columns = list(cursor.keys())
+        # Rows past the displayed ones are still read, up to profile_rows, for the result profile only
+        read_limit = max(max_rows, profile_rows)
+        profiler = ResultProfiler()
+        rows = []
+        read = 0
+        exhausted = False
+        while read < read_limit:
+            chunk = cursor.fetchmany(min(fetch_size, read_limit - read))
+            if not chunk:
+                exhausted = True
+                break
+            chunk = [tuple(row) for row in chunk]
+            profiler.update(columns, chunk)
+            if len(rows) < max_rows:
+                rows.extend(chunk[:max_rows - len(rows)])
+            read += len(chunk)
+        if not exhausted:
+            # Peeking one row ahead tells whether the result was cut off
+            exhausted = cursor.fetchone() is None
+        cursor.close()
+        if guarded != query:
+            # Counting the unlimited query would cost what the guard just avoided
+            result = QueryResult(columns, rows, read if exhausted else None)
+            result.notice = "The query was estimated as too expensive to run in full, so an automatic LIMIT was added."
+        else:
+            result = QueryResult(columns, rows, read if exhausted else count_rows(connection, query))
+        result.profile = profiler.profile(result.total_rows)
+        return result
+
+
+def fetch_page(db, query, offset, limit):
+    """Fetch one page of a SELECT's result with LIMIT/OFFSET."""
+    page = f"LIMIT {int(limit)} OFFSET {int(offset)}"
+    if has_limit(query):
+        # Its own LIMIT decides which rows belong to the result, so the page is taken from it as a subquery
+        page_query = f"SELECT * FROM ({_strip(query)}) AS querybuddy_page {page}"
+    else:
+        # Appended to the statement itself, MySQL drops the ORDER BY of a subquery without LIMIT
+        page_query = f"{_strip(query)} {page}"
+    with db._engine.connect() as connection:
+        _prepare(connection, db)
+        cursor = connection.execute(text(guard_query(connection, db.dialect, page_query, action="reject")))
+        return QueryResult(cursor.keys(), [tuple(row) for row in cursor.fetchall()])
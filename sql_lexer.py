@@ -0,0 +1,135 @@
+import re
+from functools import lru_cache
+
+"""
+Single-pass SQL tokenizer shared by the stages that inspect generated SQL (validation, table extraction for the
+result cache, formatting). A statement is scanned once into (kind, text) tokens with string literals, quoted
+identifiers and comments kept whole; results are memoized on the query text.
+"""
+
+TOKEN_PATTERN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<comment>--[^\n]*|\#[^\n]*|/\*.*?\*/)
+  | (?P<string>'(?:[^'\\]|\\.|'')*'|\$\$.*?\$\$)
+  | (?P<quoted>"(?:[^"]|"")*"|`(?:[^`]|``)*`)
+  | (?P<number>\d+(?:\.\d*)?(?:[eE][-+]?\d+)?)
+  | (?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+  | (?P<operator>::|<>|<=|>=|!=|\|\||->>|->)
+  | (?P<other>.)
+""", re.VERBOSE | re.DOTALL)
+
+# Keywords after which table names follow
+TABLE_KEYWORDS = {"from", "join", "update", "into"}
+
+# Words after FROM/JOIN that do not name a table
+NOT_TABLES = {"select", "lateral", "unnest", "only", "values"}
+
+# Functions whose arguments contain FROM (EXTRACT(YEAR FROM d), SUBSTRING(s FROM 2), ...)
+FROM_FUNCTIONS = {"extract", "substring", "trim", "position", "overlay"}
+
+# Words that end a table reference, so they are not taken for an alias
+CLAUSE_WORDS = {
+    "where", "join", "inner", "left", "right", "full", "cross", "natural", "on", "using", "group", "order",
+    "having", "limit", "offset", "union", "intersect", "except", "window", "set", "values", "fetch", "for",
+    "straight_join", "outer", "returning", "select", "partition", "use", "force", "ignore", "into", "lateral",
+}
+
+
+@lru_cache(maxsize=256)
+def scan(query):
+    """Every token of query as (kind, text), whitespace and comments included, so the text can be rebuilt."""
+    return tuple((match.lastgroup, match.group()) for match in TOKEN_PATTERN.finditer(query))
+
+
+@lru_cache(maxsize=256)
+def sql_tokens(query):
+    """(kind, text) pairs of a SQL statement, whitespace and comments dropped."""
+    return tuple(token for token in scan(query) if token[0] not in ("space", "comment"))
+
+
+def token_name(token):
+    """Identifier text without quotes, lowercased."""
+    kind, text = token
+    if kind == "quoted":
+        return text[1:-1].lower()
+    return text.lower()
+
+
+def is_identifier(token):
+    return token[0] in ("word", "quoted")
+
+
+class TableReference:
+    """A table named in a statement: its dotted name parts, its alias and the token positions it spans."""
+
+    def __init__(self, parts, alias, start, end):
+        self.parts = parts
+        self.alias = alias
+        self.start = start
+        self.end = end
+
+    @property
+    def name(self):
+        return self.parts[-1]
+
+
+def table_references(tokens, keywords=TABLE_KEYWORDS):
+    """
+    The tables named after keywords (FROM, JOIN, UPDATE, INTO by default), comma separated lists included.
+    Table functions, subqueries and the FROM inside EXTRACT(... FROM ...) or IS DISTINCT FROM are skipped.
+    """
+    references = []
+    stack = []
+    index = 0
+    while index < len(tokens):
+        kind, text = tokens[index]
+        lower = text.lower()
+        if text == "(" and kind == "other":
+            before = tokens[index - 1] if index else ("other", "")
+            stack.append(before[1].lower() if before[0] == "word" else "")
+        elif text == ")" and kind == "other" and stack:
+            stack.pop()
+        previous = tokens[index - 1][1].lower() if index else ""
+        starts_tables = kind == "word" and lower in keywords and not (
+            # EXTRACT(YEAR FROM d), a IS DISTINCT FROM b
+            (lower == "from" and (stack and stack[-1] in FROM_FUNCTIONS or previous == "distinct"))
+            # ON DUPLICATE KEY UPDATE, SELECT ... FOR UPDATE
+            or (lower == "update" and previous in ("key", "for"))
+        )
+        if not starts_tables:
+            index += 1
+            continue
+        index += 1
+        # CREATE TABLE IF NOT EXISTS t, DROP TABLE IF EXISTS t
+        if index < len(tokens) and tokens[index][1].lower() == "if":
+            while index < len(tokens) and tokens[index][1].lower() in ("if", "not", "exists"):
+                index += 1
+        # One or more comma separated table references
+        while index < len(tokens) and is_identifier(tokens[index]) and token_name(tokens[index]) not in NOT_TABLES:
+            start = index
+            parts = [token_name(tokens[index])]
+            while index + 2 < len(tokens) and tokens[index + 1][1] == "." and is_identifier(tokens[index + 2]):
+                parts.append(token_name(tokens[index + 2]))
+                index += 2
+            if index + 1 < len(tokens) and tokens[index + 1][1] == "(":
+                if lower in ("into", "table"):
+                    # INSERT INTO t (a, b), CREATE TABLE t (...): a column list follows
+                    references.append(TableReference(parts, None, start, index))
+                # Otherwise a table function such as generate_series(...)
+                break
+            end = index
+            alias = None
+            index += 1
+            # Optional alias
+            if index < len(tokens) and tokens[index][1].lower() == "as":
+                index += 1
+            if index < len(tokens) and is_identifier(tokens[index]) and token_name(tokens[index]) not in CLAUSE_WORDS \
+                    and tokens[index][1] not in ("(", ","):
+                alias = token_name(tokens[index])
+                index += 1
+            references.append(TableReference(parts, alias, start, end))
+            if index < len(tokens) and tokens[index][1] == ",":
+                index += 1
+                continue
+            break
+    return references
@@ -0,0 +1,96 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from config import PIPELINE_WORKERS
+
+"""
+Runs pipeline stages on a shared thread pool so independent stages overlap,
+with a timeout per stage so one slow call cannot hold the Streamlit script run.
+"""
+
+_executor = ThreadPoolExecutor(max_workers=PIPELINE_WORKERS, thread_name_prefix="querybuddy-stage")
+
+
+class StageTimeout(Exception):
+    """Raised when a stage does not finish within its timeout."""
+
+    def __init__(self, stage, timeout):
+        super().__init__(f"{stage} timed out after {timeout:g}s")
+        self.stage = stage
+        self.timeout = timeout
+
+
+def submit(fn, *args, **kwargs):
+    """Start fn in the background and return its Future."""
+    return _executor.submit(fn, *args, **kwargs)
+
+
+def wait_for(stage, future, timeout):
+    """
+    Wait for a submitted stage. On timeout the future is cancelled if it has not started yet;
+    a stage that is already running is abandoned and its result discarded. Its thread keeps waiting on the
+    database or the LLM until their own limits end the call: the server-side statement timeouts, which are
+    capped at EXECUTION_TIMEOUT (see config.py), and LLM_REQUEST_TIMEOUT.
+    """
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeoutError:
+        future.cancel()
+        raise StageTimeout(stage, timeout)
+
+
+def run_stage(stage, timeout, fn, *args, **kwargs):
+    """Run fn on the pool and wait for it with a timeout."""
+    return wait_for(stage, submit(fn, *args, **kwargs), timeout)
+
+
+_DONE = object()
+
+def stream_stage(stage, timeout, make_iterator):
+    """
+    Start consuming make_iterator() on the pool right away and return a generator over its items.
+    The whole stream must finish within timeout; on timeout (or when the consumer stops early)
+    the producer is told to stop and closes the underlying iterator.
+    """
+    items = queue.Queue()
+    cancelled = threading.Event()
+
+    def produce():
+        iterator = None
+        try:
+            iterator = make_iterator()
+            for item in iterator:
+                if cancelled.is_set():
+                    break
+                items.put((item, None))
+        except Exception as e:
+            items.put((None, e))
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+            items.put((_DONE, None))
+
+    submit(produce)
+    deadline = time.monotonic() + timeout
+
+    def consume():
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise StageTimeout(stage, timeout)
+                try:
+                    item, error = items.get(timeout=remaining)
+                except queue.Empty:
+                    raise StageTimeout(stage, timeout)
+                if error is not None:
+                    raise error
+                if item is _DONE:
+                    return
+                yield item
+        finally:
+            cancelled.set()
+
+    return consume()
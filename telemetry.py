@@ -0,0 +1,239 @@
+import json
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import METRICS_ENABLED, METRICS_JSONL_PATH, METRICS_PORT
+
+"""
+Structured spans around the pipeline stages and an in-process metrics registry.
+Every question gets a Trace, each stage a Span with its duration and counts (tokens, rows, bytes).
+Finished spans feed the registry, which can be exported as Prometheus text or appended to a JSONL file.
+Only sizes and timings are recorded, never queries or data.
+"""
+
+# Upper bounds of the duration histogram buckets, in seconds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# Durations kept per stage for the percentiles shown in the app
+RECENT_DURATIONS = 1000
+
+
+class Span:
+    """One timed stage of a trace with numeric attributes such as rows, bytes or tokens."""
+
+    def __init__(self, trace_id, name, attributes=None):
+        self.trace_id = trace_id
+        self.name = name
+        self.attributes = dict(attributes or {})
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.duration = None
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def elapsed(self):
+        """Seconds since the span started."""
+        return time.perf_counter() - self._start
+
+    def end(self):
+        if self.duration is None:
+            self.duration = time.perf_counter() - self._start
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "stage": self.name,
+            "started_at": self.started_at,
+            "duration": self.duration,
+            "error": self.error,
+            **self.attributes,
+        }
+
+
+class Trace:
+    """The spans of one question, in the order they finished."""
+
+    def __init__(self, registry=None):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.spans = []
+        self.registry = registry if registry is not None else get_metrics()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """Time the block as stage name; exceptions are recorded on the span and re-raised."""
+        span = Span(self.trace_id, name, attributes)
+        try:
+            yield span
+        except Exception as e:
+            span.error = type(e).__name__
+            raise
+        finally:
+            span.end()
+            with self._lock:
+                self.spans.append(span)
+            if self.registry is not None:
+                self.registry.record(span)
+
+    def durations(self):
+        """{stage: seconds} of the finished spans."""
+        with self._lock:
+            return {span.name: span.duration for span in self.spans}
+
+
+class _StageMetrics:
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.duration_sum = 0.0
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.totals = {}
+        self.recent = deque(maxlen=RECENT_DURATIONS)
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+class MetricsRegistry:
+    """
+    Per-stage counters, duration histograms and sums of the numeric span attributes.
+    """
+
+    def __init__(self, jsonl_path=METRICS_JSONL_PATH):
+        self.jsonl_path = jsonl_path
+        self._stages = {}
+        self._lock = threading.Lock()
+        self._file_lock = threading.Lock()
+
+    def record(self, span):
+        with self._lock:
+            stage = self._stages.setdefault(span.name, _StageMetrics())
+            stage.count += 1
+            stage.duration_sum += span.duration
+            stage.recent.append(span.duration)
+            if span.error:
+                stage.errors += 1
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if span.duration <= bound:
+                    stage.buckets[i] += 1
+            # Counts add up across spans, timings do not
+            for key, value in span.attributes.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool) and not key.endswith("_seconds"):
+                    stage.totals[key] = stage.totals.get(key, 0) + value
+        if self.jsonl_path:
+            line = json.dumps(span.to_dict(), default=str)
+            with self._file_lock, open(self.jsonl_path, "a", encoding="utf-8") as file:
+                file.write(line + "\n")
+
+    def summary(self):
+        """{stage: {"count", "errors", "p50", "p95", "mean"}} over the recent durations."""
+        with self._lock:
+            return {
+                name: {
+                    "count": stage.count,
+                    "errors": stage.errors,
+                    "p50": _percentile(stage.recent, 0.5),
+                    "p95": _percentile(stage.recent, 0.95),
+                    "mean": stage.duration_sum / stage.count,
+                }
+                for name, stage in self._stages.items() if stage.recent
+            }
+
+    def prometheus_text(self):
+        """The registry in the Prometheus text exposition format."""
+        lines = [
+            "# HELP querybuddy_stage_duration_seconds Duration of pipeline stages.",
+            "# TYPE querybuddy_stage_duration_seconds histogram",
+        ]
+        with self._lock:
+            stages = sorted(self._stages.items())
+            for name, stage in stages:
+                for bound, count in zip(DURATION_BUCKETS, stage.buckets):
+                    lines.append(f'querybuddy_stage_duration_seconds_bucket{{stage="{name}",le="{bound}"}} {count}')
+                lines.append(f'querybuddy_stage_duration_seconds_bucket{{stage="{name}",le="+Inf"}} {stage.count}')
+                lines.append(f'querybuddy_stage_duration_seconds_sum{{stage="{name}"}} {stage.duration_sum}')
+                lines.append(f'querybuddy_stage_duration_seconds_count{{stage="{name}"}} {stage.count}')
+            lines.append("# HELP querybuddy_stage_errors_total Pipeline stages that failed.")
+            lines.append("# TYPE querybuddy_stage_errors_total counter")
+            for name, stage in stages:
+                lines.append(f'querybuddy_stage_errors_total{{stage="{name}"}} {stage.errors}')
+            keys = sorted({key for _, stage in stages for key in stage.totals})
+            for key in keys:
+                lines.append(f"# TYPE querybuddy_stage_{key}_total counter")
+                for name, stage in stages:
+                    if key in stage.totals:
+                        lines.append(f'querybuddy_stage_{key}_total{{stage="{name}"}} {stage.totals[key]}')
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+
+
+_metrics = MetricsRegistry() if METRICS_ENABLED else None
+
+def get_metrics():
+    """The process-wide metrics registry, or None when metrics are disabled."""
+    return _metrics
+
+
+_startup = {}
+_startup_lock = threading.Lock()
+
+def startup_began(started, **attributes):
+    """Remember the perf_counter start of the first script run of the process; later runs are ignored."""
+    with _startup_lock:
+        _startup.setdefault("started", started)
+        _startup.setdefault("attributes", attributes)
+
+def record_startup():
+    """
+    Record the time from the first script run to the first fully rendered page as an "app_startup" span, once per
+    process. Runs cut short by a rerun in between are included. Returns the span, or None if already recorded.
+    """
+    with _startup_lock:
+        if "started" not in _startup or _startup.get("recorded"):
+            return None
+        _startup["recorded"] = True
+    span = Span("startup", "app_startup", _startup["attributes"])
+    span.duration = time.perf_counter() - _startup["started"]
+    if _metrics is not None:
+        _metrics.record(span)
+    return span
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics" or _metrics is None:
+            self.send_error(404)
+            return
+        body = _metrics.prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+def start_metrics_server(port=METRICS_PORT):
+    """Serve /metrics on port in a daemon thread, once per process. Returns the server or None when off."""
+    global _server
+    if not port or _metrics is None:
+        return None
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer(("", port), _MetricsHandler)
+            threading.Thread(target=_server.serve_forever, name="querybuddy-metrics", daemon=True).start()
+        return _server
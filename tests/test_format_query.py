@@ -0,0 +1,66 @@
+import pytest
+from Format_query import format_query
+
+
+def test_clauses_joins_and_conditions():
+    query = ("select id, Name from Orders o left join Customers c on o.cid = c.id and c.active "
+             "where o.total between 1 and 5 or o.status = 'open' order by o.id")
+    assert format_query(query) == (
+        "SELECT id,\n"
+        "    Name\n"
+        "FROM Orders o\n"
+        "LEFT JOIN Customers c ON o.cid = c.id\n"
+        "    AND c.active\n"
+        "WHERE o.total BETWEEN 1 AND 5\n"
+        "    OR o.status = 'open'\n"
+        "ORDER BY o.id"
+    )
+
+
+def test_subqueries_are_indented():
+    assert format_query("delete from t where id in (select id from u)") == (
+        "DELETE FROM t\n"
+        "WHERE id IN (\n"
+        "    SELECT id\n"
+        "    FROM u\n"
+        ")"
+    )
+
+
+def test_cte_and_quoted_identifiers():
+    assert format_query('with r as (select * from t) select "Mixed Col" from r where a is not null limit 5') == (
+        "WITH r AS (\n"
+        "    SELECT *\n"
+        "    FROM t\n"
+        ")\n"
+        'SELECT "Mixed Col"\n'
+        "FROM r\n"
+        "WHERE a IS NOT NULL\n"
+        "LIMIT 5"
+    )
+
+
+def test_literals_and_comments_are_kept():
+    formatted = format_query("select note from t where note = 'select x from y' -- from where\norder by 1")
+    assert "'select x from y' -- from where\n" in formatted
+    assert formatted.endswith("ORDER BY 1")
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("select extract(year from d) from t", "SELECT extract(year FROM d)\nFROM t"),
+    ("select * from t for update", "SELECT *\nFROM t FOR UPDATE"),
+    ("select a, count(*) from t group by rollup(a)", "SELECT a,\n    count(*)\nFROM t\nGROUP BY rollup(a)"),
+    ("select a from t union all select b from u", "SELECT a\nFROM t\nUNION ALL\nSELECT b\nFROM u"),
+])
+def test_words_that_do_not_start_a_clause(query, expected):
+    assert format_query(query) == expected
+
+
+@pytest.mark.parametrize("query", [
+    "select id, Name from Orders o join Customers c using (id) where a = 1 and b = 2",
+    "insert into t (a, b) values (1, 'x')",
+    "update t set a = 1 where b = 2",
+])
+def test_formatting_is_stable(query):
+    formatted = format_query(query)
+    assert format_query(formatted) == formatted
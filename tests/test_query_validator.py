@@ -0,0 +1,103 @@
+import pytest
+from sqlalchemy import create_engine, text
+from langchain_community.utilities.sql_database import SQLDatabase
+from query_validator import validate_mongo, validate_query, validate_sql
+
+COLUMNS = {"orders": {"id", "customer_id", "total"}, "customers": {"id", "name"}}
+
+
+@pytest.fixture
+def sqlite_db(tmp_path):
+    # SQLite stands in for a SQL server: validation only reads the reflected metadata and the inspector
+    engine = create_engine(f"sqlite:///{tmp_path / 'shop.db'}")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE orders (id INTEGER PRIMARY KEY, total REAL)"))
+        connection.execute(text("CREATE VIEW big_orders AS SELECT * FROM orders WHERE total > 100"))
+    return SQLDatabase(engine)
+
+
+def test_view_is_a_known_table(sqlite_db):
+    assert validate_query("postgresql", sqlite_db, "SELECT * FROM big_orders") == []
+    assert validate_query("postgresql", sqlite_db, "SELECT b.total FROM big_orders b") == []
+
+
+def test_unknown_table_is_reported_with_suggestion(sqlite_db):
+    problems = validate_query("postgresql", sqlite_db, "SELECT * FROM order")
+    assert problems == ["Table 'order' does not exist. Did you mean 'orders'?"]
+
+
+@pytest.mark.parametrize("query", [
+    "WITH recent AS (SELECT * FROM orders) SELECT * FROM recent",
+    "WITH recent (id, total) AS (SELECT id, total FROM orders) SELECT r.total FROM recent r",
+    "WITH RECURSIVE n AS MATERIALIZED (SELECT 1) SELECT * FROM n",
+    "SELECT t.total FROM (SELECT total FROM orders) AS t",
+])
+def test_cte_and_derived_table_names(query):
+    assert validate_sql(query, COLUMNS) == []
+
+
+def test_dual_on_mysql_only():
+    assert validate_sql("SELECT 1 FROM DUAL", COLUMNS, dialect="mysql") == []
+    assert validate_sql("SELECT 1 FROM dual", COLUMNS, dialect="postgresql") != []
+
+
+def test_unknown_tables_not_reported_when_object_list_incomplete():
+    assert validate_sql("SELECT * FROM somewhere_else", COLUMNS, complete=False) == []
+
+
+def test_columns_of_views_are_not_checked():
+    assert validate_sql("SELECT v.anything FROM v", {"v": None}) == []
+
+
+def test_unknown_qualified_column():
+    problems = validate_sql("SELECT o.totl FROM orders o", COLUMNS)
+    assert problems == ["Column 'totl' does not exist in table 'orders'. Did you mean 'total'?"]
+
+
+@pytest.mark.parametrize("query, problem", [
+    ("SELECT * FROM orders; DROP TABLE orders", "Only one SQL statement can be run at a time."),
+    ("SELECT (1", "The query has unbalanced parentheses."),
+    ("SELECT 'abc FROM orders", "The query contains an unterminated string or quoted identifier."),
+    ("hello orders", "The query must start with a SQL statement keyword, not 'hello'."),
+    ("SELECT x.id FROM orders o", "'x.id' refers to 'x', which is not a table or alias in the query."),
+])
+def test_sql_problems(query, problem):
+    assert validate_sql(query, COLUMNS) == [problem]
+
+
+@pytest.mark.parametrize("query", [
+    "SELECT * FROM orders;",
+    "SELECT * FROM public.orders",
+    "SELECT * FROM other_schema.anything",
+    "SELECT * FROM generate_series(1, 3)",
+    "SELECT o.id, c.name FROM orders o JOIN customers c ON c.id = o.customer_id",
+    "SELECT extract(year FROM o.total) FROM orders o",
+])
+def test_valid_sql(query):
+    assert validate_sql(query, COLUMNS, "public") == []
+
+
+MONGO_COLLECTIONS = ["orders", "customers"]
+
+
+@pytest.mark.parametrize("query, problem", [
+    ('db.order.find({})', "Collection 'order' does not exist. Did you mean 'orders'?"),
+    ('db.orders.aggregate([{"$lookup": {"from": "custs", "localField": "a", "foreignField": "b", "as": "c"}}])',
+     "$lookup reads from collection 'custs', which does not exist. Did you mean 'customers'?"),
+    ('db.orders.aggregate([{"$match": {}, "$limit": 1}])', "Pipeline stage 1 must be an object with a single $operator key."),
+    ('db.orders.aggregate({"$match": {}})', "aggregate() expects a list of pipeline stages."),
+    ('db.orders.find([1])', "find() expects a filter document as its first argument."),
+])
+def test_mongo_problems(query, problem):
+    assert validate_mongo(query, MONGO_COLLECTIONS) == [problem]
+
+
+def test_mongo_parse_error():
+    problems = validate_mongo('db.orders.find({"a": 1)', MONGO_COLLECTIONS)
+    assert len(problems) == 1 and problems[0].startswith("The query could not be parsed:")
+
+
+def test_valid_mongo():
+    assert validate_mongo('db.orders.find({"total": {"$gt": 1}})', MONGO_COLLECTIONS) == []
+    # Without sampled collections the name cannot be checked
+    assert validate_mongo("db.anything.find({})", []) == []
@@ -0,0 +1,47 @@
+import pytest
+from result_cache import is_read_only, is_read_only_mongo, sql_tables
+
+
+@pytest.mark.parametrize("query", [
+    "SELECT * FROM orders",
+    "select id from orders where note = 'insert into x' ;",
+    "WITH recent AS (SELECT * FROM orders) SELECT * FROM recent",
+    "SELECT o.updated_at, o.\"delete\" FROM orders o",
+    "EXPLAIN SELECT * FROM orders",
+    "SHOW TABLES",
+    "VALUES (1), (2)",
+    "SELECT * FROM orders -- then delete them",
+])
+def test_read_only(query):
+    assert is_read_only(query)
+
+
+@pytest.mark.parametrize("query", [
+    "INSERT INTO orders VALUES (1)",
+    "UPDATE orders SET total = 0",
+    "DELETE FROM orders",
+    "WITH gone AS (DELETE FROM orders RETURNING *) SELECT * FROM gone",
+    "WITH moved AS (UPDATE orders SET total = 0 RETURNING id) SELECT count(*) FROM moved",
+    "SELECT * INTO archive FROM orders",
+    "SELECT * FROM orders FOR UPDATE",
+    "SELECT * FROM orders FOR SHARE",
+    "SELECT * FROM orders FOR NO KEY UPDATE",
+    "SELECT * FROM orders LOCK IN SHARE MODE",
+    "EXPLAIN ANALYZE DELETE FROM orders",
+    "CREATE TABLE t AS SELECT 1",
+    "TRUNCATE orders",
+    "CALL refresh_orders()",
+    "",
+])
+def test_not_read_only(query):
+    assert not is_read_only(query)
+
+
+def test_mongo_writes():
+    assert is_read_only_mongo('db.orders.aggregate([{"$match": {"total": 1}}])')
+    assert not is_read_only_mongo('db.orders.aggregate([{"$match": {}}, {"$out": "archive"}])')
+    assert not is_read_only_mongo('db.orders.aggregate([{"$merge": {"into": "archive"}}])')
+
+
+def test_tables_of_a_writing_cte():
+    assert sql_tables("WITH gone AS (DELETE FROM public.orders RETURNING *) SELECT * FROM gone") == {"orders", "gone"}
@@ -0,0 +1,14 @@
+"""
+Approximate token counting for prompt budgeting.
+The Llama tokenizer is not available offline, so a characters-per-token estimate is used.
+"""
+
+# Rough average for English text and SQL DDL
+CHARS_PER_TOKEN = 4
+
+
+def count_tokens(text) -> int:
+    """Return the approximate number of tokens in text."""
+    if not text:
+        return 0
+    return (len(str(text)) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN